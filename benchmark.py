@@ -0,0 +1,248 @@
+"""
+Benchmarks for py-reevoo, run against a local StubReevooServer so they need no API keys and are repeatable. Each
+benchmark is run for every dataset size and concurrency level and reports requests per second, p50/p99 request latency
+and peak Python memory. Results are written as JSON so they can be compared between versions:
+
+    python benchmark.py --sizes 1000 10000 --concurrency 1 4 16 --output before.json
+    python benchmark.py --sizes 1000 10000 --concurrency 1 4 16 --baseline before.json
+
+With --baseline, any result whose requests per second dropped by more than --tolerance is reported and the script
+exits with status 1.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from pyreevoo import ReevooAPI, RequestHook
+from stub_server import StubDataset
+
+TRKREF = 'ABC'
+LOCALE = 'en-GB'
+
+
+def percentile(values, percent):
+    """
+    Returns the nearest-rank percentile of a list of numbers, or None if it is empty
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(int(round(percent / 100.0 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class LatencyRecorder(RequestHook):
+    """
+    RequestHook recording the latency of every request a client makes, in seconds
+    """
+
+    def __init__(self):
+        self.latencies = []
+
+    def after_request(self, event):
+        # list.append is atomic, so the worker threads can share the list
+        self.latencies.append(event.duration)
+
+
+def bench_date_range(reevoo, dataset, size, concurrency, strategy):
+    # the newest quarter of the reviews
+    end_date = dataset.newest_date
+    start_date = end_date - timedelta(days=dataset.days // 4)
+    reviews = reevoo.get_customer_experience_review_list_in_date_range(TRKREF, start_date=start_date.isoformat(),
+                                                                       end_date=end_date.isoformat(),
+                                                                       max_workers=concurrency, strategy=strategy)
+    return len(reviews)
+
+
+def bench_date_range_linear(reevoo, dataset, size, concurrency):
+    return bench_date_range(reevoo, dataset, size, concurrency, 'linear')
+
+
+def bench_date_range_bisect(reevoo, dataset, size, concurrency):
+    return bench_date_range(reevoo, dataset, size, concurrency, 'bisect')
+
+
+def bench_review_crawl(reevoo, dataset, size, concurrency):
+    return sum(1 for _ in reevoo.iter_reviews(TRKREF, LOCALE, per_page=100, prefetch=concurrency))
+
+
+def bench_batch_submission(reevoo, dataset, size, concurrency):
+    orders = [{'trkref': TRKREF, 'order_ref': 'ORDER%d' % index, 'email': 'purchaser%d@example.com' % index,
+               'first_name': 'Purchaser', 'order_date': '2017-03-01', 'order_items': [{'sku': 'SKU%05d' % index}]}
+              for index in range(size)]
+    if concurrency == 1:
+        reevoo.set_customer_order_batch_submission(orders).raise_for_status()
+    else:
+        batch_size = -(-size // concurrency)
+        results = reevoo.set_customer_order_batch_submission_chunked(orders, batch_size=batch_size,
+                                                                     max_workers=concurrency)
+        assert all(result.succeeded for result in results)
+    return size
+
+
+def bench_reviewable_detail(reevoo, dataset, size, concurrency):
+    skus = ['SKU%05d' % (index % dataset.sku_count) for index in range(size)]
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return sum(1 for _ in executor.map(lambda sku: reevoo.get_reviewable_detail(TRKREF, sku, locale=LOCALE), skus))
+
+
+BENCHMARKS = {
+    'date_range_linear': bench_date_range_linear,
+    'date_range_bisect': bench_date_range_bisect,
+    'review_crawl': bench_review_crawl,
+    'batch_submission': bench_batch_submission,
+    'reviewable_detail': bench_reviewable_detail,
+}
+
+
+class StubServerProcess:
+    """
+    Runs stub_server.py in a subprocess, so that its CPU time and memory aren't counted against the client
+    """
+
+    def __init__(self, dataset, latency=0):
+        self.dataset = dataset
+        self.latency = latency
+        self.process = None
+        self.uri = None
+
+    def __enter__(self):
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stub_server.py')
+        self.process = subprocess.Popen([sys.executable, script, '--port', '0',
+                                         '--review-count', str(self.dataset.review_count),
+                                         '--customer-experience-review-count',
+                                         str(self.dataset.customer_experience_review_count),
+                                         '--sku-count', str(self.dataset.sku_count),
+                                         '--latency', str(self.latency)],
+                                        stdout=subprocess.PIPE, universal_newlines=True)
+        # the server prints 'Serving the stub Reevoo API at <uri>' once it is listening
+        self.uri = self.process.stdout.readline().split()[-1]
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.process.terminate()
+        self.process.wait()
+        self.process.stdout.close()
+
+
+def run_once(name, dataset, size, concurrency, uri, trace_memory):
+    recorder = LatencyRecorder()
+    reevoo = ReevooAPI('key', 'secret', base_uri=uri, hooks=[recorder])
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    items = BENCHMARKS[name](reevoo, dataset, size, concurrency)
+    seconds = time.perf_counter() - started
+    peak_memory = None
+    if trace_memory:
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    reevoo.close()
+    return items, recorder.latencies, seconds, peak_memory
+
+
+def run_benchmark(name, size, concurrency, latency=0, repeat=1):
+    """
+    Run one benchmark against a fresh stub server and return its result. Timings come from the fastest of repeat runs
+    and peak memory from one more run with tracemalloc on, as tracing slows everything down.
+    :param name: A key of BENCHMARKS
+    :type name: str
+    :param size: The number of reviews in the dataset, orders submitted or reviewables fetched
+    :type size: int
+    :param concurrency: The number of concurrent requests (prefetched pages, worker threads or batches)
+    :type concurrency: int
+    :param latency: Seconds the stub server adds to every request (optional, defaults to 0)
+    :type latency: float
+    :param repeat: The number of timed runs (optional, defaults to 1)
+    :type repeat: int
+    """
+    dataset = StubDataset(review_count=size, customer_experience_review_count=size, sku_count=max(size // 10, 1))
+    with StubServerProcess(dataset, latency) as server:
+        runs = [run_once(name, dataset, size, concurrency, server.uri, False) for _ in range(repeat)]
+        items, latencies, seconds, _ = min(runs, key=lambda run: run[2])
+        peak_memory = run_once(name, dataset, size, concurrency, server.uri, True)[3]
+    return {
+        'benchmark': name,
+        'size': size,
+        'concurrency': concurrency,
+        'items': items,
+        'requests': len(latencies),
+        'seconds': round(seconds, 6),
+        'requests_per_second': round(len(latencies) / seconds, 2) if seconds else None,
+        'latency_p50_ms': round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+        'latency_p99_ms': round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+        'peak_memory_bytes': peak_memory,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns the results whose requests per second dropped by more than tolerance (a fraction) against the baseline
+    """
+    previous = dict(((result['benchmark'], result['size'], result['concurrency']), result)
+                    for result in baseline['results'])
+    regressions = []
+    for result in results:
+        before = previous.get((result['benchmark'], result['size'], result['concurrency']))
+        if before and before['requests_per_second'] and result['requests_per_second'] is not None:
+            change = result['requests_per_second'] / before['requests_per_second'] - 1
+            if change < -tolerance:
+                regressions.append(dict(result, baseline_requests_per_second=before['requests_per_second'],
+                                        change=round(change, 4)))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark py-reevoo against a local stub server')
+    parser.add_argument('--benchmarks', nargs='+', choices=sorted(BENCHMARKS), default=sorted(BENCHMARKS))
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000])
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 4, 16])
+    parser.add_argument('--latency', type=float, default=0.005, help='seconds added to every stub server request')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--output', help='write the results to this file instead of stdout')
+    parser.add_argument('--baseline', help='compare with the results in this file')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed drop in requests per second')
+    args = parser.parse_args()
+
+    results = []
+    for name in args.benchmarks:
+        for size in args.sizes:
+            for concurrency in args.concurrency:
+                result = run_benchmark(name, size, concurrency, args.latency, args.repeat)
+                sys.stderr.write('%(benchmark)s size=%(size)d concurrency=%(concurrency)d: %(requests)d requests, '
+                                 '%(requests_per_second)s req/s, p50 %(latency_p50_ms)s ms, '
+                                 'p99 %(latency_p99_ms)s ms, peak %(peak_memory_bytes)d bytes\n' % result)
+                results.append(result)
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'latency': args.latency,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline), args.tolerance)
+        for regression in regressions:
+            sys.stderr.write('REGRESSION %(benchmark)s size=%(size)d concurrency=%(concurrency)d: '
+                             '%(requests_per_second)s req/s (was %(baseline_requests_per_second)s)\n' % regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,153 @@
+import asyncio
 import json
+import os
+import queue
+import random
 import requests
-from operator import itemgetter
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import warnings
+import zlib
+from functools import lru_cache
+from array import array
+from bisect import bisect_left
+from itertools import compress, islice
+from operator import attrgetter, itemgetter
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
-from datetime import date, datetime, timedelta
+from requests.structures import CaseInsensitiveDict
+from collections import OrderedDict, deque, namedtuple
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+from datetime import date, datetime
+from email.utils import parsedate_to_datetime
+from urllib3.connection import HTTPConnection
+from urllib3.exceptions import NewConnectionError
+from urllib3.util.request import ACCEPT_ENCODING
+
+try:
+    import httpx
+except ImportError:
+    # httpx is only needed for AsyncReevooAPI
+    httpx = None
+
+try:
+    import h2
+except ImportError:
+    # h2 is only needed for HTTP/2, without it HTTP2Transport and AsyncReevooAPI(http2=True) use HTTP/1.1
+    h2 = None
+
+try:
+    import numpy
+except ImportError:
+    # numpy is optional, it is used to filter long lists of reviews by date
+    numpy = None
+
+try:
+    import pandas
+except ImportError:
+    # pandas is optional, it is only needed for reviews_to_dataframe()
+    pandas = None
+
+try:
+    import orjson
+except ImportError:
+    # orjson is optional, responses are decoded much faster with it
+    orjson = None
+
+REEVOO_API_URI = 'https://api.reevoocloud.com'
+
+# the function used to decode JSON responses, see set_json_backend()
+json_loads = orjson.loads if orjson is not None else json.loads
+
+# the value Record uses for a field which wasn't in the dict the record was made from
+UNSET = object()
+
+# the dates reviews can be filtered by
+DATE_TYPES = ('publish_date', 'delivery_date', 'purchase_date')
+
+# the ways ReevooAPI.get_customer_experience_review_list_in_date_range() can find the pages in a date range
+DATE_RANGE_STRATEGIES = ('linear', 'bisect')
+# returned by get_customer_experience_review_list_in_date_range() when it is given neither date
+DATE_RANGE_MISSING_DATES = ('Please provide at least one of: start_date, end_date. Otherwise use '
+                            'get_customer_experience_review_list()')
+
+# lists at least this long are filtered by date with NumPy (if it is installed)
+NUMPY_MIN_ITEMS = 1000
+
+# the columns exported by reviews_to_columns() and how each is stored: category columns are stored as integer codes
+COLUMN_TYPES = OrderedDict([
+    ('id', 'str'),
+    ('sku', 'category'),
+    ('branch_code', 'category'),
+    ('locale', 'category'),
+    ('overall_score', 'float'),
+    ('customer_service_score', 'float'),
+    ('helpful', 'float'),
+    ('unhelpful', 'float'),
+    ('publish_date', 'date'),
+    ('delivery_date', 'date'),
+    ('purchase_date', 'date'),
+])
+
+# a category column from reviews_to_columns(), codes index into categories and are -1 where the value is missing
+CategoricalColumn = namedtuple('CategoricalColumn', ['codes', 'categories'])
+
+# the maximum number of SKUs get_reviewable_list() accepts in one request
+MAX_SKUS_PER_REQUEST = 80
+
+# POST bodies sent with compress_uploads=True are gzipped at this level, bodies smaller than COMPRESS_MIN_SIZE bytes
+# aren't worth compressing and are sent as they are (unless they are streamed, as their size isn't known up front)
+COMPRESS_LEVEL = 6
+COMPRESS_MIN_SIZE = 1024
+
+# the (connect, read) timeouts of requests to the API in seconds
+DEFAULT_TIMEOUT = (10, 60)
+
+# GET requests getting these responses are retried, the first two also slow down the rate limiter
+THROTTLE_STATUS_CODES = (429, 503)
+RETRY_STATUS_CODES = (429, 503, 502, 504)
+RETRY_BACKOFF_BASE = 0.5
+RETRY_BACKOFF_MAX = 30
+
+# the result of submitting one batch with ReevooAPI.set_customer_order_batch_submission_chunked()
+BatchResult = namedtuple('BatchResult', ['index', 'size', 'succeeded', 'response', 'error', 'customer_orders'])
+
+# the upper bounds of the MetricsCollector histogram buckets, in seconds and bytes
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+RESPONSE_SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# the result of one crawl by OrganisationScheduler.run(), items is None if they were passed to on_items instead
+SyncResult = namedtuple('SyncResult', ['trkref', 'branch_code', 'kind', 'items', 'pages', 'error'])
+
+# the figures RatingIndex.get() returns for a SKU, recent_mean is None if there are no recent reviews
+RatingSummary = namedtuple('RatingSummary', ['count', 'mean', 'distribution', 'recent_count', 'recent_mean'])
+
+# a helpful/unhelpful vote queued by VoteDispatcher.vote()
+Vote = namedtuple('Vote', ['user_id', 'target_type', 'target_id', 'direction', 'trkref'])
+
+# the ReevooAPI method sending each (target_type, direction) of vote
+VOTE_METHODS = {
+    ('review', 'up'): 'set_review_upvote_review',
+    ('review', 'down'): 'set_review_downvote_review',
+    ('question', 'up'): 'set_conversation_upvote_question',
+    ('question', 'down'): 'set_conversation_downvote_question',
+    ('answer', 'up'): 'set_conversation_upvote_answer',
+    ('answer', 'down'): 'set_conversation_downvote_answer',
+}
+
+# the placeholder for the path segment following each collection in a route template
+ROUTE_PLACEHOLDERS = {
+    'organisations': '{trkref}',
+    'reviews': '{review_id}',
+    'customer_experience_reviews': '{review_id}',
+    'conversations': '{conversation_id}',
+    'conversation_answers': '{answer_id}',
+    'purchasers': '{email}',
+}
 
 
 class ReevooAPI:
@@ -12,22 +157,94 @@ class ReevooAPI:
     Further documentation can be found at the GitHub repo for py-reevoo (https://github.com/phoebe-bee/py-reevoo).
     """
 
-    def __init__(self, api_key=None, api_secret=None):
+    def __init__(self, api_key=None, api_secret=None, cache=None, rate_limiter=None, max_retries=3,
+                 coalesce_requests=False, base_uri=REEVOO_API_URI, hooks=None, transport=None,
+                 timeout=DEFAULT_TIMEOUT, http2=False, compress_uploads=False):
         """
-        Set the API URI (constant) and set the credentials to query the API
+        Set the API URI and set the credentials to query the API
         :param api_key:time
         :type api_key: str
         :param api_secret:
         :type api_secret: str
+        :param cache: Cache for GET responses (optional, defaults to None which disables caching)
+        :type cache: ResponseCache
+        :param rate_limiter: Limits the rate of requests, can be shared between clients (optional, defaults to None)
+        :type rate_limiter: RateLimiter
+        :param max_retries: The number of times a throttled or failed GET request is retried (optional, defaults to 3)
+        :type max_retries: int
+        :param coalesce_requests: Share one request between threads making the same GET request at the same time
+                                  (optional, defaults to False)
+        :type coalesce_requests: bool
+        :param base_uri: The URI of the API, e.g. to use a local StubReevooServer (optional, defaults to
+                         REEVOO_API_URI)
+        :type base_uri: str
+        :param hooks: RequestHooks called before and after every request, e.g. a MetricsCollector (optional, defaults
+                      to None)
+        :type hooks: list
+        :param transport: The connection pool to send requests through, can be shared by clients with different
+                          credentials (optional, defaults to a new Transport for this client)
+        :type transport: Transport
+        :param timeout: Seconds to wait for a connection and for the response, as a (connect, read) tuple or one
+                        number for both, None waits forever (optional, defaults to DEFAULT_TIMEOUT)
+        :type timeout: tuple | float
+        :param http2: If no transport is given, create an HTTP2Transport so that concurrent requests share one
+                      multiplexed connection. Falls back to HTTP/1.1 if httpx or h2 isn't installed or the server
+                      doesn't support HTTP/2 (optional, defaults to False)
+        :type http2: bool
+        :param compress_uploads: Gzip the JSON bodies of POST requests (sent with Content-Encoding: gzip), which cuts
+                                 the size of large submissions such as customer order batches several times over
+                                 (optional, defaults to False)
+        :type compress_uploads: bool
         """
-        self.__URI = 'https://api.reevoocloud.com'
+        self.__URI = base_uri.rstrip('/')
         self.__api_key = api_key
         self.__api_secret = api_secret
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.coalesce_requests = coalesce_requests
+        self.hooks = list(hooks or [])
+        self.__requests_in_flight = RequestCoalescer()
 
-        # create Auth object to attach to all requests made to the API
-        auth = HTTPBasicAuth(self.__api_key, self.__api_secret)
-        self.session = requests.Session()
-        self.session.auth = auth
+        self.timeout = timeout
+        self.compress_uploads = compress_uploads
+
+        # create Auth object to attach to all requests made to the API, it is sent with each request rather than set on
+        # the session so that a transport can be shared between clients with different credentials
+        self.__auth = HTTPBasicAuth(self.__api_key, self.__api_secret)
+        self._owns_transport = transport is None
+        if transport is None:
+            transport = self._create_transport(http2)
+        self.transport = transport
+        if self._owns_transport and isinstance(self.transport, Transport):
+            # the client's own session carries its credentials too, as it always has, so code sending requests with
+            # reevoo.session directly is still authenticated
+            self.transport.session.auth = self.__auth
+
+    @property
+    def session(self):
+        """
+        The requests.Session of the client's own Transport, with the client's credentials set on it. Deprecated for a
+        shared transport, or one which isn't a Transport (HTTP2Transport and AsyncTransport have an httpx client), as
+        that session doesn't carry the client's credentials: use reevoo.transport instead.
+        """
+        if not (self._owns_transport and isinstance(self.transport, Transport)):
+            warnings.warn('reevoo.session has no credentials with a shared or httpx transport, use reevoo.transport '
+                          'instead', DeprecationWarning, stacklevel=2)
+        return self.transport.session
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Close the connections of the client's transport, a transport passed in to share with other clients is left open
+        """
+        if self._owns_transport:
+            self.transport.close()
 
     def verify_api_keys(self):
         """
@@ -46,7 +263,7 @@ class ReevooAPI:
         Returns a list of all organisations associated with the given API key
         """
         path = '/v4/organisations'
-        response = self.__make_request(path, 'GET')
+        response = self._make_request(path, 'GET')
         return response
 
     def get_organisation_detail(self, trkref, branch_code=''):
@@ -58,7 +275,7 @@ class ReevooAPI:
         :type branch_code: str
         """
         path = '/v4/organisations/%s?branch_code=%s' % (trkref, branch_code)
-        response = self.__make_request(path, 'GET')
+        response = self._make_request(path, 'GET')
         return response
 
     def get_reviewable_list(self, trkref, branch_code='', short_format=False, skus=None):
@@ -71,7 +288,8 @@ class ReevooAPI:
         :type branch_code: str
         :param short_format: Return the short format of the list (optional, defaults to False)
         :type short_format: bool
-        :param skus: The list of SKUs to find (optional, max length 80, defaults to None)
+        :param skus: The list of SKUs to find (optional, max length 80, defaults to None). Use get_reviewables_by_sku()
+                     for longer lists.
         :type skus: list
         """
         if skus:
@@ -82,7 +300,7 @@ class ReevooAPI:
             path = '/v4/organisations/%s/reviewables?branch_code=%s&format=short' % (trkref, branch_code)
         else:
             path = '/v4/organisations/%s/reviewables?branch_code=%s&skus=%s' % (trkref, branch_code, skus_string)
-        response = self.__make_request(path, 'GET')
+        response = self._make_request(path, 'GET')
         return response
 
     def get_reviewable_detail(self, trkref, sku='', branch_code='', locale='', short_format=False):
@@ -105,7 +323,7 @@ class ReevooAPI:
         else:
             path = '/v4/organisations/%s/reviewable?branch_code=%s&locale=%s&sku=%s' % \
                    (trkref, branch_code, locale, sku)
-        response = self.__make_request(path, 'GET')
+        response = self._make_request(path, 'GET')
         return response
 
     def get_review_list(self, trkref, locale, branch_code='', sku='', region='', page=1, per_page=15,
@@ -151,7 +369,7 @@ class ReevooAPI:
             auto_str = dict_to_url_args(automotive_options)
             path += '&'
             path += auto_str
-        response = self.__make_request(path, 'GET')
+        response = self._make_request(path, 'GET')
         return response
 
     def get_review_detail(self, trkref, review_id, branch_code='', locale=''):
@@ -167,7 +385,7 @@ class ReevooAPI:
         :type locale: str
         """
         path = '/v4/reviews/%s?trkref=%s&branch_code=%s&locale=%s' % (review_id, trkref, branch_code, locale)
-        response = self.__make_request(path, 'GET')
+        response = self._make_request(path, 'GET')
         return response
 
     def set_review_upvote_review(self, review_id, trkref=''):
@@ -181,7 +399,7 @@ class ReevooAPI:
         :type trkref: str (optional, defaults to None)
         """
         path = '/v4/reviews/%s/increment_helpful?trkref=%s' % (review_id, trkref)
-        response = self.__make_request(path, 'POST')
+        response = self._make_request(path, 'POST')
         return response
 
     def set_review_downvote_review(self, review_id, trkref=''):
@@ -195,7 +413,7 @@ class ReevooAPI:
         :type trkref: str (optional, defaults to None)
         """
         path = '/v4/reviews/%s/increment_unhelpful?trkref=%s' % (review_id, trkref)
-        response = self.__make_request(path, 'POST')
+        response = self._make_request(path, 'POST')
         return response
 
     def get_customer_experience_review_list(self, trkref, branch_code='', older_reviews=False, page=1, per_page=15):
@@ -218,7 +436,7 @@ class ReevooAPI:
             older_reviews_str = 'true'
         path = '/v4/organisations/%s/customer_experience_reviews?branch_code=%s&older_reviews=%s&page=%d&per_page=%d' % \
                (trkref, branch_code, older_reviews_str, page, per_page)
-        response = self.__make_request(path, 'GET')
+        response = self._make_request(path, 'GET')
         return response
 
     def get_customer_experience_review_detail(self, review_id, trkref='', branch_code=''):
@@ -232,7 +450,7 @@ class ReevooAPI:
         :type branch_code: str
         """
         path = '/v4/customer_experience_reviews/%s?trkref=%s&branch_code=%s' % (review_id, trkref, branch_code)
-        response = self.__make_request(path, 'GET')
+        response = self._make_request(path, 'GET')
         return response
 
     def get_conversation_list(self, trkref, locale='', sku=''):
@@ -246,7 +464,7 @@ class ReevooAPI:
         :type sku: str
         """
         path = '/v4/organisations/%s/conversations?locale=%s&sku=%s' % (trkref, locale, sku)
-        response = self.__make_request(path, 'GET')
+        response = self._make_request(path, 'GET')
         return response
 
     def get_conversation_detail(self, trkref, conversation_id):
@@ -258,7 +476,7 @@ class ReevooAPI:
         :type conversation_id: str
         """
         path = '/v4/conversations/%s?trkref=%s' % (conversation_id, trkref)
-        response = self.__make_request(path, 'GET')
+        response = self._make_request(path, 'GET')
         return response
 
     def set_conversation_create(self, trkref, conversation_data):
@@ -270,7 +488,7 @@ class ReevooAPI:
         :type conversation_data: dict
         """
         path = '/v4/organisations/%s/conversations' % (trkref,)
-        response = self.__make_request(path, 'POST', conversation_data)
+        response = self._make_request(path, 'POST', conversation_data)
         return response
 
     def set_conversation_upvote_question(self, trkref, question_id):
@@ -284,7 +502,7 @@ class ReevooAPI:
         :type question_id: str
         """
         path = '/v4/conversations/%s/increment_helpful?trkref=%s' % (question_id, trkref)
-        response = self.__make_request(path, 'POST')
+        response = self._make_request(path, 'POST')
         return response
 
     def set_conversation_downvote_question(self, trkref, question_id):
@@ -298,7 +516,7 @@ class ReevooAPI:
         :type question_id: str
         """
         path = '/v4/conversations/%s/increment_unhelpful?trkref=%s' % (question_id, trkref)
-        response = self.__make_request(path, 'POST')
+        response = self._make_request(path, 'POST')
         return response
 
     def set_conversation_upvote_answer(self, trkref, answer_id):
@@ -312,7 +530,7 @@ class ReevooAPI:
         :type answer_id: str
         """
         path = '/v4/conversation_answers/%s/increment_helpful?trkref=%s' % (answer_id, trkref)
-        response = self.__make_request(path, 'POST')
+        response = self._make_request(path, 'POST')
         return response
 
     def set_conversation_downvote_answer(self, trkref, answer_id):
@@ -326,7 +544,7 @@ class ReevooAPI:
         :type answer_id: str
         """
         path = '/v4/conversation_answers/%s/increment_unhelpful?trkref=%s' % (answer_id, trkref)
-        response = self.__make_request(path, 'POST')
+        response = self._make_request(path, 'POST')
         return response
 
     def set_customer_order_single_submission(self, trkref, customer_order_data):
@@ -339,7 +557,7 @@ class ReevooAPI:
         :type customer_order_data: dict
         """
         path = '/v4/organisations/%s/customer_order' % (trkref,)
-        response = self.__make_request(path, 'POST', customer_order_data)
+        response = self._make_request(path, 'POST', customer_order_data)
         return response
 
     def set_customer_order_batch_submission(self, customer_order_batch_data):
@@ -350,7 +568,7 @@ class ReevooAPI:
         :type customer_order_batch_data: list
         """
         path = '/v4/customer_orders'
-        response = self.__make_request(path, 'POST', customer_order_batch_data)
+        response = self._make_request(path, 'POST', customer_order_batch_data)
         return response
 
     def get_purchaser_detail(self, trkref, email):
@@ -362,7 +580,7 @@ class ReevooAPI:
         :type email: str
         """
         path = '/v4/organisations/%s/purchasers/%s' % (trkref, email)
-        response = self.__make_request(path, 'GET')
+        response = self._make_request(path, 'GET')
         return response
 
     def set_purchaser_create(self, trkref, purchaser_data):
@@ -375,7 +593,7 @@ class ReevooAPI:
         :type purchaser_data: dict
         """
         path = '/v4/organisations/%s/purchasers' % (trkref,)
-        response = self.__make_request(path, 'POST', purchaser_data)
+        response = self._make_request(path, 'POST', purchaser_data)
         return response
 
     def set_purchaser_update(self, trkref, email, purchaser_data):
@@ -389,7 +607,7 @@ class ReevooAPI:
         :type purchaser_data: dict
         """
         path = '/v4/organisations/%s/purchasers/%s' % (trkref, email)
-        response = self.__make_request(path, 'POST', purchaser_data)
+        response = self._make_request(path, 'POST', purchaser_data)
         return response
 
     def get_purchaser_list(self, trkref, email):
@@ -401,7 +619,7 @@ class ReevooAPI:
         :type email: str
         """
         path = '/v4/organisations/%s/purchasers/%s/purchases' % (trkref, email)
-        response = self.__make_request(path, 'GET')
+        response = self._make_request(path, 'GET')
         return response
 
     def get_purchaser_match(self, trkref, email, purchases):
@@ -417,7 +635,7 @@ class ReevooAPI:
         :type purchases: list
         """
         path = '/v4/organisations/%s/purchasers/%s/purchases/match' % (trkref, email)
-        response = self.__make_request(path, 'POST', purchases)
+        response = self._make_request(path, 'POST', purchases)
         return response
 
     def get_questionnaire_detail(self, trkref, email, sku, order_ref, first_name='', redirect=False):
@@ -441,15 +659,177 @@ class ReevooAPI:
             redirect_str = 'true'
         path = '/v4/organisations/%s/questionnaire?email=%s&sku=%s&order_ref=%s&first_name=%s&redirect=%s' % \
                (trkref, email, sku, order_ref, first_name, redirect_str)
-        response = self.__make_request(path, 'GET')
+        response = self._make_request(path, 'GET')
         return response
 
     ################################################################################################################
     ####                                           END OF API METHODS                                           ####
     ################################################################################################################
 
+    def iter_reviews(self, trkref, locale, branch_code='', sku='', region='', per_page=30, automotive_options=None,
+                     prefetch=1, as_records=False):
+        """
+        Yields every published review for an organisation one at a time, fetching the pages as they are needed. The
+        next `prefetch` pages are fetched in the background while the current page is being read, so at most
+        prefetch + 1 pages are held in memory. Stopping early means the remaining pages are never fetched.
+        See get_review_list() for the parameters.
+        :param trkref: The three-character identifier for the organisation
+        :type trkref: str
+        :param locale: The locale (e.g. en-GB)
+        :type locale: str
+        :param branch_code: The identifier for a branch of the organisation (optional, defaults to None)
+        :type branch_code: str
+        :param sku: The SKU to find (optional, defaults to None)
+        :type sku: str
+        :param region: 'my-locale', 'my-country', 'my-languages', 'english' or 'worldwide'
+        :type region: str
+        :param per_page: The number of results to fetch per page (optional, defaults to 30)
+        :type per_page: int
+        :param automotive_options: Options for organisations with automotive reviewables
+        :type automotive_options: dict
+        :param prefetch: The number of pages to fetch ahead in the background (optional, defaults to 1, 0 to disable)
+        :type prefetch: int
+        :param as_records: Yield Review records instead of dicts (optional, defaults to False)
+        :type as_records: bool
+        """
+        def fetch_page(page_number):
+            return self.get_review_list(trkref, locale, branch_code, sku, region, page_number, per_page,
+                                        automotive_options)
+        return self.__iter_pages(fetch_page, 'reviews', prefetch, Review if as_records else None)
+
+    def iter_customer_experience_reviews(self, trkref, branch_code='', older_reviews=False, per_page=30, prefetch=1,
+                                         as_records=False):
+        """
+        Yields every customer experience review for an organisation one at a time, fetching the pages as they are
+        needed. Works the same way as iter_reviews(), see get_customer_experience_review_list() for the parameters.
+        :param trkref: The three-character identifier for the organisation
+        :type trkref: str
+        :param branch_code: The identifier for a branch of the organisation (optional, defaults to None)
+        :type branch_code: str
+        :param older_reviews: Retrieves all reviews if True, otherwise retrieves only reviews within a certain window
+                                (optional, defaults to False)
+        :type older_reviews: bool
+        :param per_page: The number of results to fetch per page (min 15, max 30, optional, defaults to 30)
+        :type per_page: int
+        :param prefetch: The number of pages to fetch ahead in the background (optional, defaults to 1, 0 to disable)
+        :type prefetch: int
+        :param as_records: Yield CustomerExperienceReview records instead of dicts (optional, defaults to False)
+        :type as_records: bool
+        """
+        def fetch_page(page_number):
+            return self.get_customer_experience_review_list(trkref, branch_code, older_reviews, page_number, per_page)
+        return self.__iter_pages(fetch_page, 'customer_experience_reviews', prefetch,
+                                 CustomerExperienceReview if as_records else None)
+
+    def __iter_pages(self, fetch_page, items_key, prefetch, record_class=None):
+        """
+        Generator yielding the items from every page of a paginated endpoint
+        :param fetch_page: Function taking a page number and returning the response for that page
+        :type fetch_page: function
+        :param items_key: The key of the list of items in the response content
+        :type items_key: str
+        :param prefetch: The number of pages to fetch ahead in the background
+        :type prefetch: int
+        :param record_class: The Record class to convert the items to, they are yielded as dicts if None
+        :type record_class: type
+        """
+        def fetch_content(page_number):
+            return get_page_content(fetch_page(page_number))
+
+        content = fetch_content(1)
+        total_pages = content.total_pages()
+        next_page = 2
+        pending = deque()
+        executor = ThreadPoolExecutor(max_workers=prefetch) if prefetch else None
+        try:
+            while True:
+                while executor and next_page <= total_pages and len(pending) < prefetch:
+                    pending.append(executor.submit(fetch_content, next_page))
+                    next_page += 1
+                items = content.data.get(items_key, [])
+                # drop the reference to the page so only the items still to be yielded are kept in memory
+                content = None
+                for item in items:
+                    yield record_class.from_dict(item) if record_class else item
+                if pending:
+                    content = pending.popleft().result()
+                elif next_page <= total_pages:
+                    content = fetch_content(next_page)
+                    next_page += 1
+                else:
+                    return
+        finally:
+            # the generator was closed early (or failed), don't wait for pages which will never be read
+            for future in pending:
+                future.cancel()
+            if executor:
+                executor.shutdown(wait=False)
+
+    def get_reviewables_by_sku(self, trkref, skus, branch_code='', max_workers=4):
+        """
+        Returns a dict mapping each SKU to its reviewable for any number of SKUs. The SKUs are split into chunks of at
+        most MAX_SKUS_PER_REQUEST, which are fetched concurrently with get_reviewable_list(). SKUs which have no
+        reviewable are left out. Raises requests.HTTPError if any of the requests fails.
+        :param trkref: The three-character identifier for the organisation
+        :type trkref: str
+        :param skus: The SKUs to find
+        :type skus: list
+        :param branch_code: The identifier for a branch of the organisation (optional, defaults to None)
+        :type branch_code: str
+        :param max_workers: The number of chunks to fetch at once (optional, defaults to 4)
+        :type max_workers: int
+        """
+        def fetch_chunk(sku_chunk):
+            response = self.get_reviewable_list(trkref, branch_code, skus=sku_chunk)
+            return get_page_content(response).reviewables()
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return merge_reviewables(executor.map(fetch_chunk, get_sku_chunks(skus)))
+
+    def set_customer_order_batch_submission_chunked(self, customer_orders, batch_size=500, max_workers=4):
+        """
+        Submit any number of customer orders by splitting them into batches of batch_size and submitting the batches
+        concurrently with set_customer_order_batch_submission(). The orders can be any iterable (e.g. a generator
+        reading an export file), only the batches being submitted are held in memory and each batch is serialised to
+        JSON while it is being sent.
+        Returns a list of BatchResult tuples (index, size, succeeded, response, error, customer_orders) in batch order.
+        customer_orders is only kept for batches which failed, so they can be resubmitted without sending the rest:
+            failed_orders = [order for result in results if not result.succeeded for order in result.customer_orders]
+        :param customer_orders: The customer orders, see set_customer_order_batch_submission()
+        :type customer_orders: iterable
+        :param batch_size: The number of orders in each batch (optional, defaults to 500)
+        :type batch_size: int
+        :param max_workers: The number of batches to submit at once (optional, defaults to 4)
+        :type max_workers: int
+        """
+        path = '/v4/customer_orders'
+
+        def submit(customer_order_batch):
+            return self._make_request(path, 'POST', customer_order_batch, stream=True)
+
+        def get_result(future, index, customer_order_batch):
+            try:
+                return get_batch_result(index, customer_order_batch, response=future.result())
+            except Exception as e:
+                return get_batch_result(index, customer_order_batch, error=e)
+
+        results = []
+        pending = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for index, customer_order_batch in enumerate(iter_batches(customer_orders, batch_size)):
+                pending[executor.submit(submit, customer_order_batch)] = (index, customer_order_batch)
+                # keep a bounded number of batches queued so a huge iterable isn't read into memory all at once
+                if len(pending) >= max_workers * 2:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        results.append(get_result(future, *pending.pop(future)))
+            for future in as_completed(pending):
+                results.append(get_result(future, *pending[future]))
+        return sorted(results, key=attrgetter('index'))
+
     def get_customer_experience_review_list_in_date_range(self, trkref, branch_code='', date_type='publish_date',
-                                                          start_date=None, end_date=None):
+                                                          start_date=None, end_date=None, max_workers=1,
+                                                          strategy='linear', as_records=False):
         """
         EXPERIMENTAL - Returns a list of customer experience reviews from within a date time range. API does not support
         this, so depending on the size of the date range might be a bit heavy in terms of processing.
@@ -464,128 +844,3670 @@ class ReevooAPI:
         :type start_date: str
         :param end_date: date string formatted YYYY-MM-DD
         :type end_date: str
+        :param max_workers: The number of pages to fetch concurrently (optional, defaults to 1). Pages are still merged
+                            in order and the walk still stops at the first page with reviews outside the date range, at
+                            most max_workers - 1 pages past it will have been fetched.
+        :type max_workers: int
+        :param strategy: 'linear' walks the pages until the dates run out, 'bisect' binary searches the pages (which are
+                         ordered newest first) for the first and last pages overlapping the date range and only fetches
+                         those, which is much quicker for narrow date ranges. The pages are only ordered by publish
+                         date, so other date types always use 'linear' (optional, defaults to 'linear')
+        :type strategy: str
+        :param as_records: Return CustomerExperienceReview records instead of dicts (optional, defaults to False)
+        :type as_records: bool
         """
+        if start_date is None and end_date is None:
+            return DATE_RANGE_MISSING_DATES
+        walk = DateRangeWalk(date_type, start_date, end_date, strategy)
 
-        # find the number of pages in total
+        # find the number of pages in total, page one is kept so that it isn't fetched twice
         page_one = self.get_customer_experience_review_list(trkref, branch_code, older_reviews=True, page=1,
                                                             per_page=30)
-        content = json.loads(page_one.text.replace('\r\n', ''))
-        number_of_pages = content['summary']['pagination']['total_pages']
+        content = get_page_content(page_one)
 
-        if start_date is None and end_date is None:
-            return "Please provide at least one of: start_date, end_date. Otherwise use get_customer_experience_review_list()"
-        else:
-            list_of_all_reviews_in_date = []
-            if start_date:
-                start_date = datetime.strptime(start_date, '%Y-%m-%d')
-            if end_date:
-                end_date = datetime.strptime(end_date, '%Y-%m-%d')
-            if (start_date and end_date) or start_date:
-                # Go through pages from beginning, add reviews within date to list, then return
-                current_page = 1
-                while current_page <= number_of_pages:
-                    page = self.get_customer_experience_review_list(trkref, branch_code, older_reviews=True,
-                                                                    page=current_page, per_page=30)
-                    customer_experience_reviews = json.loads(page.text.replace('\r\n', ''))['customer_experience_reviews']
-                    reviews_in_date_from_page = get_items_in_date_range(customer_experience_reviews, date_type, start_date,
-                                                                        end_date)
-                    list_of_all_reviews_in_date += reviews_in_date_from_page
-                    if len(reviews_in_date_from_page) < 30:
-                        # original request returns 30 reviews per page so if reviews_from_page has fewer than that, then
-                        # it has reached the end of the list of reviews in date and has therefore finished processing
-                        return list_of_all_reviews_in_date
-                    else:
-                        current_page += 1
-            elif end_date:
-                # Go through pages from end, add reviews within date to list, sort, then return
-                current_page = number_of_pages
-                while current_page >= 1:
-                    page = self.get_customer_experience_review_list(trkref, branch_code, older_reviews=True,
-                                                                    page=current_page, per_page=30)
-                    customer_experience_reviews = json.loads(page.text.replace('\r\n', ''))[
-                        'customer_experience_reviews']
-                    reviews_in_date_from_page = get_items_in_date_range(customer_experience_reviews, date_type,
-                                                                        start_date, end_date)
-                    list_of_all_reviews_in_date += reviews_in_date_from_page
-                    if len(reviews_in_date_from_page) < 30:
-                        # original request returns 30 reviews per page so if reviews_from_page has fewer than that, then
-                        # it has reached the end of the list of reviews in date and has therefore finished processing
-                        list_of_all_reviews_in_date = sorted(list_of_all_reviews_in_date,
-                                                             key=itemgetter('publish_date'))
-                        return list_of_all_reviews_in_date
-                    else:
-                        current_page -= 1
-                pass
-            return list_of_all_reviews_in_date
+        def fetch_page(page_number):
+            if page_number == 1:
+                customer_experience_reviews = content.customer_experience_reviews()
+            else:
+                page = self.get_customer_experience_review_list(trkref, branch_code, older_reviews=True,
+                                                                page=page_number, per_page=30)
+                customer_experience_reviews = get_page_content(page).customer_experience_reviews()
+            if as_records:
+                return CustomerExperienceReview.from_list(customer_experience_reviews)
+            return customer_experience_reviews
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for page_numbers in walk.iter_page_windows(content.total_pages(), max_workers):
+                walk.add_pages(page_numbers, executor.map(fetch_page, page_numbers))
+        return walk.get_results()
+
+    def _make_request(self, path, method, data=None, stream=False):
+        """
+        Make the request to the API, returns the response. Every get_*/set_* method sends its request through here, so
+        a subclass can override it to change how requests are made (AsyncReevooAPI overrides it with a coroutine). GET
+        requests are served from the cache if there is one. The hooks are called before and after the request with a
+        RequestEvent describing it.
+        :param path: The URI path
+        :type path: str
+        :param method: GET | POST
+        :type method: str
+        :param data: Extra data to pass in POST requests (will be converted to JSON but should be passed as a dict)
+        :param stream: Serialise data to JSON in chunks while it is being sent instead of all at once
+        :type stream: bool
+        :return response:
+        """
+        with hook_request(self.hooks, method, path, data) as event:
+            response = self.__dispatch_request(path, method, data, stream, event)
+            if event is not None:
+                event.response = response
+        return response
+
+    def _create_transport(self, http2=False):
+        """
+        Returns the transport for a client which wasn't given one, an HTTP2Transport if http2 is set and httpx is
+        installed, otherwise a Transport. Subclasses override it to send requests through another kind of transport.
+        :param http2: Use HTTP/2 if httpx is installed
+        :type http2: bool
+        """
+        if http2 and httpx is not None:
+            return HTTP2Transport()
+        return Transport()
+
+    def _get_cache_key(self, path):
+        """
+        Returns the key of a GET request in the cache. It includes the API URI and key, so a cache can be shared by
+        clients with different credentials, and by ReevooAPI and AsyncReevooAPI clients.
+        :param path: The URI path
+        :type path: str
+        """
+        return self.__URI, self.__api_key, path
+
+    def _get_request_arguments(self, path, method, data=None, headers=None, stream=False):
+        """
+        Returns the URI and the keyword arguments (data, headers, auth and timeout) to pass to the transport's request()
+        for a single request
+        :param path: The URI path
+        :type path: str
+        :param method: GET | POST
+        :type method: str
+        :param data: Extra data to pass in POST requests (will be converted to JSON but should be passed as a dict)
+        :param headers: Extra headers to send with the request
+        :type headers: dict
+        :param stream: Serialise data to JSON in chunks while it is being sent (sent with chunked transfer encoding)
+        :type stream: bool
+        """
+        kwargs = {'headers': headers, 'auth': self.__auth, 'timeout': self.timeout}
+        if method == 'POST' and data:
+            if stream:
+                json_data = iter_json_chunks(data)
+                if self.compress_uploads:
+                    json_data = iter_gzip_chunks(json_data)
+                    headers = dict(headers or {}, **{'Content-Encoding': 'gzip'})
+            else:
+                json_data, headers = encode_json_body(data, headers, self.compress_uploads)
+            kwargs.update(data=json_data, headers=headers)
+        return self.__URI + path, kwargs
 
-    def __make_request(self, path, method, data=None):
+    def __dispatch_request(self, path, method, data=None, stream=False, event=None):
         """
-        Make the request to the API, returns the response
+        Send the request through request coalescing and the cache if they are enabled, returns the response
         :param path: The URI path
         :type path: str
         :param method: GET | POST
         :type method: str
         :param data: Extra data to pass in POST requests (will be converted to JSON but should be passed as a dict)
+        :param stream: Serialise data to JSON in chunks while it is being sent instead of all at once
+        :type stream: bool
+        :param event: The RequestEvent to record the retries, cache result and response size in (optional)
+        :type event: RequestEvent
+        :return response:
+        """
+        if method == 'GET' and self.coalesce_requests:
+            return self.__make_coalesced_request(path, event)
+        if method == 'GET' and self.cache is not None:
+            return self.__make_cached_request(path, event)
+        return self.__send_request(path, method, data, stream=stream, event=event)
+
+    def __make_coalesced_request(self, path, event=None):
+        """
+        Make a GET request, or wait for the same request if another thread is already making it and return its
+        response, so that threads asking for the same path at the same moment only make one request between them
+        :param path: The URI path
+        :type path: str
+        :param event: The RequestEvent to record the request in (optional)
+        :type event: RequestEvent
         :return response:
         """
-        response = None
-        uri_and_path = self.__URI + path
-        if method == 'GET':
-            response = self.session.get(uri_and_path)
-        elif method == 'POST':
-            if data:
-                json_data = json.dumps(data)
-                response = self.session.post(uri_and_path, json_data)
+        future, is_leader = self.__requests_in_flight.join(path)
+        if not is_leader:
+            if event is not None:
+                event.cache_result = 'coalesced'
+            # a copy, so the threads don't share the decoded content of one response
+            return copy_response(future.result())
+        try:
+            if self.cache is not None:
+                response = self.__make_cached_request(path, event)
             else:
-                response = self.session.post(uri_and_path)
+                response = self.__send_request(path, 'GET', event=event)
+        except BaseException as e:
+            self.__requests_in_flight.finish(path, error=e)
+            raise
+        self.__requests_in_flight.finish(path, response)
         return response
 
+    def __make_cached_request(self, path, event=None):
+        """
+        Make a GET request through the cache. Fresh responses are returned straight from the cache, expired responses
+        with an ETag or Last-Modified header are revalidated with a conditional request.
+        :param path: The URI path
+        :type path: str
+        :param event: The RequestEvent to record the cache result in (optional)
+        :type event: RequestEvent
+        :return response:
+        """
+        ttl = self.cache.get_ttl(path)
+        if not ttl:
+            return self.__send_request(path, 'GET', event=event)
+        key = self._get_cache_key(path)
+        response, cached_response, headers = check_response_cache(self.cache, key, event)
+        if response is not None:
+            return response
+        response = self.__send_request(path, 'GET', headers=headers, event=event)
+        return update_response_cache(self.cache, key, ttl, response, cached_response, event)
 
-def dict_to_url_args(args):
+    def __send_request(self, path, method, data=None, headers=None, stream=False, event=None):
+        """
+        Send the request to the API, returns the response. Requests wait for the rate limiter if there is one and
+        failed GET requests are retried, see get_retry_delay().
+        :param path: The URI path
+        :type path: str
+        :param method: GET | POST
+        :type method: str
+        :param data: Extra data to pass in POST requests (will be converted to JSON but should be passed as a dict)
+        :param headers: Extra headers to send with the request
+        :type headers: dict
+        :param stream: Serialise data to JSON in chunks while it is being sent
+        :type stream: bool
+        :param event: The RequestEvent to record the retries and response size in (optional)
+        :type event: RequestEvent
+        :return response:
+        """
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            uri, kwargs = self._get_request_arguments(path, method, data, headers, stream)
+            response, error = None, None
+            try:
+                response = self.transport.request(method, uri, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            delay = get_retry_delay(method, attempt, self.max_retries, response, error, self.rate_limiter, event)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response
+            time.sleep(delay)
+            attempt += 1
+            if event is not None:
+                event.retries = attempt
+
+
+class AsyncReevooAPI(ReevooAPI):
     """
-    Converts a dictionary to a string of GET arguments to be used in a URL
-    :param args: The dictionary of arguments
-    :type args: dict
+    asyncio version of ReevooAPI. Every get_*/set_* method of ReevooAPI, and the helpers built on them
+    (get_reviewables_by_sku(), set_customer_order_batch_submission_chunked(),
+    get_customer_experience_review_list_in_date_range() and the iterators), is available as a coroutine (or async
+    generator) and returns the same requests.Response objects, so the two clients can be used interchangeably. Requests
+    go through the same cache, rate limiter, retries and request coalescing as ReevooAPI. All requests share one pooled
+    AsyncTransport, so many calls can be in flight on a single event loop.
+    Requires httpx (pip install httpx). Close the client with `await reevoo.close()` or use it as an async context
+    manager:
+        async with AsyncReevooAPI(api_key, api_secret) as reevoo:
+            response = await reevoo.get_review_list(trkref, locale)
     """
-    url_args = ''
-    for key in args:
-        val = args[key]
-        url_args += val + '=' + str(key) + '&'
-    return url_args
 
+    def __init__(self, api_key=None, api_secret=None, max_connections=100, base_uri=REEVOO_API_URI, hooks=None,
+                 timeout=DEFAULT_TIMEOUT, keepalive_expiry=5, http2=False, compress_uploads=False, cache=None,
+                 rate_limiter=None, max_retries=3, coalesce_requests=False, transport=None):
+        """
+        Set the credentials to query the API and create the shared connection pool
+        :param api_key:
+        :type api_key: str
+        :param api_secret:
+        :type api_secret: str
+        :param max_connections: The maximum number of open connections to the API if no transport is given (optional,
+                                defaults to 100)
+        :type max_connections: int
+        :param base_uri: The URI of the API (optional, defaults to REEVOO_API_URI)
+        :type base_uri: str
+        :param hooks: RequestHooks called before and after every request (optional, defaults to None)
+        :type hooks: list
+        :param timeout: Seconds to wait for a connection and for the response, as a (connect, read) tuple or one
+                        number for both, None waits forever (optional, defaults to DEFAULT_TIMEOUT)
+        :type timeout: tuple | float
+        :param keepalive_expiry: Seconds an idle connection is kept open for if no transport is given (optional,
+                                 defaults to 5)
+        :type keepalive_expiry: float
+        :param http2: Use HTTP/2 so that concurrent requests share one multiplexed connection. Falls back to HTTP/1.1 if
+                      h2 isn't installed or the server doesn't support HTTP/2 (optional, defaults to False)
+        :type http2: bool
+        :param compress_uploads: Gzip the JSON bodies of POST requests (optional, defaults to False)
+        :type compress_uploads: bool
+        :param cache: Cache for GET responses, can be shared with ReevooAPI clients (optional, defaults to None which
+                      disables caching)
+        :type cache: ResponseCache
+        :param rate_limiter: Limits the rate of requests, can be shared with other clients (optional, defaults to None)
+        :type rate_limiter: RateLimiter
+        :param max_retries: The number of times a throttled or failed GET request is retried (optional, defaults to 3)
+        :type max_retries: int
+        :param coalesce_requests: Share one request between tasks making the same GET request at the same time
+                                  (optional, defaults to False)
+        :type coalesce_requests: bool
+        :param transport: The connection pool to send requests through, can be shared by clients with different
+                          credentials (optional, defaults to a new AsyncTransport for this client)
+        :type transport: AsyncTransport
+        """
+        if httpx is None:
+            raise ImportError('AsyncReevooAPI requires httpx, install it with "pip install httpx"')
+        # read by _create_transport(), which ReevooAPI.__init__() calls if no transport is given
+        self.max_connections = max_connections
+        self.keepalive_expiry = keepalive_expiry
+        ReevooAPI.__init__(self, api_key, api_secret, cache=cache, rate_limiter=rate_limiter, max_retries=max_retries,
+                           coalesce_requests=coalesce_requests, base_uri=base_uri, hooks=hooks, transport=transport,
+                           timeout=timeout, http2=http2, compress_uploads=compress_uploads)
+        self.__requests_in_flight = RequestCoalescer()
 
-def get_items_in_date_range(list_of_items, publish_or_delivery, start_date=None, end_date=None,
-                            start_date_include=True, end_date_include=True):
+    def __enter__(self):
+        raise TypeError('Use "async with" with AsyncReevooAPI')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        """
+        Close the connections of the client's transport, a transport passed in to share with other clients is left open
+        """
+        if self._owns_transport:
+            await self.transport.close()
+
+    async def verify_api_keys(self):
+        """
+        Returns True if API keys make a successful call, False if not. Use this after initialising to check if your API
+        keys are correct and usable.
+        """
+        check = await self.get_organisation_list()
+        return check.status_code == 200
+
+    async def get_reviewables_by_sku(self, trkref, skus, branch_code='', max_workers=4):
+        """
+        Returns a dict mapping each SKU to its reviewable for any number of SKUs, fetching at most max_workers chunks
+        of SKUs at once. See ReevooAPI.get_reviewables_by_sku()
+        :param trkref: The three-character identifier for the organisation
+        :type trkref: str
+        :param skus: The SKUs to find
+        :type skus: list
+        :param branch_code: The identifier for a branch of the organisation (optional, defaults to None)
+        :type branch_code: str
+        :param max_workers: The number of chunks to fetch at once (optional, defaults to 4)
+        :type max_workers: int
+        """
+        semaphore = asyncio.Semaphore(max_workers)
+
+        async def fetch_chunk(sku_chunk):
+            async with semaphore:
+                response = await self.get_reviewable_list(trkref, branch_code, skus=sku_chunk)
+            return get_page_content(response).reviewables()
+
+        return merge_reviewables(await asyncio.gather(*[fetch_chunk(sku_chunk) for sku_chunk in get_sku_chunks(skus)]))
+
+    async def set_customer_order_batch_submission_chunked(self, customer_orders, batch_size=500, max_workers=4):
+        """
+        Submit any number of customer orders in batches of batch_size, at most max_workers batches at once. Returns a
+        list of BatchResult tuples in batch order. See ReevooAPI.set_customer_order_batch_submission_chunked()
+        :param customer_orders: The customer orders, see set_customer_order_batch_submission()
+        :type customer_orders: iterable
+        :param batch_size: The number of orders in each batch (optional, defaults to 500)
+        :type batch_size: int
+        :param max_workers: The number of batches to submit at once (optional, defaults to 4)
+        :type max_workers: int
+        """
+        path = '/v4/customer_orders'
+        semaphore = asyncio.Semaphore(max_workers)
+
+        async def submit(index, customer_order_batch):
+            try:
+                async with semaphore:
+                    response = await self._make_request(path, 'POST', customer_order_batch, stream=True)
+            except Exception as e:
+                return get_batch_result(index, customer_order_batch, error=e)
+            return get_batch_result(index, customer_order_batch, response=response)
+
+        results = []
+        pending = set()
+        for index, customer_order_batch in enumerate(iter_batches(customer_orders, batch_size)):
+            pending.add(asyncio.ensure_future(submit(index, customer_order_batch)))
+            # keep a bounded number of batches queued so a huge iterable isn't read into memory all at once
+            if len(pending) >= max_workers * 2:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                results += [task.result() for task in done]
+        if pending:
+            done, _ = await asyncio.wait(pending)
+            results += [task.result() for task in done]
+        return sorted(results, key=attrgetter('index'))
+
+    async def get_customer_experience_review_list_in_date_range(self, trkref, branch_code='', date_type='publish_date',
+                                                                start_date=None, end_date=None, max_workers=1,
+                                                                strategy='linear', as_records=False):
+        """
+        EXPERIMENTAL - Returns a list of customer experience reviews from within a date time range. See
+        ReevooAPI.get_customer_experience_review_list_in_date_range()
+        :param trkref:
+        :type trkref: str
+        :param branch_code:
+        :type branch_code: str
+        :param date_type: 'publish_date' | 'delivery_date' | 'purchase_date'
+        :type date_type: str
+        :param start_date: date string formatted YYYY-MM-DD
+        :type start_date: str
+        :param end_date: date string formatted YYYY-MM-DD
+        :type end_date: str
+        :param max_workers: The number of pages to fetch concurrently (optional, defaults to 1)
+        :type max_workers: int
+        :param strategy: 'linear' | 'bisect', bisect is only used with date_type='publish_date' (optional, defaults to
+                         'linear')
+        :type strategy: str
+        :param as_records: Return CustomerExperienceReview records instead of dicts (optional, defaults to False)
+        :type as_records: bool
+        """
+        if start_date is None and end_date is None:
+            return DATE_RANGE_MISSING_DATES
+        walk = DateRangeWalk(date_type, start_date, end_date, strategy)
+
+        page_one = await self.get_customer_experience_review_list(trkref, branch_code, older_reviews=True, page=1,
+                                                                  per_page=30)
+        content = get_page_content(page_one)
+        semaphore = asyncio.Semaphore(max_workers)
+
+        async def fetch_page(page_number):
+            if page_number == 1:
+                customer_experience_reviews = content.customer_experience_reviews()
+            else:
+                async with semaphore:
+                    page = await self.get_customer_experience_review_list(trkref, branch_code, older_reviews=True,
+                                                                          page=page_number, per_page=30)
+                customer_experience_reviews = get_page_content(page).customer_experience_reviews()
+            if as_records:
+                return CustomerExperienceReview.from_list(customer_experience_reviews)
+            return customer_experience_reviews
+
+        for page_numbers in walk.iter_page_windows(content.total_pages(), max_workers):
+            walk.add_pages(page_numbers, await asyncio.gather(*[fetch_page(number) for number in page_numbers]))
+        return walk.get_results()
+
+    async def iter_reviews(self, trkref, locale, branch_code='', sku='', region='', per_page=30,
+                           automotive_options=None, prefetch=1, as_records=False):
+        """
+        Async generator yielding every published review for an organisation one at a time. See
+        ReevooAPI.iter_reviews()
+            async for review in reevoo.iter_reviews(trkref, locale):
+                ...
+        """
+        async def fetch_page(page_number):
+            return await self.get_review_list(trkref, locale, branch_code, sku, region, page_number, per_page,
+                                              automotive_options)
+        async for item in self.__iter_pages(fetch_page, 'reviews', prefetch, Review if as_records else None):
+            yield item
+
+    async def iter_customer_experience_reviews(self, trkref, branch_code='', older_reviews=False, per_page=30,
+                                               prefetch=1, as_records=False):
+        """
+        Async generator yielding every customer experience review for an organisation one at a time. See
+        ReevooAPI.iter_customer_experience_reviews()
+        """
+        async def fetch_page(page_number):
+            return await self.get_customer_experience_review_list(trkref, branch_code, older_reviews, page_number,
+                                                                  per_page)
+        async for item in self.__iter_pages(fetch_page, 'customer_experience_reviews', prefetch,
+                                            CustomerExperienceReview if as_records else None):
+            yield item
+
+    async def __iter_pages(self, fetch_page, items_key, prefetch, record_class=None):
+        """
+        Async generator yielding the items from every page of a paginated endpoint, with the next `prefetch` pages
+        fetched in background tasks
+        """
+        async def fetch_content(page_number):
+            return get_page_content(await fetch_page(page_number))
+
+        content = await fetch_content(1)
+        total_pages = content.total_pages()
+        next_page = 2
+        pending = deque()
+        try:
+            while True:
+                while next_page <= total_pages and len(pending) < prefetch:
+                    pending.append(asyncio.ensure_future(fetch_content(next_page)))
+                    next_page += 1
+                items = content.data.get(items_key, [])
+                content = None
+                for item in items:
+                    yield record_class.from_dict(item) if record_class else item
+                if pending:
+                    content = await pending.popleft()
+                elif next_page <= total_pages:
+                    content = await fetch_content(next_page)
+                    next_page += 1
+                else:
+                    return
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _create_transport(self, http2=False):
+        """
+        Returns a new AsyncTransport for a client which wasn't given a transport
+        :param http2: Offer HTTP/2 to the server
+        :type http2: bool
+        """
+        return AsyncTransport(self.max_connections, self.keepalive_expiry, http2)
+
+    async def _make_request(self, path, method, data=None, stream=False):
+        """
+        Make the request to the API through the async transport, returns the response as a requests.Response so it has
+        the same shape as the responses from ReevooAPI. See ReevooAPI._make_request()
+        :param path: The URI path
+        :type path: str
+        :param method: GET | POST
+        :type method: str
+        :param data: Extra data to pass in POST requests (will be converted to JSON but should be passed as a dict)
+        :param stream: Serialise data to JSON in chunks while it is being sent instead of all at once
+        :type stream: bool
+        :return response:
+        """
+        with hook_request(self.hooks, method, path, data) as event:
+            response = await self.__dispatch_request(path, method, data, stream, event)
+            if event is not None:
+                event.response = response
+        return response
+
+    async def __dispatch_request(self, path, method, data=None, stream=False, event=None):
+        """
+        Send the request through request coalescing and the cache if they are enabled, returns the response
+        """
+        if method == 'GET' and self.coalesce_requests:
+            return await self.__make_coalesced_request(path, event)
+        if method == 'GET' and self.cache is not None:
+            return await self.__make_cached_request(path, event)
+        return await self.__send_request(path, method, data, stream=stream, event=event)
+
+    async def __make_coalesced_request(self, path, event=None):
+        """
+        Make a GET request, or wait for the same request if another task is already making it and return its response
+        """
+        future, is_leader = self.__requests_in_flight.join(path)
+        if not is_leader:
+            if event is not None:
+                event.cache_result = 'coalesced'
+            # shielded so that cancelling one waiting task doesn't cancel the request for the others
+            return copy_response(await asyncio.shield(asyncio.wrap_future(future)))
+        try:
+            if self.cache is not None:
+                response = await self.__make_cached_request(path, event)
+            else:
+                response = await self.__send_request(path, 'GET', event=event)
+        except BaseException as e:
+            self.__requests_in_flight.finish(path, error=e)
+            raise
+        self.__requests_in_flight.finish(path, response)
+        return response
+
+    async def __make_cached_request(self, path, event=None):
+        """
+        Make a GET request through the cache, see check_response_cache() and update_response_cache()
+        """
+        ttl = self.cache.get_ttl(path)
+        if not ttl:
+            return await self.__send_request(path, 'GET', event=event)
+        key = self._get_cache_key(path)
+        response, cached_response, headers = check_response_cache(self.cache, key, event)
+        if response is not None:
+            return response
+        response = await self.__send_request(path, 'GET', headers=headers, event=event)
+        return update_response_cache(self.cache, key, ttl, response, cached_response, event)
+
+    async def __send_request(self, path, method, data=None, headers=None, stream=False, event=None):
+        """
+        Send the request to the API, waiting for the rate limiter and retrying GET requests in the same way as
+        ReevooAPI, but without blocking the event loop
+        """
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire_async()
+            uri, kwargs = self._get_request_arguments(path, method, data, headers, stream)
+            response, error = None, None
+            try:
+                response = await self.transport.request(method, uri, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            delay = get_retry_delay(method, attempt, self.max_retries, response, error, self.rate_limiter, event)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response
+            await asyncio.sleep(delay)
+            attempt += 1
+            if event is not None:
+                event.retries = attempt
+
+
+class DateRangeWalk:
     """
-    Checks a page of results and returns a list of those that are within a date range
-    :param list_of_items: The list of items to check the dates for
-    :type list_of_items: list
-    :param publish_or_delivery: retrieve either the publish or the delivery date: 'publish_date' | 'delivery_date'
-    :type publish_or_delivery: str
-    :param start_date:
-    :type start_date: datetime
-    :param end_date:
-    :type end_date: datetime
-    :param start_date_include:
-    :type start_date_include: bool
-    :param end_date_include:
-    :type end_date_include: bool
+    Finds the customer experience reviews within a date range for get_customer_experience_review_list_in_date_range().
+    The walk decides which pages to fetch and the client fetches them, so that ReevooAPI and AsyncReevooAPI share the
+    walk and only differ in how the pages are fetched:
+        walk = DateRangeWalk(date_type, start_date, end_date, strategy)
+        for page_numbers in walk.iter_page_windows(number_of_pages, max_workers):
+            walk.add_pages(page_numbers, [fetch_page(page_number) for page_number in page_numbers])
+        reviews = walk.get_results()
     """
-    list_of_items_in_date = []
 
-    if start_date_include and start_date:
-        start_date = start_date - timedelta(days=1)
-    elif start_date is None:
-        start_date = date.min
+    def __init__(self, date_type='publish_date', start_date=None, end_date=None, strategy='linear'):
+        """
+        :param date_type: 'publish_date' | 'delivery_date' | 'purchase_date'
+        :type date_type: str
+        :param start_date: date string formatted YYYY-MM-DD (optional, defaults to None)
+        :type start_date: str
+        :param end_date: date string formatted YYYY-MM-DD (optional, defaults to None)
+        :type end_date: str
+        :param strategy: 'linear' | 'bisect', see ReevooAPI.get_customer_experience_review_list_in_date_range()
+                         (optional, defaults to 'linear')
+        :type strategy: str
+        """
+        if strategy not in DATE_RANGE_STRATEGIES:
+            raise ValueError('strategy must be one of %s' % ', '.join(DATE_RANGE_STRATEGIES))
+        self.date_type = date_type
+        self.start_date = datetime.strptime(start_date, '%Y-%m-%d') if start_date else None
+        self.end_date = datetime.strptime(end_date, '%Y-%m-%d') if end_date else None
+        # pages are ordered by publish date, so a page can be sliced by bisection rather than checked item by item
+        self.presorted = date_type == 'publish_date'
+        # the pages aren't ordered by the other dates, so bisecting them would skip reviews
+        self.bisect = strategy == 'bisect' and self.presorted
+        self.finished = False
+        # page number -> items, only kept by the bisect strategy
+        self.__pages = {}
+        self.__results = []
+
+    def iter_page_windows(self, number_of_pages, max_workers=1):
+        """
+        Generator yielding lists of page numbers to fetch, the pages of each list can be fetched concurrently and must
+        be passed to add_pages() before the next list is read
+        :param number_of_pages: The total number of pages
+        :type number_of_pages: int
+        :param max_workers: The number of pages fetched at once, the linear walk checks whether it has reached the end
+                            of the date range after each window of that many pages (optional, defaults to 1)
+        :type max_workers: int
+        """
+        if not self.bisect:
+            # Go through pages from beginning if there is a start date, otherwise go through pages from end (and sort)
+            page_numbers = get_date_range_page_order(number_of_pages, self.start_date)
+            for window_start in range(0, len(page_numbers), max_workers):
+                if self.finished:
+                    return
+                yield page_numbers[window_start:window_start + max_workers]
+            return
 
-    if end_date_include and end_date:
-        end_date = end_date - timedelta(days=1)
-    elif end_date is None:
-        end_date = date.max
+        # first page with reviews at or before the end date, last page with reviews at or after the start date
+        first_page = 1
+        if self.end_date:
+            end_date = self.end_date.date()
+            first_page = yield from self.__bisect_pages(
+                number_of_pages, lambda items: get_page_date_bounds(items, self.date_type)[0] <= end_date)
+        last_page = number_of_pages
+        if self.start_date:
+            start_date = self.start_date.date()
+            last_page = (yield from self.__bisect_pages(
+                number_of_pages, lambda items: get_page_date_bounds(items, self.date_type)[1] < start_date)) - 1
+        page_numbers = [p for p in range(first_page, last_page + 1) if p not in self.__pages]
+        if page_numbers:
+            yield page_numbers
+        for page_number in range(first_page, last_page + 1):
+            self.__results += get_items_in_date_range(self.__pages[page_number], self.date_type, self.start_date,
+                                                      self.end_date, presorted=self.presorted)
+        self.finished = True
 
-    for item in list_of_items:
-        item_date = datetime.strptime(item[publish_or_delivery], '%Y-%m-%d')
-        if start_date < item_date < end_date:
-            list_of_items_in_date.append(item)
+    def add_pages(self, page_numbers, pages):
+        """
+        Add the items of the pages yielded by iter_page_windows()
+        :param page_numbers: The page numbers
+        :type page_numbers: list
+        :param pages: The list of items on each page, in the same order as page_numbers
+        :type pages: iterable
+        """
+        for page_number, items in zip(page_numbers, pages):
+            if self.bisect:
+                self.__pages[page_number] = items
+            elif not self.finished:
+                items_in_date = get_items_in_date_range(items, self.date_type, self.start_date, self.end_date,
+                                                        presorted=self.presorted)
+                self.__results += items_in_date
+                # original request returns 30 reviews per page so if fewer than that are in the date range, then it has
+                # reached the end of the list of reviews in date and has therefore finished processing
+                if len(items_in_date) < 30:
+                    self.finished = True
 
-    return list_of_items_in_date
+    def get_results(self):
+        """
+        Returns the reviews found, sorted by sort_date_range_results() if the walk reached the end of the date range
+        """
+        if self.finished:
+            return sort_date_range_results(self.__results, self.start_date)
+        return self.__results
+
+    def __bisect_pages(self, number_of_pages, predicate):
+        """
+        Generator binary searching pages 1 to number_of_pages for the first page where predicate(items) is True, see
+        bisect_first(). Yields a list with the page to fetch whenever a page hasn't been added yet, and returns the
+        page number (number_of_pages + 1 if predicate is never True).
+        """
+        low, high = 1, number_of_pages + 1
+        while low < high:
+            middle = (low + high) // 2
+            if middle not in self.__pages:
+                yield [middle]
+            if predicate(self.__pages[middle]):
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+
+class ResponseContent:
+    """
+    The decoded JSON content of a response, with accessors for the parts of it used by the list endpoints. Get one with
+    decode_response(response).
+    """
+
+    def __init__(self, data):
+        """
+        :param data: The decoded JSON
+        :type data: dict
+        """
+        self.data = data
+
+    def summary(self):
+        """
+        Returns the summary of a list response
+        """
+        return self.data.get('summary', {})
+
+    def pagination(self):
+        """
+        Returns the pagination details of a list response (page, per_page, total_pages, total_entries)
+        """
+        return self.summary().get('pagination', {})
+
+    def total_pages(self):
+        """
+        Returns the total number of pages of a list response
+        """
+        return self.pagination().get('total_pages', 0)
+
+    def reviews(self):
+        """
+        Returns the reviews from a get_review_list() response
+        """
+        return self.data.get('reviews', [])
+
+    def customer_experience_reviews(self):
+        """
+        Returns the reviews from a get_customer_experience_review_list() response
+        """
+        return self.data.get('customer_experience_reviews', [])
+
+    def organisations(self):
+        """
+        Returns the organisations from a get_organisation_list() response
+        """
+        if isinstance(self.data, list):
+            return self.data
+        return self.data.get('organisations', [])
+
+    def reviewables(self):
+        """
+        Returns the reviewables from a get_reviewable_list() response
+        """
+        return self.data.get('reviewables', [])
+
+    def conversations(self):
+        """
+        Returns the conversations from a get_conversation_list() response
+        """
+        return self.data.get('conversations', [])
+
+    def purchases(self):
+        """
+        Returns the purchases from a get_purchaser_list() response
+        """
+        if isinstance(self.data, list):
+            return self.data
+        return self.data.get('purchases', [])
+
+
+class Record:
+    """
+    Base class for the compact record types, which hold a review (or reviewable, or conversation) in much less memory
+    than the dict it was decoded from. The fields listed in FIELDS are stored in __slots__, with short repeated strings
+    such as dates and branch codes interned. Everything else (e.g. nested objects) is kept as one compact JSON string
+    and only decoded when one of those keys is accessed.
+    Records can be read like the original dicts (record['publish_date'], record.get('text')) or as attributes
+    (record.publish_date), and record.to_dict() returns the original dict. A field which wasn't in the original dict is
+    missing from the record too, except that reading it as an attribute returns None.
+    """
+
+    __slots__ = ('_extra', '_nested')
+    FIELDS = ()
+    # fields whose values are interned, as the same few values are repeated across many records
+    INTERNED_FIELDS = ('sku', 'locale', 'branch_code', 'publish_date', 'delivery_date', 'purchase_date')
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Creates a record from a decoded dict
+        :param data: The decoded item
+        :type data: dict
+        """
+        record = cls.__new__(cls)
+        extra = {}
+        # fields missing from the dict are left unset, so they stay missing in to_dict(), `in` and get()
+        for key, value in data.items():
+            if key in cls.FIELDS and not isinstance(value, (dict, list)):
+                if key in cls.INTERNED_FIELDS and isinstance(value, str):
+                    value = sys.intern(value)
+                setattr(record, key, value)
+            else:
+                extra[key] = value
+        record._extra = json.dumps(extra, separators=(',', ':')) if extra else None
+        record._nested = None
+        return record
+
+    @classmethod
+    def from_list(cls, list_of_items):
+        """
+        Creates a list of records from a list of decoded dicts
+        :param list_of_items: The decoded items
+        :type list_of_items: list
+        """
+        return [cls.from_dict(item) for item in list_of_items]
+
+    def __get_nested(self):
+        if self._nested is None:
+            self._nested = decode_json(self._extra) if self._extra else {}
+        return self._nested
+
+    def __get_field(self, field):
+        # object.__getattribute__ doesn't fall back to __getattr__, so a slot which was never set raises AttributeError
+        try:
+            return object.__getattribute__(self, field)
+        except AttributeError:
+            return UNSET
+
+    def __getattr__(self, name):
+        # only called for names which aren't slots or are unset slots, i.e. the nested/extra keys and missing fields
+        if name.startswith('_'):
+            raise AttributeError(name)
+        nested = self.__get_nested()
+        if name in nested:
+            return nested[name]
+        if name in self.FIELDS:
+            return None
+        raise AttributeError(name)
+
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            value = self.__get_field(key)
+            if value is not UNSET:
+                return value
+        return self.__get_nested()[key]
+
+    def __contains__(self, key):
+        return (key in self.FIELDS and self.__get_field(key) is not UNSET) or key in self.__get_nested()
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    def __reduce__(self):
+        # pickle from the dict, the default would read the unset slots through __getattr__ and store them as None
+        return type(self).from_dict, (self.to_dict(),)
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, ', '.join('%s=%r' % (field, value) for field, value in
+                                                          self.__iter_fields()))
+
+    def __iter_fields(self):
+        # the (field, value) pairs of the slots which are set
+        for field in self.FIELDS:
+            value = self.__get_field(field)
+            if value is not UNSET:
+                yield field, value
+
+    def get(self, key, default=None):
+        """
+        Returns the value for a key, or default if the record doesn't have it
+        :param key: The key
+        :type key: str
+        :param default: The value to return if the key is missing (optional, defaults to None)
+        """
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self):
+        """
+        Returns the record as a dict
+        """
+        data = dict(self.__iter_fields())
+        if self._extra:
+            # decode a fresh copy so changes to the dict don't change the record
+            data.update(decode_json(self._extra))
+        return data
+
+
+class Review(Record):
+    """
+    Compact record for a review from get_review_list() or get_review_detail()
+    """
+
+    FIELDS = ('id', 'sku', 'locale', 'branch_code', 'overall_score', 'publish_date', 'helpful', 'unhelpful')
+    __slots__ = FIELDS
+
+
+class CustomerExperienceReview(Record):
+    """
+    Compact record for a review from get_customer_experience_review_list()
+    """
+
+    FIELDS = ('id', 'branch_code', 'overall_score', 'customer_service_score', 'publish_date', 'delivery_date',
+              'purchase_date')
+    __slots__ = FIELDS
+
+
+class Reviewable(Record):
+    """
+    Compact record for a reviewable from get_reviewable_list() or get_reviewable_detail()
+    """
+
+    FIELDS = ('sku', 'locale', 'branch_code', 'review_count', 'average_score')
+    __slots__ = FIELDS
+
+
+class Conversation(Record):
+    """
+    Compact record for a conversation from get_conversation_list() or get_conversation_detail()
+    """
+
+    FIELDS = ('id', 'sku', 'locale', 'publish_date', 'helpful', 'unhelpful')
+    __slots__ = FIELDS
+
+
+class ResponseCache:
+    """
+    Thread-safe in-memory cache for GET responses, pass one to ReevooAPI to enable caching. Entries expire after a TTL
+    (which can be set per endpoint), the least recently used entries are evicted once max_entries is reached, and
+    expired entries with an ETag or Last-Modified header are revalidated with a conditional request instead of being
+    fetched again. A single cache can be shared by several ReevooAPI instances.
+    The clients cache a copy of each response and give every hit its own copy (see copy_response()), so each hit is
+    decoded afresh and a caller changing the decoded content of its response doesn't change what later hits get.
+    """
+
+    def __init__(self, max_entries=1024, ttl=60, endpoint_ttls=None):
+        """
+        :param max_entries: The maximum number of responses to keep (optional, defaults to 1024)
+        :type max_entries: int
+        :param ttl: The number of seconds a response is fresh for (optional, defaults to 60)
+        :type ttl: float
+        :param endpoint_ttls: TTLs for specific endpoints keyed by route template, e.g.
+                              {'/v4/organisations/{trkref}/reviewable': 300}. A TTL of 0 disables caching for that
+                              endpoint (optional, defaults to None)
+        :type endpoint_ttls: dict
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.endpoint_ttls = endpoint_ttls or {}
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get_ttl(self, path):
+        """
+        Returns the TTL for a request path
+        :param path: The URI path
+        :type path: str
+        """
+        return self.endpoint_ttls.get(path_to_route_template(path), self.ttl)
+
+    def get(self, key):
+        """
+        Returns the cached entry for a key as a tuple (response, is_fresh), or None if there is no entry
+        :param key: The cache key
+        :type key: tuple
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                return None
+            self.__entries.move_to_end(key)
+            response, expires = entry
+            return response, time.monotonic() < expires
+
+    def set(self, key, response, ttl):
+        """
+        Stores a response for ttl seconds, evicting the least recently used entries if the cache is full
+        :param key: The cache key
+        :type key: tuple
+        :param response: The response to cache
+        :type response: requests.Response
+        :param ttl: The number of seconds the response is fresh for
+        :type ttl: float
+        """
+        with self.__lock:
+            self.__entries[key] = (response, time.monotonic() + ttl)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_entries:
+                self.__entries.popitem(last=False)
+                self.evictions += 1
+
+    def record(self, counter):
+        """
+        Increments one of the counters: 'hits' | 'misses' | 'revalidations'
+        :param counter: The name of the counter
+        :type counter: str
+        """
+        with self.__lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self):
+        """
+        Returns the hit, miss, revalidation and eviction counts and the current number of entries
+        """
+        with self.__lock:
+            return {'hits': self.hits, 'misses': self.misses, 'revalidations': self.revalidations,
+                    'evictions': self.evictions, 'size': len(self.__entries)}
+
+    def delete(self, key):
+        """
+        Removes the entry for a key, returns True if there was one
+        :param key: The cache key
+        :type key: tuple
+        """
+        with self.__lock:
+            return self.__entries.pop(key, None) is not None
+
+    def clear(self):
+        """
+        Removes every entry from the cache (the counters are kept)
+        """
+        with self.__lock:
+            self.__entries.clear()
+
+
+class RequestCoalescer:
+    """
+    Thread-safe register of the GET requests in flight, for request coalescing. The first caller for a path makes the
+    request and passes its outcome to finish(), the others wait for the same concurrent.futures.Future (async callers
+    wait for it with asyncio.wrap_future()).
+    """
+
+    def __init__(self):
+        # path -> Future of the request being made for it
+        self.__futures = {}
+        self.__lock = threading.Lock()
+
+    def join(self, key):
+        """
+        Returns a tuple (future, is_leader) for a request. If is_leader is True there was no request in flight and the
+        caller must make it, otherwise the caller waits for the future.
+        :param key: The request, e.g. its path
+        :type key: str
+        """
+        with self.__lock:
+            future = self.__futures.get(key)
+            if future is not None:
+                return future, False
+            future = self.__futures[key] = Future()
+            return future, True
+
+    def finish(self, key, response=None, error=None):
+        """
+        Gives the response to a request (or the exception it raised) to the callers waiting for it
+        :param key: The request, e.g. its path
+        :type key: str
+        :param response: The response (optional, defaults to None)
+        :type response: requests.Response
+        :param error: The exception raised by the request (optional, defaults to None)
+        :type error: BaseException
+        """
+        with self.__lock:
+            future = self.__futures.pop(key)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(response)
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket limiting the rate of requests to the API. One limiter can be shared by several threads and
+    several ReevooAPI and AsyncReevooAPI instances. When the API throttles a request (429 or 503) the limiter halves its
+    rate and pauses for the Retry-After time if one was sent, then each successful request raises the rate a little
+    until it is back at the configured rate, so clients settle at the highest rate the API will accept.
+    """
+
+    def __init__(self, rate=10, burst=None, min_rate=0.5, adaptive=True, max_pause=RETRY_BACKOFF_MAX):
+        """
+        :param rate: The maximum number of requests per second (optional, defaults to 10)
+        :type rate: float
+        :param burst: The maximum number of requests which can be made at once after being idle (optional, defaults
+                      to rate)
+        :type burst: float
+        :param min_rate: The lowest rate the limiter will slow down to when throttled (optional, defaults to 0.5)
+        :type min_rate: float
+        :param adaptive: Slow down when throttled and speed back up after successful requests (optional, defaults
+                         to True)
+        :type adaptive: bool
+        :param max_pause: The longest a Retry-After header can pause every request for (optional, defaults to
+                          RETRY_BACKOFF_MAX)
+        :type max_pause: float
+        """
+        self.max_pause = max_pause
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst or max(rate, 1)
+        self.min_rate = min_rate
+        self.adaptive = adaptive
+        self.__tokens = self.burst
+        self.__last_refill = time.monotonic()
+        self.__paused_until = 0
+        self.__lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Blocks until a request can be made
+        """
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """
+        Waits until a request can be made without blocking the event loop, for AsyncReevooAPI
+        """
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def try_acquire(self):
+        """
+        Takes a token if a request can be made now and returns 0, otherwise returns the number of seconds to wait
+        before trying again
+        """
+        with self.__lock:
+            now = time.monotonic()
+            self.__tokens = min(self.burst, self.__tokens + (now - self.__last_refill) * self.rate)
+            self.__last_refill = now
+            wait = self.__paused_until - now
+            if wait <= 0 and self.__tokens >= 1:
+                self.__tokens -= 1
+                return 0
+            return max(wait, (1 - self.__tokens) / self.rate)
+
+    def on_success(self):
+        """
+        Raise the rate a step back towards the maximum after a successful request
+        """
+        if self.adaptive and self.rate < self.max_rate:
+            with self.__lock:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20.0)
+
+    def on_throttle(self, retry_after=None):
+        """
+        Halve the rate, and stop every request for retry_after seconds (at most max_pause) if the API sent a
+        Retry-After header
+        :param retry_after: The number of seconds to pause for (optional, defaults to None)
+        :type retry_after: float
+        """
+        with self.__lock:
+            if self.adaptive:
+                self.rate = max(self.min_rate, self.rate / 2.0)
+            if retry_after:
+                self.__paused_until = max(self.__paused_until, time.monotonic() + min(retry_after, self.max_pause))
+                self.__tokens = min(self.__tokens, 0)
+
+
+class Transport:
+    """
+    Pool of keep-alive HTTP connections to the API. Each ReevooAPI creates its own by default, pass one Transport to
+    several ReevooAPI instances (even with different credentials, which are sent with each request) to have them share
+    one warm pool:
+        transport = Transport(pool_maxsize=64)
+        clients = [ReevooAPI(key, secret, transport=transport) for key, secret in credentials]
+    Set pool_maxsize to at least the number of threads making requests at once, otherwise the extra connections are
+    opened for one request and then thrown away.
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, pool_block=False, max_idle_time=None,
+                 tcp_keepalive=False):
+        """
+        :param pool_connections: The number of hosts to keep a pool for (optional, defaults to 10)
+        :type pool_connections: int
+        :param pool_maxsize: The maximum number of connections kept open to each host (optional, defaults to 10)
+        :type pool_maxsize: int
+        :param pool_block: Make requests wait for a free connection instead of opening a connection which won't be
+                           kept once pool_maxsize connections are in use (optional, defaults to False)
+        :type pool_block: bool
+        :param max_idle_time: Close the pooled connections before a request if no request has been made for this many
+                              seconds, instead of reusing connections a load balancer may have dropped (optional,
+                              defaults to None which always reuses them)
+        :type max_idle_time: float
+        :param tcp_keepalive: Turn on TCP keep-alive probes, so that idle connections are kept open through NAT and
+                              firewalls (optional, defaults to False)
+        :type tcp_keepalive: bool
+        """
+        socket_options = None
+        if tcp_keepalive:
+            socket_options = HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+        self.adapter = TransportAdapter(socket_options, pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                        pool_block=pool_block)
+        self.session = requests.Session()
+        # gzip and deflate, and br if brotli is installed, urllib3 decodes the responses as they are read
+        self.session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+        self.max_idle_time = max_idle_time
+        self.__in_flight = 0
+        self.__last_used = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def request(self, method, uri, **kwargs):
+        """
+        Send a request through the pool, returns the response. Takes the same arguments as requests.Session.request()
+        :param method: GET | POST
+        :type method: str
+        :param uri: The full URI
+        :type uri: str
+        """
+        with self.__lock:
+            now = time.monotonic()
+            if self.max_idle_time is not None and self.__in_flight == 0 \
+                    and now - self.__last_used > self.max_idle_time:
+                self.adapter.close()
+            self.__in_flight += 1
+            self.__last_used = now
+        try:
+            return self.session.request(method, uri, **kwargs)
+        finally:
+            with self.__lock:
+                self.__in_flight -= 1
+                self.__last_used = time.monotonic()
+
+    def close(self):
+        """
+        Close every pooled connection, they are reopened if the transport is used again
+        """
+        self.session.close()
+
+
+class HTTP2Transport:
+    """
+    Transport sending requests over HTTP/2 with httpx, so that any number of concurrent requests share one multiplexed
+    connection with compressed headers instead of each thread needing its own connection. Use it in place of Transport
+    (or pass http2=True to ReevooAPI), it can be shared between clients in the same way.
+    Requires httpx, and h2 for HTTP/2 (pip install httpx[http2]). Without h2, or if the server doesn't offer HTTP/2,
+    requests are sent over HTTP/1.1 connections.
+    """
+
+    def __init__(self, max_connections=10, keepalive_expiry=5, http2=True):
+        """
+        :param max_connections: The maximum number of open connections, with HTTP/2 one is normally enough (optional,
+                                defaults to 10)
+        :type max_connections: int
+        :param keepalive_expiry: Seconds an idle connection is kept open for (optional, defaults to 5)
+        :type keepalive_expiry: float
+        :param http2: Offer HTTP/2 to the server (optional, defaults to True)
+        :type http2: bool
+        """
+        if httpx is None:
+            raise ImportError('HTTP2Transport requires httpx, install it with "pip install httpx[http2]"')
+        self.http2 = http2 and h2 is not None
+        self.session = httpx.Client(http2=self.http2,
+                                    limits=httpx.Limits(max_connections=max_connections,
+                                                        keepalive_expiry=keepalive_expiry),
+                                    headers={'Accept-Encoding': ACCEPT_ENCODING})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def request(self, method, uri, headers=None, auth=None, timeout=None, data=None):
+        """
+        Send a request, returns the response converted to a requests.Response. httpx errors are raised as the
+        equivalent requests exceptions so that failed requests are retried in the same way as with Transport.
+        :param method: GET | POST
+        :type method: str
+        :param uri: The full URI
+        :type uri: str
+        :param headers: Extra headers to send with the request
+        :type headers: dict
+        :param auth: The credentials
+        :type auth: HTTPBasicAuth
+        :param timeout: Seconds to wait, as a (connect, read) tuple or one number for both
+        :type timeout: tuple | float
+        :param data: The body of the request, as a string or an iterable of bytes
+        """
+        if auth is not None:
+            auth = httpx.BasicAuth(auth.username or '', auth.password or '')
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        try:
+            response = self.session.request(method, uri, headers=headers, auth=auth, content=data,
+                                            timeout=to_httpx_timeout(timeout))
+        except httpx.TransportError as e:
+            raise httpx_to_requests_error(e)
+        return httpx_to_requests_response(response)
+
+    def close(self):
+        """
+        Close every connection
+        """
+        self.session.close()
+
+
+class AsyncTransport:
+    """
+    Pool of connections for AsyncReevooAPI, sending requests with one httpx.AsyncClient so that many requests can be in
+    flight on a single event loop. Each AsyncReevooAPI creates its own by default, pass one AsyncTransport to several
+    clients (even with different credentials) to have them share it. Responses and errors are converted to their
+    requests equivalents as they are by HTTP2Transport.
+    Requires httpx, and h2 for HTTP/2 (pip install httpx[http2]).
+    """
+
+    def __init__(self, max_connections=100, keepalive_expiry=5, http2=False):
+        """
+        :param max_connections: The maximum number of open connections (optional, defaults to 100)
+        :type max_connections: int
+        :param keepalive_expiry: Seconds an idle connection is kept open for (optional, defaults to 5)
+        :type keepalive_expiry: float
+        :param http2: Offer HTTP/2 to the server, ignored if h2 isn't installed (optional, defaults to False)
+        :type http2: bool
+        """
+        if httpx is None:
+            raise ImportError('AsyncTransport requires httpx, install it with "pip install httpx"')
+        self.http2 = http2 and h2 is not None
+        self.session = httpx.AsyncClient(http2=self.http2,
+                                         limits=httpx.Limits(max_connections=max_connections,
+                                                             keepalive_expiry=keepalive_expiry),
+                                         headers={'Accept-Encoding': ACCEPT_ENCODING})
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def request(self, method, uri, headers=None, auth=None, timeout=None, data=None):
+        """
+        Send a request, returns the response converted to a requests.Response. Takes the same arguments as
+        HTTP2Transport.request().
+        :param method: GET | POST
+        :type method: str
+        :param uri: The full URI
+        :type uri: str
+        :param headers: Extra headers to send with the request
+        :type headers: dict
+        :param auth: The credentials
+        :type auth: HTTPBasicAuth
+        :param timeout: Seconds to wait, as a (connect, read) tuple or one number for both
+        :type timeout: tuple | float
+        :param data: The body of the request, as a string or an iterable of bytes
+        """
+        if auth is not None:
+            auth = httpx.BasicAuth(auth.username or '', auth.password or '')
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        elif data is not None and not isinstance(data, bytes):
+            # httpx.AsyncClient can only stream an async iterable
+            data = aiter_chunks(data)
+        try:
+            response = await self.session.request(method, uri, headers=headers, auth=auth, content=data,
+                                                  timeout=to_httpx_timeout(timeout))
+        except httpx.TransportError as e:
+            raise httpx_to_requests_error(e)
+        return httpx_to_requests_response(response)
+
+    async def close(self):
+        """
+        Close every connection
+        """
+        await self.session.aclose()
+
+
+class TransportAdapter(HTTPAdapter):
+    """
+    requests HTTPAdapter which can set socket options (e.g. TCP keep-alive) on the connections it opens
+    """
+
+    __attrs__ = HTTPAdapter.__attrs__ + ['socket_options']
+
+    def __init__(self, socket_options=None, **kwargs):
+        """
+        :param socket_options: (level, option, value) tuples set on each new socket, None for the urllib3 defaults
+        :type socket_options: list
+        """
+        # set before HTTPAdapter.__init__() as it calls init_poolmanager()
+        self.socket_options = socket_options
+        HTTPAdapter.__init__(self, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self.socket_options is not None:
+            kwargs['socket_options'] = self.socket_options
+        HTTPAdapter.init_poolmanager(self, *args, **kwargs)
+
+
+class RequestEvent:
+    """
+    A request made by ReevooAPI, passed to the RequestHooks. Before the request only method, path, data, route and
+    start_time are set, the rest are filled in by the time after_request() is called.
+    """
+
+    __slots__ = ('method', 'path', 'data', 'route', 'start_time', 'duration', 'response', 'response_size', 'retries',
+                 'cache_result', 'error', '__started')
+
+    def __init__(self, method, path, data=None):
+        """
+        :param method: GET | POST
+        :type method: str
+        :param path: The URI path
+        :type path: str
+        :param data: The data sent with a POST request (optional, defaults to None)
+        """
+        self.method = method
+        self.path = path
+        self.data = data
+        # e.g. '/v4/organisations/{trkref}/reviews'
+        self.route = path_to_route_template(path)
+        self.start_time = time.time()
+        self.duration = None
+        self.response = None
+        # the size of the body of the last response received from the API, 0 for a 304 and None for a cache hit
+        self.response_size = None
+        self.retries = 0
+        # None if the request didn't go through the cache, otherwise 'hit' | 'miss' | 'revalidated' | 'coalesced'
+        self.cache_result = None
+        self.error = None
+        self.__started = time.perf_counter()
+
+    @property
+    def status_code(self):
+        """
+        The status code of the response, or None if the request raised an exception
+        """
+        return self.response.status_code if self.response is not None else None
+
+    def finish(self):
+        """
+        Record the duration of the request
+        """
+        self.duration = time.perf_counter() - self.__started
+
+
+class RequestHook:
+    """
+    Base class for instrumentation passed to ReevooAPI(hooks=[...]). Override either method, both are called in the
+    thread making the request (or on the event loop for AsyncReevooAPI) so they should be quick. Exceptions raised by a
+    hook are not caught.
+    """
+
+    def before_request(self, event):
+        """
+        Called before a request is made
+        :param event: The request
+        :type event: RequestEvent
+        """
+        pass
+
+    def after_request(self, event):
+        """
+        Called after a request has finished, whether it succeeded or raised an exception
+        :param event: The request
+        :type event: RequestEvent
+        """
+        pass
+
+
+class MetricsCollector(RequestHook):
+    """
+    Thread-safe RequestHook recording per-endpoint metrics: latency and response size histograms, response status
+    counts, retries and cache results, keyed by route template and method. One collector can be shared by several
+    ReevooAPI instances. Export the metrics with stats() or in the Prometheus text format with to_prometheus().
+        metrics = MetricsCollector()
+        reevoo = ReevooAPI(api_key, api_secret, hooks=[metrics])
+    """
+
+    def __init__(self, latency_buckets=LATENCY_BUCKETS, size_buckets=RESPONSE_SIZE_BUCKETS, prefix='reevoo_api'):
+        """
+        :param latency_buckets: The upper bounds of the latency histogram buckets in seconds (optional, defaults to
+                                LATENCY_BUCKETS)
+        :type latency_buckets: tuple
+        :param size_buckets: The upper bounds of the response size histogram buckets in bytes (optional, defaults to
+                             RESPONSE_SIZE_BUCKETS)
+        :type size_buckets: tuple
+        :param prefix: The prefix of the Prometheus metric names (optional, defaults to 'reevoo_api')
+        :type prefix: str
+        """
+        self.latency_buckets = tuple(sorted(latency_buckets))
+        self.size_buckets = tuple(sorted(size_buckets))
+        self.prefix = prefix
+        self.__lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """
+        Reset every metric
+        """
+        with self.__lock:
+            self.in_flight = 0
+            # (route, method) -> [bucket counts..., +Inf count], sum
+            self.__latencies = {}
+            self.__sizes = {}
+            # (route, method, status) -> count, status is 'error' for requests which raised an exception
+            self.__statuses = {}
+            self.__retries = {}
+            # (route, method, cache result) -> count
+            self.__cache_results = {}
+
+    def before_request(self, event):
+        with self.__lock:
+            self.in_flight += 1
+
+    def after_request(self, event):
+        key = (event.route, event.method)
+        status = str(event.status_code) if event.status_code is not None else 'error'
+        with self.__lock:
+            self.in_flight -= 1
+            observe(self.__latencies, key, self.latency_buckets, event.duration)
+            if event.response_size is not None:
+                observe(self.__sizes, key, self.size_buckets, event.response_size)
+            self.__statuses[key + (status,)] = self.__statuses.get(key + (status,), 0) + 1
+            if event.retries:
+                self.__retries[key] = self.__retries.get(key, 0) + event.retries
+            if event.cache_result:
+                cache_key = key + (event.cache_result,)
+                self.__cache_results[cache_key] = self.__cache_results.get(cache_key, 0) + 1
+
+    def stats(self):
+        """
+        Returns the metrics for each endpoint as a dict keyed by (route, method), with the request count, total and
+        mean latency, latency histogram ({upper bound: cumulative count}), total response bytes, response status
+        counts, retries and cache results
+        """
+        with self.__lock:
+            stats = {}
+            for key, (counts, total) in self.__latencies.items():
+                sizes = self.__sizes.get(key)
+                stats[key] = {
+                    'count': counts[-1],
+                    'latency_sum': total,
+                    'latency_mean': total / counts[-1] if counts[-1] else None,
+                    'latency_buckets': OrderedDict(zip(self.latency_buckets + (float('inf'),), counts)),
+                    'response_bytes': sizes[1] if sizes else 0,
+                    'statuses': dict((status, count) for (route, method, status), count in self.__statuses.items()
+                                     if (route, method) == key),
+                    'retries': self.__retries.get(key, 0),
+                    'cache_results': dict((result, count) for (route, method, result), count
+                                          in self.__cache_results.items() if (route, method) == key),
+                }
+            return stats
+
+    def to_prometheus(self):
+        """
+        Returns the metrics in the Prometheus text exposition format
+        """
+        prefix = self.prefix
+        with self.__lock:
+            lines = []
+            lines += format_prometheus_histogram('%s_request_duration_seconds' % prefix,
+                                                 'Latency of requests to the Reevoo API', self.latency_buckets,
+                                                 self.__latencies)
+            lines += format_prometheus_histogram('%s_response_size_bytes' % prefix,
+                                                 'Size of response bodies from the Reevoo API', self.size_buckets,
+                                                 self.__sizes)
+            lines += format_prometheus_counter('%s_responses_total' % prefix, 'Responses from the Reevoo API',
+                                               ('route', 'method', 'status'), self.__statuses)
+            lines += format_prometheus_counter('%s_retries_total' % prefix, 'Retried requests to the Reevoo API',
+                                               ('route', 'method'), self.__retries)
+            lines += format_prometheus_counter('%s_cache_results_total' % prefix,
+                                               'Requests to the Reevoo API served through the response cache',
+                                               ('route', 'method', 'result'), self.__cache_results)
+            lines += ['# HELP %s_requests_in_flight Requests to the Reevoo API in progress' % prefix,
+                      '# TYPE %s_requests_in_flight gauge' % prefix,
+                      '%s_requests_in_flight %d' % (prefix, self.in_flight)]
+        return '\n'.join(lines) + '\n'
+
+
+class ReviewMirror:
+    """
+    Local SQLite copy of the reviews and customer experience reviews for one or more organisations. The first sync
+    downloads everything, later syncs only fetch pages until they reach reviews older than the newest publish date
+    already stored (the high-water mark). Date range and SKU queries are then answered from the local copy.
+        mirror = ReviewMirror('reviews.db')
+        mirror.sync_customer_experience_reviews(reevoo, trkref)
+        reviews = mirror.get_customer_experience_reviews_in_date_range(trkref, start_date='2017-01-01')
+    """
+
+    REVIEW = 'review'
+    CUSTOMER_EXPERIENCE_REVIEW = 'customer_experience_review'
+    DATE_TYPES = DATE_TYPES
+
+    def __init__(self, path=':memory:'):
+        """
+        Open (or create) the mirror database
+        :param path: The path of the SQLite database file (optional, defaults to an in-memory database)
+        :type path: str
+        """
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS reviews (kind TEXT, trkref TEXT, branch_code TEXT, '
+                                    'locale TEXT, id TEXT, sku TEXT, publish_date TEXT, delivery_date TEXT, '
+                                    'purchase_date TEXT, data TEXT, '
+                                    'PRIMARY KEY (kind, trkref, branch_code, locale, id))')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS reviews_sku ON reviews (trkref, sku)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS reviews_publish_date ON reviews '
+                                    '(kind, trkref, branch_code, publish_date)')
+            columns = [row['name'] for row in self.connection.execute('PRAGMA table_info(sync_state)')]
+            if columns and 'sku' not in columns:
+                # high-water marks from before they were kept per SKU may come from a sync of a single SKU, so they are
+                # dropped and the next sync of each organisation fetches every page again
+                self.connection.execute('DROP TABLE sync_state')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS sync_state (kind TEXT, trkref TEXT, branch_code TEXT, '
+                                    'locale TEXT, sku TEXT, high_water_mark TEXT, synced_at TEXT, '
+                                    'PRIMARY KEY (kind, trkref, branch_code, locale, sku))')
+
+    def close(self):
+        """
+        Close the database connection
+        """
+        self.connection.close()
+
+    def sync_reviews(self, reevoo, trkref, locale, branch_code='', sku='', per_page=30):
+        """
+        Fetch new published reviews for an organisation into the mirror, returns the number of reviews stored
+        :param reevoo: The client to fetch the reviews with
+        :type reevoo: ReevooAPI
+        :param trkref: The three-character identifier for the organisation
+        :type trkref: str
+        :param locale: The locale (e.g. en-GB)
+        :type locale: str
+        :param branch_code: The identifier for a branch of the organisation (optional, defaults to None)
+        :type branch_code: str
+        :param sku: The SKU to find (optional, defaults to None)
+        :type sku: str
+        :param per_page: The number of results to fetch per page (optional, defaults to 30)
+        :type per_page: int
+        """
+        def iter_reviews(prefetch):
+            return reevoo.iter_reviews(trkref, locale, branch_code, sku, per_page=per_page, prefetch=prefetch)
+        return self.__sync(self.REVIEW, iter_reviews, trkref, branch_code, locale, sku)
+
+    def sync_customer_experience_reviews(self, reevoo, trkref, branch_code='', per_page=30):
+        """
+        Fetch new customer experience reviews for an organisation into the mirror, returns the number of reviews stored
+        :param reevoo: The client to fetch the reviews with
+        :type reevoo: ReevooAPI
+        :param trkref: The three-character identifier for the organisation
+        :type trkref: str
+        :param branch_code: The identifier for a branch of the organisation (optional, defaults to None)
+        :type branch_code: str
+        :param per_page: The number of results to fetch per page (optional, defaults to 30)
+        :type per_page: int
+        """
+        def iter_reviews(prefetch):
+            return reevoo.iter_customer_experience_reviews(trkref, branch_code, older_reviews=True, per_page=per_page,
+                                                           prefetch=prefetch)
+        return self.__sync(self.CUSTOMER_EXPERIENCE_REVIEW, iter_reviews, trkref, branch_code)
+
+    def get_high_water_mark(self, kind, trkref, branch_code='', locale='', sku=''):
+        """
+        Returns the newest publish date stored for an organisation, or None if it has never been synced. A sync of a
+        single SKU has its own high-water mark, separate from the one for syncs of every SKU.
+        :param kind: ReviewMirror.REVIEW | ReviewMirror.CUSTOMER_EXPERIENCE_REVIEW
+        :type kind: str
+        :param trkref: The three-character identifier for the organisation
+        :type trkref: str
+        :param branch_code: The identifier for a branch of the organisation (optional, defaults to None)
+        :type branch_code: str
+        :param locale: The locale, only used for reviews (optional, defaults to None)
+        :type locale: str
+        :param sku: The SKU synced, only used for reviews (optional, defaults to None for every SKU)
+        :type sku: str
+        """
+        row = self.connection.execute('SELECT high_water_mark FROM sync_state WHERE kind = ? AND trkref = ? AND '
+                                      'branch_code = ? AND locale = ? AND sku = ?',
+                                      (kind, trkref, branch_code, locale, sku)).fetchone()
+        return row['high_water_mark'] if row else None
+
+    def get_customer_experience_reviews_in_date_range(self, trkref, branch_code='', date_type='publish_date',
+                                                      start_date=None, end_date=None):
+        """
+        Returns the stored customer experience reviews from within a date range (inclusive), newest first
+        :param trkref: The three-character identifier for the organisation
+        :type trkref: str
+        :param branch_code: The identifier for a branch of the organisation (optional, defaults to None)
+        :type branch_code: str
+        :param date_type: 'publish_date' | 'delivery_date' | 'purchase_date'
+        :type date_type: str
+        :param start_date: date string formatted YYYY-MM-DD (optional, defaults to None)
+        :type start_date: str
+        :param end_date: date string formatted YYYY-MM-DD (optional, defaults to None)
+        :type end_date: str
+        """
+        if date_type not in self.DATE_TYPES:
+            raise ValueError('date_type must be one of %s' % ', '.join(self.DATE_TYPES))
+        query = 'SELECT data FROM reviews WHERE kind = ? AND trkref = ? AND branch_code = ?'
+        args = [self.CUSTOMER_EXPERIENCE_REVIEW, trkref, branch_code]
+        if start_date:
+            query += ' AND %s >= ?' % date_type
+            args.append(start_date)
+        if end_date:
+            query += ' AND %s <= ?' % date_type
+            args.append(end_date)
+        query += ' ORDER BY %s DESC' % date_type
+        return [decode_json(row['data']) for row in self.connection.execute(query, args)]
+
+    def get_reviews_for_sku(self, trkref, sku, locale=None, branch_code=''):
+        """
+        Returns the stored published reviews for a SKU, newest first
+        :param trkref: The three-character identifier for the organisation
+        :type trkref: str
+        :param sku: The SKU to find
+        :type sku: str
+        :param locale: The locale, reviews from every synced locale are returned if None (optional, defaults to None)
+        :type locale: str
+        :param branch_code: The identifier for a branch of the organisation (optional, defaults to None)
+        :type branch_code: str
+        """
+        query = 'SELECT data FROM reviews WHERE kind = ? AND trkref = ? AND branch_code = ? AND sku = ?'
+        args = [self.REVIEW, trkref, branch_code, sku]
+        if locale is not None:
+            query += ' AND locale = ?'
+            args.append(locale)
+        query += ' ORDER BY publish_date DESC'
+        return [decode_json(row['data']) for row in self.connection.execute(query, args)]
+
+    def __sync(self, kind, iter_reviews, trkref, branch_code='', locale='', sku=''):
+        """
+        Store the reviews published since the high-water mark, then update the mark. Reviews published on the
+        high-water mark date itself are stored again, see IncrementalReviewWalk.
+        """
+        high_water_mark = self.get_high_water_mark(kind, trkref, branch_code, locale, sku)
+        stored = 0
+        with IncrementalReviewWalk(iter_reviews, high_water_mark) as walk:
+            for review in walk:
+                self.connection.execute('INSERT OR REPLACE INTO reviews VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                        (kind, trkref, branch_code, locale, str(review['id']),
+                                         review.get('sku', sku), review.get('publish_date'),
+                                         review.get('delivery_date'), review.get('purchase_date'),
+                                         json.dumps(review)))
+                stored += 1
+        self.connection.execute('INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                (kind, trkref, branch_code, locale, sku, walk.newest_publish_date,
+                                 datetime.utcnow().isoformat()))
+        self.connection.commit()
+        return stored
+
+
+class IncrementalReviewWalk:
+    """
+    Walks reviews, newest first, until one is published before the high-water mark of the last sync, recording the
+    newest publish date seen, which is the high-water mark for the next sync. Reviews published on the high-water mark
+    date itself are walked again, as the dates aren't precise enough to tell which of them are new. Used by
+    ReviewMirror and RatingIndex, as a context manager so that the page fetching stops if the walk ends early:
+        with IncrementalReviewWalk(lambda prefetch: reevoo.iter_reviews(trkref, locale, prefetch=prefetch),
+                                   high_water_mark) as walk:
+            for review in walk:
+                ...
+        high_water_mark = walk.newest_publish_date
+    """
+
+    def __init__(self, iter_reviews, high_water_mark=None):
+        """
+        :param iter_reviews: Function taking the number of pages to prefetch and returning an iterator of reviews
+                             ordered newest first, e.g. from ReevooAPI.iter_reviews()
+        :type iter_reviews: function
+        :param high_water_mark: The newest publish date seen by the last sync, or None to walk every review (optional,
+                                defaults to None)
+        :type high_water_mark: str
+        """
+        self.high_water_mark = high_water_mark
+        self.newest_publish_date = high_water_mark
+        # a sync after the first one normally stops on the first page, so don't fetch the second one in the background
+        self.reviews = iter_reviews(0 if high_water_mark else 1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __iter__(self):
+        for review in self.reviews:
+            publish_date = review.get('publish_date')
+            if self.high_water_mark and publish_date and publish_date < self.high_water_mark:
+                return
+            if publish_date and (self.newest_publish_date is None or publish_date > self.newest_publish_date):
+                self.newest_publish_date = publish_date
+            yield review
+
+    def close(self):
+        """
+        Stop the page fetching, so the pages after the point the walk ended are never fetched
+        """
+        if hasattr(self.reviews, 'close'):
+            self.reviews.close()
+
+
+class ResumableCrawl:
+    """
+    Crawls every page of reviews or customer experience reviews for an organisation into a JSON lines file, saving a
+    checkpoint after each page. If the crawl is interrupted, running it again with the same arguments carries on from
+    the last saved page instead of starting again at page 1.
+        crawl = ResumableCrawl(reevoo, 'reviews.jsonl')
+        crawl.crawl_customer_experience_reviews(trkref)
+        for review in crawl.iter_output():
+            ...
+    The checkpoint holds the last page written, the pagination totals and the size of the output file at that point.
+    When resuming, anything written to the output after the checkpoint is truncated so that no review is written
+    twice. Pages are ordered newest first, so if reviews have been published since the checkpoint (total_pages or
+    total_entries changed) every page has shifted, which on_change decides how to handle.
+    """
+
+    RESTART = 'restart'
+    SHIFT = 'shift'
+    RAISE = 'raise'
+
+    def __init__(self, reevoo, output_path, checkpoint_path=None, on_change=RESTART):
+        """
+        :param reevoo: The client to fetch the pages with
+        :type reevoo: ReevooAPI
+        :param output_path: The JSON lines file to write the items to, one item per line
+        :type output_path: str
+        :param checkpoint_path: The checkpoint file (optional, defaults to output_path + '.checkpoint')
+        :type checkpoint_path: str
+        :param on_change: What to do if the totals have changed since the checkpoint: 'restart' starts again from page
+                          1, 'shift' skips ahead by the number of new entries (assuming they were all added at the
+                          start of the list, it restarts if entries were removed) and 'raise' raises a ValueError
+                          (optional, defaults to 'restart')
+        :type on_change: str
+        """
+        if on_change not in (self.RESTART, self.SHIFT, self.RAISE):
+            raise ValueError("on_change must be 'restart', 'shift' or 'raise'")
+        self.reevoo = reevoo
+        self.output_path = output_path
+        self.checkpoint_path = checkpoint_path or output_path + '.checkpoint'
+        self.on_change = on_change
+
+    def crawl_reviews(self, trkref, locale, branch_code='', sku='', region='', per_page=30, automotive_options=None):
+        """
+        Crawl every published review for an organisation, returns the final checkpoint. See get_review_list() for the
+        parameters.
+        """
+        params = {'kind': 'reviews', 'trkref': trkref, 'locale': locale, 'branch_code': branch_code, 'sku': sku,
+                  'region': region, 'per_page': per_page, 'automotive_options': automotive_options}
+
+        def fetch_page(page_number):
+            return self.reevoo.get_review_list(trkref, locale, branch_code, sku, region, page_number, per_page,
+                                               automotive_options)
+        return self.__crawl(params, fetch_page, 'reviews', per_page)
+
+    def crawl_customer_experience_reviews(self, trkref, branch_code='', older_reviews=False, per_page=30):
+        """
+        Crawl every customer experience review for an organisation, returns the final checkpoint. See
+        get_customer_experience_review_list() for the parameters.
+        """
+        params = {'kind': 'customer_experience_reviews', 'trkref': trkref, 'branch_code': branch_code,
+                  'older_reviews': older_reviews, 'per_page': per_page}
+
+        def fetch_page(page_number):
+            return self.reevoo.get_customer_experience_review_list(trkref, branch_code, older_reviews, page_number,
+                                                                   per_page)
+        return self.__crawl(params, fetch_page, 'customer_experience_reviews', per_page)
+
+    def crawl_customer_experience_reviews_in_date_range(self, trkref, branch_code='', date_type='publish_date',
+                                                        start_date=None, end_date=None, per_page=30):
+        """
+        Crawl the customer experience reviews within a date range, returns the final checkpoint. Only the reviews in the
+        range are written. Pages are ordered by publish date, so with date_type='publish_date' the crawl stops at the
+        first page with reviews older than start_date, for the other date types every page is read. See
+        get_customer_experience_review_list_in_date_range() for the parameters.
+        """
+        if start_date is None and end_date is None:
+            raise ValueError('Please provide at least one of: start_date, end_date')
+        params = {'kind': 'customer_experience_reviews_in_date_range', 'trkref': trkref, 'branch_code': branch_code,
+                  'date_type': date_type, 'start_date': start_date, 'end_date': end_date, 'per_page': per_page}
+        presorted = date_type == 'publish_date'
+
+        def fetch_page(page_number):
+            return self.reevoo.get_customer_experience_review_list(trkref, branch_code, True, page_number, per_page)
+
+        def filter_items(items):
+            in_range = get_items_in_date_range(items, date_type, start_date, end_date, presorted=presorted)
+            finished = presorted and start_date is not None and \
+                get_page_date_bounds(items, date_type)[0] < to_date(start_date)
+            return in_range, finished
+        return self.__crawl(params, fetch_page, 'customer_experience_reviews', per_page, filter_items)
+
+    def load_checkpoint(self):
+        """
+        Returns the saved checkpoint, or None if there isn't one
+        """
+        try:
+            with open(self.checkpoint_path) as checkpoint_file:
+                return json.load(checkpoint_file)
+        except FileNotFoundError:
+            return None
+
+    def reset(self):
+        """
+        Delete the checkpoint and the output, so the next crawl starts from the beginning
+        """
+        for path in (self.checkpoint_path, self.output_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def iter_output(self):
+        """
+        Yields the items written to the output, up to the last checkpoint
+        """
+        checkpoint = self.load_checkpoint()
+        if checkpoint is None:
+            return
+        with open(self.output_path, 'rb') as output:
+            for line in islice(output, checkpoint['items_written']):
+                yield decode_json(line)
+
+    def __save_checkpoint(self, checkpoint):
+        """
+        Write the checkpoint, see atomic_write_json()
+        """
+        atomic_write_json(self.checkpoint_path, checkpoint)
+
+    def __crawl(self, params, fetch_page, items_key, per_page, filter_items=None):
+        """
+        Write the items from every page to the output, resuming from the checkpoint if there is one, returns the final
+        checkpoint
+        :param params: The arguments of the crawl, a checkpoint is only resumed by a crawl with the same params
+        :type params: dict
+        :param fetch_page: Function taking a page number and returning the response for that page
+        :type fetch_page: function
+        :param items_key: The key of the list of items in the response content
+        :type items_key: str
+        :param per_page: The number of items per page
+        :type per_page: int
+        :param filter_items: Function taking the items on a page and returning the items to write and whether the crawl
+                             is finished (optional, defaults to None which writes every item)
+        :type filter_items: function
+        """
+        checkpoint = self.load_checkpoint()
+        if checkpoint is not None and checkpoint['params'] != params:
+            raise ValueError('%s is the checkpoint of a different crawl, use another checkpoint_path or reset() it'
+                             % self.checkpoint_path)
+        if checkpoint is not None and checkpoint['complete']:
+            return checkpoint
+        if checkpoint is None:
+            # next_item is the index of the next item to read, across all the pages
+            checkpoint = {'params': params, 'page': 0, 'next_item': 0, 'total_pages': None, 'total_entries': None,
+                          'output_offset': 0, 'items_written': 0, 'complete': False}
+
+        with open(self.output_path, 'ab') as output:
+            # drop anything written after the checkpoint was saved
+            output.truncate(checkpoint['output_offset'])
+            page_number = checkpoint['next_item'] // per_page + 1
+            content = get_page_content(fetch_page(page_number))
+            pagination = content.pagination()
+            total_pages = content.total_pages()
+            total_entries = pagination.get('total_entries')
+            if checkpoint['total_pages'] is not None and (total_pages, total_entries) != \
+                    (checkpoint['total_pages'], checkpoint['total_entries']):
+                new_entries = (total_entries or 0) - (checkpoint['total_entries'] or 0)
+                if self.on_change == self.RAISE:
+                    raise ValueError('The totals changed since the checkpoint, total_pages from %s to %s and '
+                                     'total_entries from %s to %s' % (checkpoint['total_pages'], total_pages,
+                                                                      checkpoint['total_entries'], total_entries))
+                if self.on_change == self.SHIFT and new_entries >= 0:
+                    checkpoint['next_item'] += new_entries
+                else:
+                    checkpoint.update(page=0, next_item=0, output_offset=0, items_written=0)
+                    output.truncate(0)
+                if checkpoint['next_item'] // per_page + 1 != page_number:
+                    page_number = checkpoint['next_item'] // per_page + 1
+                    content = None
+            checkpoint.update(total_pages=total_pages, total_entries=total_entries)
+
+            while page_number <= total_pages:
+                if content is None:
+                    content = get_page_content(fetch_page(page_number))
+                items = content.data.get(items_key, [])[checkpoint['next_item'] - (page_number - 1) * per_page:]
+                content = None
+                finished = False
+                if filter_items is not None:
+                    items, finished = filter_items(items)
+                output.write(b''.join(json.dumps(item).encode('utf-8') + b'\n' for item in items))
+                output.flush()
+                os.fsync(output.fileno())
+                checkpoint.update(page=page_number, next_item=page_number * per_page, output_offset=output.tell(),
+                                  items_written=checkpoint['items_written'] + len(items))
+                if finished:
+                    break
+                self.__save_checkpoint(checkpoint)
+                page_number += 1
+        checkpoint['complete'] = True
+        self.__save_checkpoint(checkpoint)
+        return checkpoint
+
+
+class OrganisationScheduler:
+    """
+    Crawls the reviews, customer experience reviews and reviewables of many organisations at once. Every page of every
+    crawl goes into one pool of max_workers threads, and the next page to fetch is picked from each crawl in turn, so a
+    large organisation can't hold up the small ones. Once the small ones are done, the large one gets every worker.
+    The total time is then roughly that of the largest organisation rather than the sum of them all.
+    The rate budget is the client's RateLimiter, which every request from every worker goes through:
+        reevoo = ReevooAPI(api_key, api_secret, rate_limiter=RateLimiter(rate=20), transport=Transport(pool_maxsize=16))
+        results = OrganisationScheduler(reevoo, max_workers=16).run(locale='en-GB')
+    """
+
+    REVIEWS = 'reviews'
+    CUSTOMER_EXPERIENCE_REVIEWS = 'customer_experience_reviews'
+    REVIEWABLES = 'reviewables'
+    KINDS = (REVIEWS, CUSTOMER_EXPERIENCE_REVIEWS, REVIEWABLES)
+
+    def __init__(self, reevoo, max_workers=8, max_workers_per_crawl=None, per_page=30):
+        """
+        :param reevoo: The client to make the requests with
+        :type reevoo: ReevooAPI
+        :param max_workers: The maximum number of requests in flight across every organisation (optional, defaults
+                            to 8)
+        :type max_workers: int
+        :param max_workers_per_crawl: The maximum number of requests in flight for one crawl (optional, defaults to
+                                      max_workers)
+        :type max_workers_per_crawl: int
+        :param per_page: The number of results to fetch per page (optional, defaults to 30)
+        :type per_page: int
+        """
+        self.reevoo = reevoo
+        self.max_workers = max_workers
+        self.max_workers_per_crawl = max_workers_per_crawl or max_workers
+        self.per_page = per_page
+
+    def get_organisations(self):
+        """
+        Returns the (trkref, branch_code) of every organisation from get_organisation_list()
+        """
+        content = get_page_content(self.reevoo.get_organisation_list())
+        return [(organisation['trkref'], organisation.get('branch_code') or '')
+                for organisation in content.organisations()]
+
+    def run(self, organisations=None, kinds=KINDS, locale=None, older_reviews=False, on_items=None):
+        """
+        Crawl every organisation, returns a list of SyncResults, one for each organisation and kind. A crawl which fails
+        doesn't stop the others, its SyncResult has the error.
+        :param organisations: (trkref, branch_code) tuples or trkrefs (optional, defaults to every organisation from
+                              get_organisation_list())
+        :type organisations: list
+        :param kinds: What to crawl: 'reviews' | 'customer_experience_reviews' | 'reviewables' (optional, defaults to
+                      all three)
+        :type kinds: tuple
+        :param locale: The locale of the reviews, required to crawl reviews
+        :type locale: str
+        :param older_reviews: Include older customer experience reviews (optional, defaults to False)
+        :type older_reviews: bool
+        :param on_items: Function called as on_items(trkref, branch_code, kind, items) with each page of items as it
+                         arrives (pages may arrive out of order), instead of collecting them in the SyncResults. It is
+                         called from the thread calling run() (optional, defaults to None)
+        :type on_items: function
+        """
+        for kind in kinds:
+            if kind not in self.KINDS:
+                raise ValueError("kinds must be 'reviews', 'customer_experience_reviews' or 'reviewables'")
+        if self.REVIEWS in kinds and not locale:
+            raise ValueError('Please provide a locale to crawl reviews')
+        if organisations is None:
+            organisations = self.get_organisations()
+        organisations = [(organisation, '') if isinstance(organisation, str) else tuple(organisation)
+                         for organisation in organisations]
+
+        crawls = [OrganisationCrawl(self.reevoo, trkref, branch_code, kind, locale, older_reviews, self.per_page)
+                  for trkref, branch_code in organisations for kind in kinds]
+        waiting = deque(crawls)
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while waiting or in_flight:
+                # round robin: give each crawl in turn one page until the workers are busy or no crawl has a page ready
+                idle_turns = 0
+                while waiting and len(in_flight) < self.max_workers and idle_turns < len(waiting):
+                    crawl = waiting[0]
+                    waiting.rotate(-1)
+                    page_number = crawl.next_page(self.max_workers_per_crawl)
+                    if page_number is None:
+                        idle_turns += 1
+                        continue
+                    idle_turns = 0
+                    in_flight[executor.submit(crawl.fetch_page, page_number)] = (crawl, page_number)
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    crawl, page_number = in_flight.pop(future)
+                    crawl.in_flight -= 1
+                    try:
+                        items = crawl.on_page(page_number, future.result())
+                    except Exception as e:
+                        crawl.error = e
+                    else:
+                        if on_items is not None:
+                            on_items(crawl.trkref, crawl.branch_code, crawl.kind, items)
+                        else:
+                            crawl.pages[page_number] = items
+                    if crawl.is_finished() and crawl in waiting:
+                        waiting.remove(crawl)
+        return [crawl.to_result(on_items is None) for crawl in crawls]
+
+
+class OrganisationCrawl:
+    """
+    The state of one organisation and kind being crawled by an OrganisationScheduler
+    """
+
+    def __init__(self, reevoo, trkref, branch_code, kind, locale=None, older_reviews=False, per_page=30):
+        self.reevoo = reevoo
+        self.trkref = trkref
+        self.branch_code = branch_code
+        self.kind = kind
+        self.locale = locale
+        self.older_reviews = older_reviews
+        self.per_page = per_page
+        # the total isn't known until page 1 has been fetched
+        self.total_pages = None
+        self.next_page_number = 1
+        self.in_flight = 0
+        self.pages = {}
+        self.page_count = 0
+        self.error = None
+
+    def next_page(self, max_in_flight):
+        """
+        Returns the next page to fetch and marks it in flight, or None if there isn't one to fetch now
+        """
+        if self.error is not None or self.in_flight >= max_in_flight:
+            return None
+        if self.total_pages is None:
+            if self.next_page_number > 1:
+                return None
+        elif self.next_page_number > self.total_pages:
+            return None
+        self.in_flight += 1
+        self.next_page_number += 1
+        return self.next_page_number - 1
+
+    def fetch_page(self, page_number):
+        """
+        Fetch a page, returns its decoded content. Called in a worker thread.
+        """
+        if self.kind == OrganisationScheduler.REVIEWS:
+            response = self.reevoo.get_review_list(self.trkref, self.locale, self.branch_code, page=page_number,
+                                                   per_page=self.per_page)
+        elif self.kind == OrganisationScheduler.CUSTOMER_EXPERIENCE_REVIEWS:
+            response = self.reevoo.get_customer_experience_review_list(self.trkref, self.branch_code,
+                                                                       self.older_reviews, page_number, self.per_page)
+        else:
+            response = self.reevoo.get_reviewable_list(self.trkref, self.branch_code)
+        return get_page_content(response)
+
+    def on_page(self, page_number, content):
+        """
+        Record a fetched page, returns its items
+        """
+        self.page_count += 1
+        if self.kind == OrganisationScheduler.REVIEWABLES:
+            # reviewables aren't paginated
+            self.total_pages = 1
+            return content.reviewables()
+        if page_number == 1:
+            self.total_pages = content.total_pages()
+        return content.data.get(self.kind, [])
+
+    def is_finished(self):
+        """
+        Returns True once every page has been fetched, or the crawl has failed and has no requests in flight
+        """
+        if self.in_flight:
+            return False
+        return self.error is not None or (self.total_pages is not None and self.next_page_number > self.total_pages)
+
+    def to_result(self, with_items=True):
+        """
+        Returns the SyncResult of the crawl, with the items in page order
+        """
+        items = None
+        if with_items:
+            items = [item for page_number in sorted(self.pages) for item in self.pages[page_number]]
+        return SyncResult(self.trkref, self.branch_code, self.kind, items, self.page_count, self.error)
+
+
+class VoteDispatcher:
+    """
+    Sends helpful/unhelpful votes to the API in the background, so that a vote doesn't add an API round trip to the
+    request which made it. vote() only adds the vote to a queue and returns straight away, a pool of worker threads
+    sends the queued votes. A vote is a POST which the API may have counted even if the response never arrived, so it
+    is only retried when it certainly wasn't counted: the connection couldn't be made (see is_connect_error()) or the
+    API throttled it with a 429/503. The API doesn't detect duplicate votes, so a vote from the same user for the same
+    target in the same direction within dedup_window seconds of an earlier one is dropped. A vote which couldn't be
+    sent isn't counted as an earlier one, so it can be made again.
+        dispatcher = VoteDispatcher(reevoo)
+        dispatcher.vote(user_id, VoteDispatcher.REVIEW, review_id, VoteDispatcher.UP, trkref)
+        ...
+        dispatcher.close()  # sends the queued votes before returning
+    """
+
+    REVIEW = 'review'
+    QUESTION = 'question'
+    ANSWER = 'answer'
+    UP = 'up'
+    DOWN = 'down'
+
+    def __init__(self, reevoo, max_workers=2, dedup_window=3600, max_queue_size=10000, max_retries=3,
+                 on_error=None):
+        """
+        :param reevoo: The client to send the votes with
+        :type reevoo: ReevooAPI
+        :param max_workers: The number of threads sending votes (optional, defaults to 2)
+        :type max_workers: int
+        :param dedup_window: Seconds for which a repeat of a vote is dropped (optional, defaults to 3600, 0 to keep
+                             every vote)
+        :type dedup_window: float
+        :param max_queue_size: The maximum number of votes waiting to be sent, votes are dropped while the queue is
+                               full (optional, defaults to 10000)
+        :type max_queue_size: int
+        :param max_retries: The number of times a vote is retried (optional, defaults to 3)
+        :type max_retries: int
+        :param on_error: Function called as on_error(vote, error) from a worker thread when a vote couldn't be sent,
+                         error is the last response or exception (optional, defaults to None)
+        :type on_error: function
+        """
+        self.reevoo = reevoo
+        self.dedup_window = dedup_window
+        self.max_retries = max_retries
+        self.on_error = on_error
+        self.accepted = 0
+        self.duplicates = 0
+        self.dropped = 0
+        self.sent = 0
+        self.failed = 0
+        self.closed = False
+        # vote key -> time it was accepted, oldest first
+        self.__recent_votes = OrderedDict()
+        self.__pending = 0
+        self.__condition = threading.Condition()
+        self.__queue = queue.Queue(max_queue_size)
+        self.__workers = [threading.Thread(target=self.__work, name='VoteDispatcher-%d' % index, daemon=True)
+                          for index in range(max_workers)]
+        for worker in self.__workers:
+            worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def vote(self, user_id, target_type, target_id, direction, trkref=''):
+        """
+        Queue a vote, returns True if it was queued and False if it was a duplicate or the queue was full. Never blocks.
+        :param user_id: The identifier of the user voting, used to detect duplicate votes
+        :type user_id: str
+        :param target_type: 'review' | 'question' | 'answer'
+        :type target_type: str
+        :param target_id: The ID of the review, question or answer
+        :type target_id: str
+        :param direction: 'up' | 'down'
+        :type direction: str
+        :param trkref: The organisation (optional for reviews)
+        :type trkref: str
+        """
+        if (target_type, direction) not in VOTE_METHODS:
+            raise ValueError("target_type must be 'review', 'question' or 'answer' and direction 'up' or 'down'")
+        if self.closed:
+            raise RuntimeError('The VoteDispatcher has been closed')
+        key = (user_id, target_type, target_id, direction)
+        with self.__condition:
+            now = time.monotonic()
+            while self.__recent_votes:
+                oldest_key, accepted_at = next(iter(self.__recent_votes.items()))
+                if now - accepted_at < self.dedup_window:
+                    break
+                del self.__recent_votes[oldest_key]
+            if key in self.__recent_votes:
+                self.duplicates += 1
+                return False
+            try:
+                self.__queue.put_nowait(Vote(user_id, target_type, target_id, direction, trkref))
+            except queue.Full:
+                self.dropped += 1
+                return False
+            if self.dedup_window:
+                self.__recent_votes[key] = now
+            self.accepted += 1
+            self.__pending += 1
+        return True
+
+    def flush(self, timeout=None):
+        """
+        Wait until every queued vote has been sent (or has failed), returns False if the timeout ran out first
+        :param timeout: The maximum number of seconds to wait (optional, defaults to None to wait as long as it takes)
+        :type timeout: float
+        """
+        with self.__condition:
+            return self.__condition.wait_for(lambda: self.__pending == 0, timeout)
+
+    def close(self, timeout=None):
+        """
+        Stop accepting votes, send the queued votes and stop the worker threads. Returns False if the timeout ran out
+        before every vote was sent.
+        :param timeout: The maximum number of seconds to wait (optional, defaults to None to wait as long as it takes)
+        :type timeout: float
+        """
+        self.closed = True
+        flushed = self.flush(timeout)
+        if flushed:
+            for _ in self.__workers:
+                self.__queue.put(None)
+            for worker in self.__workers:
+                worker.join()
+        return flushed
+
+    def stats(self):
+        """
+        Returns the counts of votes accepted, dropped as duplicates, dropped because the queue was full, sent and
+        failed, and the number still to be sent
+        """
+        with self.__condition:
+            return {'accepted': self.accepted, 'duplicates': self.duplicates, 'dropped': self.dropped,
+                    'sent': self.sent, 'failed': self.failed, 'pending': self.__pending}
+
+    def __work(self):
+        """
+        Send votes from the queue until given None
+        """
+        while True:
+            vote = self.__queue.get()
+            if vote is None:
+                return
+            try:
+                sent = self.__send(vote)
+            except Exception:
+                # a worker which died would leave flush() waiting forever, count the vote as failed instead
+                sent = False
+            with self.__condition:
+                if sent:
+                    self.sent += 1
+                else:
+                    self.failed += 1
+                    # the vote wasn't counted, so the user can make it again
+                    self.__recent_votes.pop((vote.user_id, vote.target_type, vote.target_id, vote.direction), None)
+                self.__pending -= 1
+                self.__condition.notify_all()
+
+    def __send(self, vote):
+        """
+        Send a vote, retrying only failures which the API can't have counted (connection errors before the request was
+        sent and 429/503 responses), returns True if the API accepted it
+        """
+        send_vote = getattr(self.reevoo, VOTE_METHODS[(vote.target_type, vote.direction)])
+        attempt = 0
+        while True:
+            retry_after = None
+            try:
+                if vote.target_type == self.REVIEW:
+                    response = send_vote(vote.target_id, vote.trkref)
+                else:
+                    response = send_vote(vote.trkref, vote.target_id)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+                # a read timeout or a dropped connection may come after the API counted the vote
+                can_retry = is_connect_error(e)
+            else:
+                if response.status_code < 400:
+                    return True
+                error = response
+                # a 502/504 may come from a proxy after the API counted the vote
+                can_retry = response.status_code in THROTTLE_STATUS_CODES
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if not can_retry or attempt >= self.max_retries or (retry_after is not None and
+                                                                retry_after > RETRY_BACKOFF_MAX):
+                if self.on_error is not None:
+                    self.on_error(vote, error)
+                return False
+            time.sleep(retry_after if retry_after is not None else get_retry_backoff(attempt))
+            attempt += 1
+
+
+class PurchaserResolver(RequestHook):
+    """
+    Looks up many purchasers at once. get_purchaser_detail() and get_purchaser_list() take one email, so resolve() and
+    resolve_purchases() send the lookups for a list of emails concurrently and cache the results: purchasers which
+    were found for ttl seconds and those which weren't (a 404) for negative_ttl seconds. The resolver adds itself to
+    the client's hooks, so purchasers created or updated with that client's set_purchaser_create() and
+    set_purchaser_update() are dropped from the cache and fetched again the next time they are resolved.
+        resolver = PurchaserResolver(reevoo)
+        purchasers = resolver.resolve(trkref, emails)  # {email: purchaser or None if there is no such purchaser}
+    """
+
+    DETAIL = 'detail'
+    PURCHASES = 'purchases'
+
+    def __init__(self, reevoo, ttl=300, negative_ttl=60, max_entries=10000, max_workers=8):
+        """
+        :param reevoo: The client to look the purchasers up with
+        :type reevoo: ReevooAPI
+        :param ttl: The number of seconds a purchaser which was found is cached for (optional, defaults to 300)
+        :type ttl: float
+        :param negative_ttl: The number of seconds an email with no purchaser is cached for (optional, defaults to 60)
+        :type negative_ttl: float
+        :param max_entries: The maximum number of results to keep (optional, defaults to 10000)
+        :type max_entries: int
+        :param max_workers: The maximum number of concurrent lookups (optional, defaults to 8)
+        :type max_workers: int
+        """
+        self.reevoo = reevoo
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_workers = max_workers
+        self.cache = ResponseCache(max_entries=max_entries, ttl=ttl)
+        self.negative_hits = 0
+        self.invalidations = 0
+        # (trkref, email) -> [number of lookups in flight, invalidated while they were in flight]
+        self.__in_flight = {}
+        self.__lock = threading.Lock()
+        reevoo.hooks.append(self)
+
+    def resolve(self, trkref, emails):
+        """
+        Returns a dict of the purchaser for each email, None for the emails with no purchaser. Raises requests.HTTPError
+        if a lookup failed with any other error.
+        :param trkref: The three-character identifier for the organisation
+        :type trkref: str
+        :param emails: The emails of the purchasers
+        :type emails: list
+        """
+        return self.__resolve(self.DETAIL, trkref, emails)
+
+    def resolve_purchases(self, trkref, emails):
+        """
+        Returns a dict of the list of purchases made by the purchaser with each email, None for the emails with no
+        purchaser. Raises requests.HTTPError if a lookup failed with any other error.
+        :param trkref: The three-character identifier for the organisation
+        :type trkref: str
+        :param emails: The emails of the purchasers
+        :type emails: list
+        """
+        return self.__resolve(self.PURCHASES, trkref, emails)
+
+    def get(self, trkref, email):
+        """
+        Returns the purchaser with an email, or None if there is no such purchaser
+        :param trkref: The three-character identifier for the organisation
+        :type trkref: str
+        :param email: The email of the purchaser
+        :type email: str
+        """
+        return self.resolve(trkref, [email])[email]
+
+    def invalidate(self, trkref=None, email=None):
+        """
+        Drop the cached results for an email, or every cached result if no email is given
+        :param trkref: The three-character identifier for the organisation
+        :type trkref: str
+        :param email: The email of the purchaser
+        :type email: str
+        """
+        with self.__lock:
+            self.invalidations += 1
+            if email is None:
+                self.cache.clear()
+                for flight in self.__in_flight.values():
+                    flight[1] = True
+                return
+            for kind in (self.DETAIL, self.PURCHASES):
+                self.cache.delete((kind, trkref, email))
+            if (trkref, email) in self.__in_flight:
+                self.__in_flight[(trkref, email)][1] = True
+
+    def stats(self):
+        """
+        Returns the counts of cache hits (negative_hits of them for emails with no purchaser), misses and invalidations
+        and the number of cached results
+        """
+        stats = self.cache.stats()
+        with self.__lock:
+            return {'hits': stats['hits'], 'negative_hits': self.negative_hits, 'misses': stats['misses'],
+                    'invalidations': self.invalidations, 'size': stats['size']}
+
+    def clear(self):
+        """
+        Removes every cached result (the counters are kept)
+        """
+        self.cache.clear()
+
+    def after_request(self, event):
+        """
+        Invalidate the cached results for purchasers created or updated through the client
+        :param event: The request
+        :type event: RequestEvent
+        """
+        if event.method != 'POST':
+            return
+        segments = event.path.split('?', 1)[0].split('/')
+        if event.route == '/v4/organisations/{trkref}/purchasers/{email}':
+            self.invalidate(segments[3], segments[5])
+        elif event.route == '/v4/organisations/{trkref}/purchasers':
+            email = event.data.get('email') if isinstance(event.data, dict) else None
+            # without the email there is no telling which purchaser was created, so drop everything
+            self.invalidate(segments[3] if email else None, email)
+
+    def __resolve(self, kind, trkref, emails):
+        """
+        Returns a dict of the result for each email, looking up those which aren't cached concurrently
+        """
+        results = {}
+        missing = []
+        seen = set()
+        for email in emails:
+            if email in seen:
+                continue
+            seen.add(email)
+            cached = self.cache.get((kind, trkref, email))
+            if cached is not None and cached[1]:
+                self.cache.record('hits')
+                if cached[0] is None:
+                    with self.__lock:
+                        self.negative_hits += 1
+                results[email] = cached[0]
+            else:
+                self.cache.record('misses')
+                missing.append(email)
+        if len(missing) == 1:
+            results[missing[0]] = self.__fetch(kind, trkref, missing[0])
+        elif missing:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(missing))) as executor:
+                for email, result in zip(missing, executor.map(lambda email: self.__fetch(kind, trkref, email),
+                                                               missing)):
+                    results[email] = result
+        return results
+
+    def __fetch(self, kind, trkref, email):
+        """
+        Look up one email and cache the result, unless the purchaser was created or updated while it was being fetched
+        """
+        with self.__lock:
+            flight = self.__in_flight.setdefault((trkref, email), [0, False])
+            flight[0] += 1
+        try:
+            if kind == self.DETAIL:
+                response = self.reevoo.get_purchaser_detail(trkref, email)
+            else:
+                response = self.reevoo.get_purchaser_list(trkref, email)
+            if response.status_code == 404:
+                result, ttl = None, self.negative_ttl
+            else:
+                response.raise_for_status()
+                content = decode_response(response)
+                result, ttl = (content.data if kind == self.DETAIL else content.purchases()), self.ttl
+            with self.__lock:
+                if not flight[1] and ttl > 0:
+                    self.cache.set((kind, trkref, email), result, ttl)
+            return result
+        finally:
+            with self.__lock:
+                flight[0] -= 1
+                if flight[0] == 0:
+                    del self.__in_flight[(trkref, email)]
+
+
+class RatingIndex:
+    """
+    Thread-safe in-memory index of review score aggregates per SKU, branch and locale, so that average scores and score
+    histograms can be served without any API calls. Reviews are added one at a time as they are streamed (or by
+    sync(), which only fetches the reviews published since the last sync) and each one updates the count, score total,
+    score histogram and per-day recent counts of its SKU. So get() is a dict lookup plus a sum over at most window_days
+    per-day totals, however many reviews there are. Pass None as the branch_code or locale to get the figures over
+    every branch or locale. The index can be saved to a JSON file and is loaded from it when created, so it starts
+    warm.
+    Review IDs are kept to skip reviews added twice, but only for the reviews sync() can see again: those published on
+    or after the oldest high-water mark of their organisation (and those without a publish date). So once an
+    organisation has been synced, add() only skips repeats of those reviews.
+        index = RatingIndex('ratings.json')
+        index.sync(reevoo, trkref, 'en-GB')
+        index.save()
+        summary = index.get(trkref, sku, locale='en-GB')  # RatingSummary(count, mean, distribution, ...)
+    """
+
+    VERSION = 2
+
+    def __init__(self, path=None, window_days=30):
+        """
+        :param path: The JSON file the index is saved to, loaded if it exists (optional, defaults to None)
+        :type path: str
+        :param window_days: The number of days, up to and including the as_of date, counted by recent_count and
+                            recent_mean (optional, defaults to 30)
+        :type window_days: int
+        """
+        self.path = path
+        self.window_days = window_days
+        # (trkref, sku, branch_code, locale) -> RatingAggregate, with None branch codes and locales for the totals
+        self.__aggregates = {}
+        # (trkref, branch_code, locale) -> newest publish date synced
+        self.__high_water_marks = {}
+        # trkref -> {review ID: publish date as a date ordinal, or None}
+        self.__review_ids = {}
+        self.__lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        with self.__lock:
+            return sum(aggregate.count for key, aggregate in self.__aggregates.items() if key[2:] == (None, None))
+
+    def add(self, review, trkref, branch_code='', locale=''):
+        """
+        Add a published review to the index, returns False if it was already added or has no SKU or score
+        :param review: A review from get_review_list() or iter_reviews(), as a dict or Review record
+        :type review: dict
+        :param trkref: The three-character identifier for the organisation
+        :type trkref: str
+        :param branch_code: The branch code to use if the review doesn't have one (optional, defaults to None)
+        :type branch_code: str
+        :param locale: The locale to use if the review doesn't have one (optional, defaults to None)
+        :type locale: str
+        """
+        sku = review.get('sku')
+        score = review.get('overall_score')
+        if sku is None or score is None:
+            return False
+        review_id = str(review.get('id'))
+        publish_date = review.get('publish_date')
+        day = to_date(publish_date).toordinal() if publish_date else None
+        branch_code = review.get('branch_code') or branch_code
+        locale = review.get('locale') or locale
+        with self.__lock:
+            review_ids = self.__review_ids.setdefault(trkref, {})
+            if review_id in review_ids:
+                return False
+            oldest_mark = self.__get_oldest_high_water_mark(trkref)
+            if day is None or oldest_mark is None or day >= oldest_mark:
+                review_ids[review_id] = day
+            for key in ((trkref, sku, branch_code, locale), (trkref, sku, branch_code, None),
+                        (trkref, sku, None, locale), (trkref, sku, None, None)):
+                aggregate = self.__aggregates.get(key)
+                if aggregate is None:
+                    aggregate = self.__aggregates[key] = RatingAggregate()
+                aggregate.add(score, day, self.window_days)
+        return True
+
+    def add_reviews(self, reviews, trkref, branch_code='', locale=''):
+        """
+        Add published reviews to the index, returns the number which weren't already in it. See add() for the
+        parameters.
+        """
+        return sum(1 for review in reviews if self.add(review, trkref, branch_code, locale))
+
+    def sync(self, reevoo, trkref, locale, branch_code='', per_page=100):
+        """
+        Add the reviews published since the last sync of an organisation, returns the number added. Reviews are
+        fetched newest first until one is older than the newest publish date seen by the last sync.
+        :param reevoo: The client to fetch the reviews with
+        :type reevoo: ReevooAPI
+        :param trkref: The three-character identifier for the organisation
+        :type trkref: str
+        :param locale: The locale (e.g. en-GB)
+        :type locale: str
+        :param branch_code: The identifier for a branch of the organisation (optional, defaults to None)
+        :type branch_code: str
+        :param per_page: The number of results to fetch per page (optional, defaults to 100)
+        :type per_page: int
+        """
+        def iter_reviews(prefetch):
+            return reevoo.iter_reviews(trkref, locale, branch_code, per_page=per_page, prefetch=prefetch)
+
+        with self.__lock:
+            high_water_mark = self.__high_water_marks.get((trkref, branch_code, locale))
+        added = 0
+        with IncrementalReviewWalk(iter_reviews, high_water_mark) as walk:
+            for review in walk:
+                # reviews published on the high-water mark date are seen again, add() skips them by ID
+                if self.add(review, trkref, branch_code, locale):
+                    added += 1
+        with self.__lock:
+            self.__high_water_marks[(trkref, branch_code, locale)] = walk.newest_publish_date
+            self.__prune_review_ids(trkref)
+        return added
+
+    def get(self, trkref, sku, branch_code=None, locale=None, as_of=None):
+        """
+        Returns the RatingSummary for a SKU, or None if it has no reviews
+        :param trkref: The three-character identifier for the organisation
+        :type trkref: str
+        :param sku: The SKU
+        :type sku: str
+        :param branch_code: The identifier for a branch, or None for every branch (optional, defaults to None)
+        :type branch_code: str
+        :param locale: The locale, or None for every locale (optional, defaults to None)
+        :type locale: str
+        :param as_of: The last day of the recent window, which is only complete if as_of isn't before the SKU's
+                      newest review (optional, defaults to today)
+        :type as_of: datetime | date | str
+        """
+        as_of = to_date(as_of) if as_of else date.today()
+        with self.__lock:
+            aggregate = self.__aggregates.get((trkref, sku, branch_code, locale))
+            if aggregate is None:
+                return None
+            return aggregate.summary(as_of.toordinal(), self.window_days)
+
+    def get_skus(self, trkref):
+        """
+        Returns the SKUs of an organisation which have reviews in the index
+        :param trkref: The three-character identifier for the organisation
+        :type trkref: str
+        """
+        with self.__lock:
+            return sorted(key[1] for key in self.__aggregates if key[0] == trkref and key[2:] == (None, None))
+
+    def get_high_water_mark(self, trkref, branch_code='', locale=''):
+        """
+        Returns the newest publish date seen by sync() for an organisation, or None if it has never been synced
+        :param trkref: The three-character identifier for the organisation
+        :type trkref: str
+        :param branch_code: The identifier for a branch of the organisation (optional, defaults to None)
+        :type branch_code: str
+        :param locale: The locale (optional, defaults to None)
+        :type locale: str
+        """
+        with self.__lock:
+            return self.__high_water_marks.get((trkref, branch_code, locale))
+
+    def clear(self):
+        """
+        Removes every review and high-water mark from the index
+        """
+        with self.__lock:
+            self.__aggregates.clear()
+            self.__high_water_marks.clear()
+            self.__review_ids.clear()
+
+    def __get_oldest_high_water_mark(self, trkref):
+        """
+        Returns the oldest high-water mark of an organisation as a date ordinal, or None if any sync of it has no mark.
+        sync() never sees a review published before it again, so the IDs of those reviews don't need to be kept.
+        """
+        marks = [mark for key, mark in self.__high_water_marks.items() if key[0] == trkref]
+        if not marks or None in marks:
+            return None
+        return min(to_date(mark) for mark in marks).toordinal()
+
+    def __prune_review_ids(self, trkref):
+        """
+        Drop the IDs of an organisation's reviews published before its oldest high-water mark
+        """
+        oldest_mark = self.__get_oldest_high_water_mark(trkref)
+        review_ids = self.__review_ids.get(trkref)
+        if oldest_mark is None or not review_ids:
+            return
+        for review_id in [review_id for review_id, day in review_ids.items() if day is not None and day < oldest_mark]:
+            del review_ids[review_id]
+
+    def save(self, path=None):
+        """
+        Write the index to the file, see atomic_write_json()
+        :param path: The file to save to (optional, defaults to the path the index was created with)
+        :type path: str
+        """
+        path = path or self.path
+        if not path:
+            raise ValueError('No path to save the index to')
+        with self.__lock:
+            data = {
+                'version': self.VERSION,
+                'window_days': self.window_days,
+                'aggregates': [list(key) + aggregate.to_list() for key, aggregate in self.__aggregates.items()],
+                'high_water_marks': [list(key) + [mark] for key, mark in self.__high_water_marks.items()],
+                'review_ids': [[trkref, review_id, day] for trkref, review_ids in self.__review_ids.items()
+                               for review_id, day in review_ids.items()],
+            }
+        atomic_write_json(path, data, separators=(',', ':'))
+
+    def load(self, path=None):
+        """
+        Replace the contents of the index with those saved in a file
+        :param path: The file to load (optional, defaults to the path the index was created with)
+        :type path: str
+        """
+        path = path or self.path
+        with open(path) as index_file:
+            data = decode_json(index_file.read())
+        if data.get('version') != self.VERSION:
+            raise ValueError('%s is not a version %d rating index' % (path, self.VERSION))
+        if data['window_days'] != self.window_days:
+            # the per-day counts outside the saved window were dropped, so they can't be counted again
+            raise ValueError('%s was saved with window_days=%d' % (path, data['window_days']))
+        with self.__lock:
+            self.__aggregates = dict((tuple(row[:4]), RatingAggregate.from_list(row[4:]))
+                                     for row in data['aggregates'])
+            self.__high_water_marks = dict((tuple(row[:3]), row[3]) for row in data['high_water_marks'])
+            self.__review_ids = {}
+            for trkref, review_id, day in data['review_ids']:
+                self.__review_ids.setdefault(trkref, {})[review_id] = day
+
+
+class RatingAggregate:
+    """
+    The running score totals for one key of a RatingIndex. Per-day counts are only kept for the window_days up to the
+    newest review, which is all a recent window ending today can need.
+    """
+
+    __slots__ = ('count', 'total', 'distribution', 'newest_day', 'days')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        # score -> number of reviews
+        self.distribution = {}
+        # the newest publish date as a date ordinal, and date ordinal -> [number of reviews, score total]
+        self.newest_day = None
+        self.days = {}
+
+    def add(self, score, day, window_days):
+        """
+        Add one review's score, day is its publish date as a date ordinal (or None if it doesn't have one)
+        """
+        self.count += 1
+        self.total += score
+        self.distribution[score] = self.distribution.get(score, 0) + 1
+        if day is None:
+            return
+        if self.newest_day is None or day > self.newest_day:
+            self.newest_day = day
+            for old_day in [old_day for old_day in self.days if old_day <= day - window_days]:
+                del self.days[old_day]
+        if day > self.newest_day - window_days:
+            totals = self.days.get(day)
+            if totals is None:
+                totals = self.days[day] = [0, 0]
+            totals[0] += 1
+            totals[1] += score
+
+    def summary(self, as_of, window_days):
+        """
+        Returns a RatingSummary with the recent window ending on as_of (a date ordinal)
+        """
+        recent_count = 0
+        recent_total = 0
+        for day, totals in self.days.items():
+            if as_of - window_days < day <= as_of:
+                recent_count += totals[0]
+                recent_total += totals[1]
+        return RatingSummary(self.count, self.total / self.count, dict(self.distribution), recent_count,
+                             recent_total / recent_count if recent_count else None)
+
+    def to_list(self):
+        """
+        Returns the aggregate as a JSON serialisable list
+        """
+        return [self.count, self.total, list(self.distribution.items()), self.newest_day,
+                [[day] + totals for day, totals in self.days.items()]]
+
+    @classmethod
+    def from_list(cls, values):
+        """
+        Creates an aggregate from a list returned by to_list()
+        """
+        aggregate = cls()
+        aggregate.count, aggregate.total, distribution, aggregate.newest_day, days = values
+        aggregate.distribution = dict((score, count) for score, count in distribution)
+        aggregate.days = dict((row[0], row[1:]) for row in days)
+        return aggregate
+
+
+def dict_to_url_args(args):
+    """
+    Converts a dictionary to a string of GET arguments to be used in a URL
+    :param args: The dictionary of arguments
+    :type args: dict
+    """
+    url_args = ''
+    for key in args:
+        val = args[key]
+        url_args += val + '=' + str(key) + '&'
+    return url_args
+
+
+def get_items_in_date_range(list_of_items, publish_or_delivery, start_date=None, end_date=None,
+                            start_date_include=True, end_date_include=True, presorted=False):
+    """
+    Checks a page of results and returns a list of those that are within a date range. Items without the date are left
+    out. Dates are parsed once per distinct value, so filtering is cheap for long lists, which are filtered with NumPy
+    if it is installed. If the items are already sorted by the date (newest or oldest first) pass presorted=True and
+    the range is found by bisection instead of checking every item.
+    :param list_of_items: The list of items to check the dates for
+    :type list_of_items: list
+    :param publish_or_delivery: the key of the date to check, e.g. 'publish_date' | 'delivery_date' | 'purchase_date'
+    :type publish_or_delivery: str
+    :param start_date: (optional, defaults to None for no start date)
+    :type start_date: datetime | date | str
+    :param end_date: (optional, defaults to None for no end date)
+    :type end_date: datetime | date | str
+    :param start_date_include: Include items on the start date (optional, defaults to True)
+    :type start_date_include: bool
+    :param end_date_include: Include items on the end date (optional, defaults to True)
+    :type end_date_include: bool
+    :param presorted: The items are sorted by the date (optional, defaults to False)
+    :type presorted: bool
+    """
+    start_date = to_date(start_date) if start_date else None
+    end_date = to_date(end_date) if end_date else None
+
+    def is_after_start(item_date):
+        return start_date is None or item_date > start_date or (start_date_include and item_date == start_date)
+
+    def is_before_end(item_date):
+        return end_date is None or item_date < end_date or (end_date_include and item_date == end_date)
+
+    def get_item_date(index):
+        value = list_of_items[index].get(publish_or_delivery)
+        return parse_iso_date(value) if value else None
+
+    if presorted and list_of_items:
+        if not all(item.get(publish_or_delivery) for item in list_of_items):
+            # items without the date are left out anyway, and would break the bisection
+            list_of_items = [item for item in list_of_items if item.get(publish_or_delivery)]
+        first_date = get_item_date(0) if list_of_items else None
+        last_date = get_item_date(len(list_of_items) - 1) if list_of_items else None
+        if first_date is not None and last_date is not None:
+            if first_date <= last_date:
+                low = bisect_first(0, len(list_of_items), lambda i: is_after_start(get_item_date(i)))
+                high = bisect_first(low, len(list_of_items), lambda i: not is_before_end(get_item_date(i)))
+            else:
+                low = bisect_first(0, len(list_of_items), lambda i: is_before_end(get_item_date(i)))
+                high = bisect_first(low, len(list_of_items), lambda i: not is_after_start(get_item_date(i)))
+            return list_of_items[low:high]
+
+    if numpy is not None and len(list_of_items) >= NUMPY_MIN_ITEMS:
+        values = (item.get(publish_or_delivery) for item in list_of_items)
+        dates = numpy.array([value[:10] if value else 'NaT' for value in values], dtype='datetime64[D]')
+        mask = ~numpy.isnat(dates)
+        if start_date:
+            start = numpy.datetime64(start_date, 'D')
+            mask &= (dates >= start) if start_date_include else (dates > start)
+        if end_date:
+            end = numpy.datetime64(end_date, 'D')
+            mask &= (dates <= end) if end_date_include else (dates < end)
+        return list(compress(list_of_items, mask))
+
+    list_of_items_in_date = []
+    for item in list_of_items:
+        value = item.get(publish_or_delivery)
+        if value:
+            item_date = parse_iso_date(value)
+            if is_after_start(item_date) and is_before_end(item_date):
+                list_of_items_in_date.append(item)
+    return list_of_items_in_date
+
+
+def reviews_to_columns(reviews, fields=None):
+    """
+    Converts reviews to a dict of NumPy arrays, one per field, for vectorised analysis. Scores and votes become float
+    arrays (NaN where missing), dates become datetime64[D] arrays (NaT where missing), IDs become an object array and
+    SKUs, branch codes and locales become CategoricalColumn tuples of integer codes and the distinct values. Fields
+    which none of the reviews have are left out.
+    The reviews can be a response from get_review_list() or get_customer_experience_review_list(), a list of dicts or
+    records, or any iterable such as iter_reviews(), which is read in a single pass without keeping the reviews.
+    Requires NumPy.
+    :param reviews: The reviews to convert
+    :type reviews: requests.Response | iterable
+    :param fields: The fields to export (optional, defaults to every field in COLUMN_TYPES)
+    :type fields: list
+    """
+    if numpy is None:
+        raise ImportError('reviews_to_columns() requires numpy, install it with "pip install numpy"')
+    if isinstance(reviews, requests.Response):
+        content = decode_response(reviews)
+        reviews = content.reviews() or content.customer_experience_reviews()
+    fields = list(fields or COLUMN_TYPES)
+    missing_date = numpy.datetime64('NaT').astype('int64').item()
+    epoch = date(1970, 1, 1).toordinal()
+    # values are collected in compact typed arrays (codes for categories, days since 1970 for dates)
+    values = {}
+    category_codes = {}
+    for field in fields:
+        column_type = COLUMN_TYPES.get(field, 'str')
+        if column_type == 'category':
+            values[field] = array('i')
+            category_codes[field] = {}
+        elif column_type == 'float':
+            values[field] = array('d')
+        elif column_type == 'date':
+            values[field] = array('q')
+        else:
+            values[field] = []
+    present = set()
+    for review in reviews:
+        for field in fields:
+            value = review.get(field)
+            if value is not None:
+                present.add(field)
+            column_type = COLUMN_TYPES.get(field, 'str')
+            if column_type == 'category':
+                if value is None:
+                    values[field].append(-1)
+                else:
+                    values[field].append(category_codes[field].setdefault(value, len(category_codes[field])))
+            elif column_type == 'float':
+                try:
+                    values[field].append(float(value))
+                except (TypeError, ValueError):
+                    values[field].append(float('nan'))
+            elif column_type == 'date':
+                values[field].append(parse_iso_date(value).toordinal() - epoch if value else missing_date)
+            else:
+                values[field].append(value)
+
+    columns = OrderedDict()
+    for field in fields:
+        if field not in present:
+            continue
+        column_type = COLUMN_TYPES.get(field, 'str')
+        if column_type == 'category':
+            categories = numpy.array(list(category_codes[field]), dtype=object)
+            columns[field] = CategoricalColumn(numpy.frombuffer(values[field], dtype=numpy.int32), categories)
+        elif column_type == 'float':
+            columns[field] = numpy.frombuffer(values[field], dtype=numpy.float64)
+        elif column_type == 'date':
+            columns[field] = numpy.frombuffer(values[field], dtype=numpy.int64).view('datetime64[D]')
+        else:
+            columns[field] = numpy.array(values[field], dtype=object)
+    return columns
+
+
+def reviews_to_dataframe(reviews, fields=None):
+    """
+    Converts reviews to a pandas DataFrame with one row per review. Takes the same arguments as reviews_to_columns(),
+    SKUs, branch codes and locales become categorical columns. Requires NumPy and pandas.
+    :param reviews: The reviews to convert
+    :type reviews: requests.Response | iterable
+    :param fields: The fields to export (optional, defaults to every field in COLUMN_TYPES)
+    :type fields: list
+    """
+    if pandas is None:
+        raise ImportError('reviews_to_dataframe() requires pandas, install it with "pip install pandas"')
+    columns = reviews_to_columns(reviews, fields)
+    data = OrderedDict()
+    for field, column in columns.items():
+        if isinstance(column, CategoricalColumn):
+            data[field] = pandas.Categorical.from_codes(column.codes, column.categories)
+        else:
+            data[field] = column
+    return pandas.DataFrame(data)
+
+
+@lru_cache(maxsize=8192)
+def parse_iso_date(value):
+    """
+    Parses a date string formatted YYYY-MM-DD (anything after the date, such as a time, is ignored). Results are
+    memoised, as a page of results only has a few distinct dates.
+    :param value: The date string
+    :type value: str
+    """
+    return date(int(value[0:4]), int(value[5:7]), int(value[8:10]))
+
+
+def to_date(value):
+    """
+    Converts a datetime, date or YYYY-MM-DD string to a date
+    :param value: The value to convert
+    :type value: datetime | date | str
+    """
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return parse_iso_date(value)
+
+
+def httpx_to_requests_response(httpx_response):
+    """
+    Converts an httpx response into a requests.Response so that responses from AsyncReevooAPI have the same attributes
+    (status_code, reason, text, content, json()) as responses from ReevooAPI
+    :param httpx_response: The response returned by httpx
+    :type httpx_response: httpx.Response
+    """
+    response = requests.Response()
+    response.status_code = httpx_response.status_code
+    response.reason = httpx_response.reason_phrase
+    response.headers = CaseInsensitiveDict(httpx_response.headers)
+    response.url = str(httpx_response.url)
+    response.encoding = httpx_response.encoding
+    response._content = httpx_response.content
+    return response
+
+
+def httpx_to_requests_error(error):
+    """
+    Converts an httpx transport error into the equivalent requests exception, so that failed requests sent with httpx
+    are retried in the same way as with Transport
+    :param error: The error raised by httpx
+    :type error: httpx.TransportError
+    """
+    if isinstance(error, httpx.ConnectTimeout):
+        return requests.ConnectTimeout(error)
+    if isinstance(error, httpx.TimeoutException):
+        return requests.ReadTimeout(error)
+    return requests.ConnectionError(error)
+
+
+def to_httpx_timeout(timeout):
+    """
+    Converts a requests style timeout, a (connect, read) tuple or one number for both, to an httpx timeout
+    :param timeout: The timeout in seconds, None for no timeout
+    :type timeout: tuple | float
+    """
+    if isinstance(timeout, tuple):
+        connect_timeout, read_timeout = timeout
+        return httpx.Timeout(read_timeout, connect=connect_timeout)
+    return httpx.Timeout(timeout)
+
+
+def path_to_route_template(path):
+    """
+    Converts a request path to its route template by dropping the query string and replacing the identifiers with
+    placeholders, e.g. '/v4/organisations/ABC/reviews?page=2' becomes '/v4/organisations/{trkref}/reviews'
+    :param path: The URI path
+    :type path: str
+    """
+    segments = path.split('?', 1)[0].split('/')
+    template = segments[:1]
+    for previous, segment in zip(segments, segments[1:]):
+        if segment and previous in ROUTE_PLACEHOLDERS:
+            template.append(ROUTE_PLACEHOLDERS[previous])
+        else:
+            template.append(segment)
+    return '/'.join(template)
+
+
+@contextmanager
+def hook_request(hooks, method, path, data=None):
+    """
+    Context manager calling the hooks before and after a request, yields the RequestEvent to record the request in (or
+    None if there are no hooks). An exception raised by the request is recorded in the event and re-raised.
+    :param hooks: The RequestHooks
+    :type hooks: list
+    :param method: GET | POST
+    :type method: str
+    :param path: The URI path
+    :type path: str
+    :param data: The data sent with the request (optional, defaults to None)
+    """
+    if not hooks:
+        yield None
+        return
+    event = RequestEvent(method, path, data)
+    for hook in hooks:
+        hook.before_request(event)
+    try:
+        yield event
+    except Exception as e:
+        event.error = e
+        raise
+    finally:
+        event.finish()
+        for hook in hooks:
+            hook.after_request(event)
+
+
+def observe(histograms, key, buckets, value):
+    """
+    Adds a value to a histogram in a dict of [cumulative bucket counts, sum] lists, the last count is the total count
+    :param histograms: The histograms
+    :type histograms: dict
+    :param key: The key of the histogram to add to
+    :param buckets: The upper bounds of the buckets (without +Inf)
+    :type buckets: tuple
+    :param value: The value to add
+    :type value: float
+    """
+    histogram = histograms.get(key)
+    if histogram is None:
+        histogram = histograms[key] = [[0] * (len(buckets) + 1), 0]
+    counts = histogram[0]
+    for index in range(bisect_left(buckets, value), len(counts)):
+        counts[index] += 1
+    histogram[1] += value
+
+
+def format_prometheus_labels(names, values):
+    """
+    Returns a Prometheus label set, e.g. '{route="/v4/organisations",method="GET"}'
+    :param names: The label names
+    :type names: tuple
+    :param values: The label values
+    :type values: tuple
+    """
+    escaped = [str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values]
+    return '{%s}' % ','.join('%s="%s"' % label for label in zip(names, escaped))
+
+
+def format_prometheus_histogram(name, help_text, buckets, histograms):
+    """
+    Returns the lines of a Prometheus histogram with route and method labels
+    :param name: The metric name
+    :type name: str
+    :param help_text: The description of the metric
+    :type help_text: str
+    :param buckets: The upper bounds of the buckets (without +Inf)
+    :type buckets: tuple
+    :param histograms: [cumulative bucket counts, sum] lists keyed by (route, method)
+    :type histograms: dict
+    """
+    lines = ['# HELP %s %s' % (name, help_text), '# TYPE %s histogram' % name]
+    for key in sorted(histograms):
+        counts, total = histograms[key]
+        for bound, count in zip(buckets + ('+Inf',), counts):
+            lines.append('%s_bucket%s %d' % (name, format_prometheus_labels(('route', 'method', 'le'),
+                                                                            key + (bound,)), count))
+        labels = format_prometheus_labels(('route', 'method'), key)
+        lines.append('%s_sum%s %s' % (name, labels, repr(float(total))))
+        lines.append('%s_count%s %d' % (name, labels, counts[-1]))
+    return lines
+
+
+def format_prometheus_counter(name, help_text, label_names, counters):
+    """
+    Returns the lines of a Prometheus counter
+    :param name: The metric name
+    :type name: str
+    :param help_text: The description of the metric
+    :type help_text: str
+    :param label_names: The label names
+    :type label_names: tuple
+    :param counters: Counts keyed by tuples of label values
+    :type counters: dict
+    """
+    lines = ['# HELP %s %s' % (name, help_text), '# TYPE %s counter' % name]
+    for key in sorted(counters):
+        lines.append('%s%s %d' % (name, format_prometheus_labels(label_names, key), counters[key]))
+    return lines
+
+
+def parse_retry_after(value):
+    """
+    Returns the number of seconds to wait from a Retry-After header, which is either a number of seconds or an HTTP
+    date. Returns None if there is no header or it can't be parsed.
+    :param value: The value of the Retry-After header
+    :type value: str
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.now(retry_at.tzinfo)).total_seconds())
+
+
+def get_retry_delay(method, attempt, max_retries, response=None, error=None, rate_limiter=None, event=None):
+    """
+    Decides whether to retry a request after an attempt, returns the number of seconds to wait before retrying or None
+    if the response should be returned (or the error raised) instead. GET requests which failed with a connection
+    error or a 429/5xx status are retried up to max_retries times, waiting for the Retry-After header if the API sent
+    one and a jittered exponential backoff otherwise. A Retry-After longer than RETRY_BACKOFF_MAX isn't waited for, the
+    throttled response is returned instead. POST requests are never retried as they aren't idempotent.
+    :param method: GET | POST
+    :type method: str
+    :param attempt: The number of retries already made
+    :type attempt: int
+    :param max_retries: The maximum number of retries
+    :type max_retries: int
+    :param response: The response to the attempt (optional, defaults to None)
+    :type response: requests.Response
+    :param error: The connection error or timeout raised by the attempt (optional, defaults to None)
+    :type error: requests.RequestException
+    :param rate_limiter: The rate limiter to tell whether the request was throttled (optional, defaults to None)
+    :type rate_limiter: RateLimiter
+    :param event: The RequestEvent to record the response size in (optional, defaults to None)
+    :type event: RequestEvent
+    """
+    can_retry = method == 'GET' and attempt < max_retries
+    if error is not None:
+        return get_retry_backoff(attempt) if can_retry else None
+    if event is not None and response is not None:
+        event.response_size = len(response.content)
+    if response is None or response.status_code not in RETRY_STATUS_CODES:
+        if rate_limiter is not None:
+            rate_limiter.on_success()
+        return None
+    retry_after = parse_retry_after(response.headers.get('Retry-After'))
+    if rate_limiter is not None and response.status_code in THROTTLE_STATUS_CODES:
+        rate_limiter.on_throttle(retry_after)
+    # don't hold the request for a long Retry-After, the caller can decide what to do with the response
+    if not can_retry or (retry_after is not None and retry_after > RETRY_BACKOFF_MAX):
+        return None
+    return retry_after if retry_after is not None else get_retry_backoff(attempt)
+
+
+def check_response_cache(cache, key, event=None):
+    """
+    Looks a GET request up in the cache before it is sent. Returns a tuple (response, cached_response, headers):
+    response is a copy of the cached response if it is still fresh, and should be returned without sending the request.
+    Otherwise it is None and the request should be sent with headers, the conditional headers (If-None-Match and
+    If-Modified-Since) revalidating cached_response, the expired response (or None if nothing was cached).
+    :param cache: The cache
+    :type cache: ResponseCache
+    :param key: The key of the request in the cache
+    :type key: tuple
+    :param event: The RequestEvent to record the cache result in (optional, defaults to None)
+    :type event: RequestEvent
+    """
+    cached = cache.get(key)
+    if cached is None:
+        return None, None, {}
+    cached_response, is_fresh = cached
+    if is_fresh:
+        cache.record('hits')
+        if event is not None:
+            event.cache_result = 'hit'
+        return copy_response(cached_response), cached_response, {}
+    headers = {}
+    if 'ETag' in cached_response.headers:
+        headers['If-None-Match'] = cached_response.headers['ETag']
+    if 'Last-Modified' in cached_response.headers:
+        headers['If-Modified-Since'] = cached_response.headers['Last-Modified']
+    return None, cached_response, headers
+
+
+def update_response_cache(cache, key, ttl, response, cached_response=None, event=None):
+    """
+    Stores the response to a GET request sent after check_response_cache() and returns the response to give the
+    caller: a copy of the cached response if the API answered 304 Not Modified, otherwise the new response (a copy of
+    which is cached if it is a 200)
+    :param cache: The cache
+    :type cache: ResponseCache
+    :param key: The key of the request in the cache
+    :type key: tuple
+    :param ttl: Seconds the response stays fresh for
+    :type ttl: float
+    :param response: The response from the API
+    :type response: requests.Response
+    :param cached_response: The expired response returned by check_response_cache() (optional, defaults to None)
+    :type cached_response: requests.Response
+    :param event: The RequestEvent to record the cache result in (optional, defaults to None)
+    :type event: RequestEvent
+    """
+    if cached_response is not None and response.status_code == 304:
+        cache.record('revalidations')
+        if event is not None:
+            event.cache_result = 'revalidated'
+        cache.set(key, cached_response, ttl)
+        return copy_response(cached_response)
+    cache.record('misses')
+    if event is not None:
+        event.cache_result = 'miss'
+    if response.status_code == 200:
+        cache.set(key, copy_response(response), ttl)
+    return response
+
+
+def is_connect_error(error):
+    """
+    Returns True if a request failed because the connection to the API couldn't be made (it timed out or was refused,
+    or the host couldn't be found), so the request never reached the API and can be retried even if it isn't
+    idempotent. Read timeouts and connections dropped while waiting for the response return False.
+    :param error: The exception raised by the transport
+    :type error: requests.RequestException
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if not isinstance(error, requests.ConnectionError) or not error.args:
+        return False
+    # requests wraps the urllib3 error in a MaxRetryError, the httpx transports wrap the httpx error directly
+    reason = getattr(error.args[0], 'reason', error.args[0])
+    if isinstance(reason, (NewConnectionError, ConnectionRefusedError)):
+        return True
+    return httpx is not None and isinstance(reason, httpx.ConnectError)
+
+
+def get_retry_backoff(attempt):
+    """
+    Returns a random wait before a retry, between 0 and an exponentially increasing limit ("full jitter") so that
+    clients retrying at the same time spread out
+    :param attempt: The number of retries already made
+    :type attempt: int
+    """
+    return random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** attempt))
+
+
+def iter_batches(items, batch_size):
+    """
+    Generator splitting any iterable into lists of at most batch_size items
+    :param items: The items to split
+    :type items: iterable
+    :param batch_size: The maximum number of items in each list
+    :type batch_size: int
+    """
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def get_sku_chunks(skus):
+    """
+    Splits SKUs into the chunks get_reviewables_by_sku() requests. Duplicates are dropped but the order is kept, so the
+    chunks are the same each time for the same list.
+    :param skus: The SKUs
+    :type skus: list
+    """
+    return iter_batches(OrderedDict.fromkeys(skus), MAX_SKUS_PER_REQUEST)
+
+
+def merge_reviewables(pages):
+    """
+    Returns a dict mapping each SKU to its reviewable from the lists of reviewables fetched by get_reviewables_by_sku()
+    :param pages: The lists of reviewables
+    :type pages: iterable
+    """
+    return dict((reviewable['sku'], reviewable) for reviewables in pages for reviewable in reviewables)
+
+
+def get_batch_result(index, customer_order_batch, response=None, error=None):
+    """
+    Returns the BatchResult of submitting a batch of customer orders. The orders are only kept if the batch failed, so
+    that they can be resubmitted.
+    :param index: The index of the batch
+    :type index: int
+    :param customer_order_batch: The customer orders in the batch
+    :type customer_order_batch: list
+    :param response: The response to the submission (optional, defaults to None)
+    :type response: requests.Response
+    :param error: The exception raised by the submission (optional, defaults to None)
+    :type error: Exception
+    """
+    succeeded = error is None and response is not None and response.ok
+    return BatchResult(index, len(customer_order_batch), succeeded, response, error,
+                       None if succeeded else customer_order_batch)
+
+
+def iter_json_chunks(data, chunk_size=65536):
+    """
+    Generator serialising data to JSON as UTF-8 encoded chunks of roughly chunk_size bytes, so that a large request body
+    never has to be held in memory as one string
+    :param data: The data to serialise
+    :type data: dict | list
+    :param chunk_size: The approximate size of each chunk in bytes (optional, defaults to 65536)
+    :type chunk_size: int
+    """
+    buffer = []
+    buffer_size = 0
+    for chunk in json.JSONEncoder().iterencode(data):
+        buffer.append(chunk)
+        buffer_size += len(chunk)
+        if buffer_size >= chunk_size:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+            buffer_size = 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def iter_gzip_chunks(chunks, level=COMPRESS_LEVEL):
+    """
+    Generator gzip compressing a stream of bytes chunk by chunk, so that a request body can be compressed while it is
+    being sent
+    :param chunks: The data to compress
+    :type chunks: iterable
+    :param level: The compression level from 1 (fastest) to 9 (smallest) (optional, defaults to COMPRESS_LEVEL)
+    :type level: int
+    """
+    # wbits=31 writes a gzip header and trailer rather than a raw zlib stream
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+async def aiter_chunks(chunks):
+    """
+    Async generator yielding the chunks of a request body from a normal iterable, as httpx.AsyncClient only streams
+    async iterables
+    :param chunks: The chunks of the body
+    :type chunks: iterable
+    """
+    for chunk in chunks:
+        yield chunk
+
+
+def encode_json_body(data, headers=None, compress=False):
+    """
+    Returns the JSON body of a POST request and its headers, gzipped with a Content-Encoding header if compress is True
+    and the body is at least COMPRESS_MIN_SIZE bytes
+    :param data: The data to serialise
+    :type data: dict | list
+    :param headers: Extra headers to send with the request (optional, defaults to None)
+    :type headers: dict
+    :param compress: Gzip the body (optional, defaults to False)
+    :type compress: bool
+    """
+    body = json.dumps(data)
+    if not compress or len(body) < COMPRESS_MIN_SIZE:
+        return body, headers
+    body = b''.join(iter_gzip_chunks([body.encode('utf-8')]))
+    return body, dict(headers or {}, **{'Content-Encoding': 'gzip'})
+
+
+def atomic_write_json(path, data, separators=None):
+    """
+    Write data to a JSON file by writing a temporary file next to it and moving that into place, so a crash never
+    leaves a half written file
+    :param path: The file to write
+    :type path: str
+    :param data: The data to write, which must be JSON serialisable
+    :param separators: The (item, key) separators passed to json.dump() (optional, defaults to None for the defaults)
+    :type separators: tuple
+    """
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'w') as json_file:
+        json.dump(data, json_file, separators=separators)
+        json_file.flush()
+        os.fsync(json_file.fileno())
+    os.replace(temporary_path, path)
+
+
+def set_json_backend(loads=None):
+    """
+    Sets the function used to decode JSON responses, e.g. set_json_backend(orjson.loads). The function must accept
+    bytes. Passing None goes back to the default, which is orjson if it is installed and the json module if not.
+    :param loads: The JSON decoding function (optional, defaults to None)
+    :type loads: function
+    """
+    global json_loads
+    if loads is None:
+        loads = orjson.loads if orjson is not None else json.loads
+    json_loads = loads
+
+
+def decode_json(content):
+    """
+    Decodes JSON from bytes or a string with the configured backend. The API sometimes sends raw line breaks inside
+    strings, which strict parsers reject. The API's JSON has no other line breaks, so content containing one goes
+    straight to the json module with strict=False rather than being parsed twice, and if the backend fails on anything
+    else the json module is tried the same way.
+    :param content: The JSON to decode
+    :type content: bytes | str
+    """
+    if isinstance(content, str):
+        has_line_break = '\n' in content or '\r' in content
+    else:
+        has_line_break = b'\n' in content or b'\r' in content
+    if has_line_break:
+        return json.loads(content, strict=False)
+    try:
+        return json_loads(content)
+    except ValueError:
+        return json.loads(content, strict=False)
+
+
+def decode_response(response):
+    """
+    Returns the content of a response as a ResponseContent. The response is only decoded the first time, later calls
+    for the same response reuse the same ResponseContent. Responses from the cache or from request coalescing are
+    copies without the ResponseContent, so each caller decodes its own and can change it freely.
+    :param response: The response to decode
+    :type response: requests.Response
+    """
+    content = getattr(response, '_reevoo_content', None)
+    if content is None:
+        content = ResponseContent(decode_json(response.content))
+        response._reevoo_content = content
+    return content
+
+
+def copy_response(response):
+    """
+    Returns a copy of a response for ResponseCache and request coalescing, which give one response to several callers.
+    The body is shared as it can't be changed, but the headers are copied and the decoded content (see
+    decode_response()) is left out, so that one caller changing its response or its content isn't seen by the others.
+    :param response: The response to copy
+    :type response: requests.Response
+    """
+    copied = requests.Response()
+    copied.status_code = response.status_code
+    copied.reason = response.reason
+    copied.headers = CaseInsensitiveDict(response.headers)
+    copied.url = response.url
+    copied.encoding = response.encoding
+    copied.elapsed = response.elapsed
+    copied.request = response.request
+    copied._content = response.content
+    return copied
+
+
+def get_page_content(response):
+    """
+    Returns the decoded content of a page of results as a ResponseContent, raising requests.HTTPError if the request
+    failed
+    :param response: The response for the page
+    :type response: requests.Response
+    """
+    response.raise_for_status()
+    return decode_response(response)
+
+
+def get_date_range_page_order(number_of_pages, start_date=None):
+    """
+    Returns the order the pages of customer experience reviews are walked in when looking for a date range. Pages are
+    walked forwards from page 1 if there is a start date, otherwise backwards from the last page.
+    :param number_of_pages: The total number of pages
+    :type number_of_pages: int
+    :param start_date:
+    :type start_date: datetime
+    """
+    if start_date:
+        return list(range(1, number_of_pages + 1))
+    return list(range(number_of_pages, 0, -1))
+
+
+def sort_date_range_results(list_of_items, start_date=None):
+    """
+    Sorts the results of a date range walk. Results from a backwards walk (no start date) are sorted by publish date,
+    results from a forwards walk are already in page order.
+    :param list_of_items: The items found in the date range
+    :type list_of_items: list
+    :param start_date:
+    :type start_date: datetime
+    """
+    if start_date:
+        return list_of_items
+    return sorted(list_of_items, key=itemgetter('publish_date'))
+
+
+def get_page_date_bounds(list_of_items, date_type):
+    """
+    Returns the oldest and newest dates on a page of results as a tuple of dates. Items without the date are ignored,
+    and an empty page is treated as older than any date.
+    :param list_of_items: The list of items to check the dates for
+    :type list_of_items: list
+    :param date_type: 'publish_date' | 'delivery_date' | 'purchase_date'
+    :type date_type: str
+    """
+    dates = [parse_iso_date(item[date_type]) for item in list_of_items if item.get(date_type)]
+    if not dates:
+        return date.min, date.min
+    return min(dates), max(dates)
+
+
+def bisect_first(low, high, predicate):
+    """
+    Binary searches the integers from low up to (not including) high for the first one where predicate is True,
+    assuming it is False before that one and True after it. Returns high if predicate is never True.
+    :param low: The first integer to search
+    :type low: int
+    :param high: The integer after the last one to search
+    :type high: int
+    :param predicate: Function taking an integer and returning a bool
+    :type predicate: function
+    """
+    while low < high:
+        middle = (low + high) // 2
+        if predicate(middle):
+            high = middle
+        else:
+            low = middle + 1
+    return low
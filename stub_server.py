@@ -0,0 +1,520 @@
+"""
+Local stand-in for the Reevoo API, serving the /v4 routes used by ReevooAPI from a synthetic dataset so the client can
+be tested and benchmarked without API keys. Point a client at it with the base_uri argument:
+
+    with StubReevooServer(review_count=10000, latency=0.01) as server:
+        reevoo = ReevooAPI('key', 'secret', base_uri=server.uri)
+
+Or run it from the command line (python stub_server.py --port 8000 --review-count 10000) and use
+base_uri='http://localhost:8000'.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from base64 import b64encode
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+
+class StubDataset:
+    """
+    Synthetic, deterministic Reevoo data. Items are generated from their index when they are requested, so a dataset
+    of any size takes no memory. Reviews and customer experience reviews are ordered newest first, like the API.
+    """
+
+    def __init__(self, review_count=1000, customer_experience_review_count=1000, sku_count=100, trkrefs=('ABC',),
+                 branch_codes=('', 'B1', 'B2'), locales=('en-GB', 'fr-FR'), newest_date=date(2017, 3, 31),
+                 days=730, seed=0):
+        """
+        :param review_count: The number of published reviews per organisation (optional, defaults to 1000)
+        :type review_count: int
+        :param customer_experience_review_count: The number of customer experience reviews per organisation
+                                                 (optional, defaults to 1000)
+        :type customer_experience_review_count: int
+        :param sku_count: The number of reviewables per organisation (optional, defaults to 100)
+        :type sku_count: int
+        :param trkrefs: The organisations (optional, defaults to ('ABC',))
+        :type trkrefs: tuple
+        :param branch_codes: The branch codes reviews are spread across (optional)
+        :type branch_codes: tuple
+        :param locales: The locales reviews are spread across (optional)
+        :type locales: tuple
+        :param newest_date: The publish date of the newest review (optional, defaults to 2017-03-31)
+        :type newest_date: date
+        :param days: The number of days the reviews are spread over (optional, defaults to 730)
+        :type days: int
+        :param seed: Seed for the generated values (optional, defaults to 0)
+        :type seed: int
+        """
+        self.review_count = review_count
+        self.customer_experience_review_count = customer_experience_review_count
+        self.sku_count = sku_count
+        self.trkrefs = tuple(trkrefs)
+        self.branch_codes = tuple(branch_codes)
+        self.locales = tuple(locales)
+        self.newest_date = newest_date
+        self.days = days
+        self.seed = seed
+
+    def sku(self, index):
+        return 'SKU%05d' % index
+
+    def publish_date(self, index, count):
+        """
+        Returns the publish date of the item at index, spreading count items evenly over the days, newest first
+        """
+        return self.newest_date - timedelta(days=index * self.days // max(count, 1))
+
+    def review(self, trkref, index):
+        """
+        Returns the published review at index (0 is the newest)
+        """
+        generator = random.Random('%s-review-%s-%d' % (self.seed, trkref, index))
+        return {
+            'id': '%s-R%d' % (trkref, index),
+            'sku': self.sku(generator.randrange(self.sku_count)),
+            'locale': self.locales[index % len(self.locales)],
+            'branch_code': self.branch_codes[index % len(self.branch_codes)],
+            'overall_score': generator.randint(1, 10),
+            'publish_date': self.publish_date(index, self.review_count).isoformat(),
+            'helpful': generator.randint(0, 20),
+            'unhelpful': generator.randint(0, 5),
+            'reviewer': {'first_name': generator.choice(['Alex', 'Sam', 'Jo', 'Chris']), 'location': 'London'},
+            'text': {'good_points': 'Good points of review %d' % index, 'bad_points': 'Bad points\r\nof review %d'
+                                                                                      % index},
+        }
+
+    def customer_experience_review(self, trkref, index):
+        """
+        Returns the customer experience review at index (0 is the newest)
+        """
+        generator = random.Random('%s-cx-%s-%d' % (self.seed, trkref, index))
+        publish_date = self.publish_date(index, self.customer_experience_review_count)
+        delivery_date = publish_date - timedelta(days=generator.randint(1, 14))
+        return {
+            'id': '%s-C%d' % (trkref, index),
+            'branch_code': self.branch_codes[index % len(self.branch_codes)],
+            'overall_score': generator.randint(1, 10),
+            'customer_service_score': generator.randint(1, 10),
+            'publish_date': publish_date.isoformat(),
+            'delivery_date': delivery_date.isoformat(),
+            'purchase_date': (delivery_date - timedelta(days=generator.randint(1, 7))).isoformat(),
+            'comment': 'Customer experience review %d' % index,
+        }
+
+    def reviewable(self, trkref, sku_index, short_format=False):
+        """
+        Returns the reviewable for a SKU
+        """
+        generator = random.Random('%s-reviewable-%s-%d' % (self.seed, trkref, sku_index))
+        reviewable = {
+            'sku': self.sku(sku_index),
+            'review_count': generator.randint(0, 500),
+            'average_score': round(generator.uniform(1, 10), 1),
+        }
+        if not short_format:
+            reviewable['name'] = 'Product %d' % sku_index
+            reviewable['locale'] = self.locales[0]
+        return reviewable
+
+    def conversation(self, trkref, index):
+        """
+        Returns the conversation at index
+        """
+        return {
+            'id': '%s-Q%d' % (trkref, index),
+            'sku': self.sku(index % self.sku_count),
+            'locale': self.locales[0],
+            'question': 'Question %d?' % index,
+            'answers': [{'id': '%s-A%d' % (trkref, index), 'answer': 'Answer %d' % index}],
+        }
+
+
+class StubReevooServer:
+    """
+    Local HTTP server implementing the Reevoo API routes used by ReevooAPI on top of a StubDataset, with optional
+    latency, server errors and throttling (429 responses with a Retry-After header). GET responses have an ETag and
+    conditional requests get 304 responses.
+    """
+
+    def __init__(self, dataset=None, host='127.0.0.1', port=0, api_key=None, api_secret=None, latency=0,
+                 error_rate=0, throttle_rate=0, retry_after=1, seed=0, compress_responses=False,
+                 **dataset_options):
+        """
+        :param dataset: The data to serve (optional, defaults to a StubDataset created from dataset_options)
+        :type dataset: StubDataset
+        :param host: The host to listen on (optional, defaults to 127.0.0.1)
+        :type host: str
+        :param port: The port to listen on (optional, defaults to 0 for any free port)
+        :type port: int
+        :param api_key: If set, requests must use this API key and secret or they get a 401 (optional)
+        :type api_key: str
+        :param api_secret:
+        :type api_secret: str
+        :param latency: Seconds added to every request, or a (min, max) tuple for a random latency (optional,
+                        defaults to 0)
+        :type latency: float | tuple
+        :param error_rate: The fraction of requests which get a 500 response (optional, defaults to 0)
+        :type error_rate: float
+        :param throttle_rate: The fraction of requests which get a 429 response (optional, defaults to 0)
+        :type throttle_rate: float
+        :param retry_after: The Retry-After header sent with 429 responses, None to leave it out (optional,
+                            defaults to 1)
+        :type retry_after: float
+        :param seed: Seed for the injected latency and faults (optional, defaults to 0)
+        :type seed: int
+        :param compress_responses: Gzip responses to clients which accept gzip (optional, defaults to False)
+        :type compress_responses: bool
+        """
+        self.dataset = dataset or StubDataset(**dataset_options)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.compress_responses = compress_responses
+        self.authorization = None
+        if api_key is not None:
+            credentials = ('%s:%s' % (api_key, api_secret)).encode('utf-8')
+            self.authorization = 'Basic ' + b64encode(credentials).decode('ascii')
+        self.request_count = 0
+        self.requests_by_status = {}
+        self.received_orders = 0
+        # bytes of request and response bodies as sent over the wire, i.e. after compression
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+        self.__thread = None
+        self.httpd = ThreadingHTTPServer((host, port), self.__make_handler())
+        self.httpd.daemon_threads = True
+
+    @property
+    def uri(self):
+        """
+        The base URI to pass to ReevooAPI
+        """
+        host, port = self.httpd.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        """
+        Start serving in a background thread
+        """
+        self.__thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop serving and close the socket
+        """
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.__thread is not None:
+            self.__thread.join()
+
+    def record(self, status_code, order_count=0, bytes_received=0, bytes_sent=0):
+        with self.__lock:
+            self.request_count += 1
+            self.bytes_received += bytes_received
+            self.bytes_sent += bytes_sent
+            self.requests_by_status[status_code] = self.requests_by_status.get(status_code, 0) + 1
+            self.received_orders += order_count
+
+    def draw_fault(self):
+        """
+        Returns the latency to add and the status code of an injected fault (None for no fault) for one request
+        """
+        with self.__lock:
+            if isinstance(self.latency, (tuple, list)):
+                latency = self.__random.uniform(*self.latency)
+            else:
+                latency = self.latency
+            draw = self.__random.random()
+        if draw < self.throttle_rate:
+            return latency, 429
+        if draw < self.throttle_rate + self.error_rate:
+            return latency, 500
+        return latency, None
+
+    def route(self, method, path, query, body):
+        """
+        Returns the status code and JSON content for a request
+        :param method: GET | POST
+        :type method: str
+        :param path: The URI path without the query string
+        :type path: str
+        :param query: The query string arguments
+        :type query: dict
+        :param body: The decoded JSON body of a POST request, or None
+        """
+        for route_method, pattern, handler in ROUTES:
+            if route_method == method:
+                match = pattern.match(path)
+                if match:
+                    return handler(self, query, body, *[unquote(group) for group in match.groups()])
+        return 404, {'message': 'Not found'}
+
+    def __make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # headers and body are written separately, which otherwise stalls keep-alive connections on delayed ACKs
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                self.handle_request('GET')
+
+            def do_POST(self):
+                self.handle_request('POST')
+
+            def read_body(self):
+                if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+                    chunks = []
+                    while True:
+                        size = int(self.rfile.readline().split(b';')[0], 16)
+                        if size == 0:
+                            self.rfile.readline()
+                            break
+                        chunks.append(self.rfile.read(size))
+                        self.rfile.readline()
+                    return b''.join(chunks)
+                return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+            def handle_request(self, method):
+                url = urlsplit(self.path)
+                raw_body = self.read_body() if method == 'POST' else b''
+                latency, fault = server.draw_fault()
+                if latency:
+                    time.sleep(latency)
+                headers = {}
+                if server.authorization and self.headers.get('Authorization') != server.authorization:
+                    status_code, content = 401, {'message': 'Unauthorized'}
+                elif fault == 429:
+                    status_code, content = 429, {'message': 'Too many requests'}
+                    if server.retry_after is not None:
+                        headers['Retry-After'] = str(server.retry_after)
+                elif fault == 500:
+                    status_code, content = 500, {'message': 'Internal server error'}
+                else:
+                    if self.headers.get('Content-Encoding') == 'gzip':
+                        body = gzip.decompress(raw_body) if raw_body else b''
+                    else:
+                        body = raw_body
+                    body = json.loads(body.decode('utf-8')) if body else None
+                    query = dict((key, values[-1]) for key, values in parse_qs(url.query,
+                                                                                keep_blank_values=True).items())
+                    status_code, content = server.route(method, url.path, query, body)
+                payload = json.dumps(content).encode('utf-8')
+                if method == 'GET' and status_code == 200:
+                    headers['ETag'] = '"%s"' % hashlib.md5(payload).hexdigest()
+                    if self.headers.get('If-None-Match') == headers['ETag']:
+                        status_code, payload = 304, b''
+                order_count = 0
+                if status_code == 202 and isinstance(content, dict):
+                    order_count = content.get('accepted', 0)
+                if server.compress_responses and payload and 'gzip' in self.headers.get('Accept-Encoding', ''):
+                    payload = gzip.compress(payload)
+                    headers['Content-Encoding'] = 'gzip'
+                server.record(status_code, order_count, len(raw_body), len(payload))
+                self.send_response(status_code)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
+
+
+def paginate(query, total_entries, get_item, items_key):
+    """
+    Returns a page of items with the API's pagination summary
+    """
+    page = int(query.get('page') or 1)
+    per_page = int(query.get('per_page') or 15)
+    total_pages = -(-total_entries // per_page)
+    first = (page - 1) * per_page
+    items = [get_item(index) for index in range(first, min(first + per_page, total_entries))]
+    return 200, {
+        'summary': {'pagination': {'page': page, 'per_page': per_page, 'total_pages': total_pages,
+                                   'total_entries': total_entries}},
+        items_key: items,
+    }
+
+
+def organisation_list(server, query, body):
+    return 200, {'organisations': [{'trkref': trkref, 'name': 'Organisation %s' % trkref}
+                                   for trkref in server.dataset.trkrefs]}
+
+
+def organisation_detail(server, query, body, trkref):
+    if trkref not in server.dataset.trkrefs:
+        return 404, {'message': 'Organisation not found'}
+    return 200, {'trkref': trkref, 'name': 'Organisation %s' % trkref, 'branch_code': query.get('branch_code', '')}
+
+
+def reviewable_list(server, query, body, trkref):
+    dataset = server.dataset
+    short_format = query.get('format') == 'short'
+    skus = [sku for sku in query.get('skus', '').split(',') if sku] if not short_format else []
+    if skus:
+        indexes = [int(sku[3:]) for sku in skus if re.match(r'^SKU\d+$', sku) and int(sku[3:]) < dataset.sku_count]
+    else:
+        indexes = range(dataset.sku_count)
+    return 200, {'reviewables': [dataset.reviewable(trkref, index, short_format) for index in indexes]}
+
+
+def reviewable_detail(server, query, body, trkref):
+    sku = query.get('sku', '')
+    if not re.match(r'^SKU\d+$', sku) or int(sku[3:]) >= server.dataset.sku_count:
+        return 404, {'message': 'Reviewable not found'}
+    return 200, server.dataset.reviewable(trkref, int(sku[3:]), query.get('format') == 'short')
+
+
+def review_list(server, query, body, trkref):
+    dataset = server.dataset
+    sku = query.get('sku')
+    if sku:
+        indexes = [index for index in range(dataset.review_count) if dataset.review(trkref, index)['sku'] == sku]
+        return paginate(query, len(indexes), lambda index: dataset.review(trkref, indexes[index]), 'reviews')
+    return paginate(query, dataset.review_count, lambda index: dataset.review(trkref, index), 'reviews')
+
+
+def review_detail(server, query, body, review_id):
+    trkref, _, index = review_id.rpartition('-R')
+    if not index.isdigit() or int(index) >= server.dataset.review_count:
+        return 404, {'message': 'Review not found'}
+    return 200, server.dataset.review(trkref, int(index))
+
+
+def customer_experience_review_list(server, query, body, trkref):
+    dataset = server.dataset
+    return paginate(query, dataset.customer_experience_review_count,
+                    lambda index: dataset.customer_experience_review(trkref, index), 'customer_experience_reviews')
+
+
+def customer_experience_review_detail(server, query, body, review_id):
+    trkref, _, index = review_id.rpartition('-C')
+    if not index.isdigit() or int(index) >= server.dataset.customer_experience_review_count:
+        return 404, {'message': 'Review not found'}
+    return 200, server.dataset.customer_experience_review(trkref, int(index))
+
+
+def conversation_list(server, query, body, trkref):
+    return 200, {'conversations': [server.dataset.conversation(trkref, index) for index in range(10)]}
+
+
+def conversation_detail(server, query, body, conversation_id):
+    trkref, _, index = conversation_id.rpartition('-Q')
+    if not index.isdigit():
+        return 404, {'message': 'Conversation not found'}
+    return 200, server.dataset.conversation(trkref, int(index))
+
+
+def accepted(server, query, body, *args):
+    return 202, {'accepted': 1}
+
+
+def customer_order_batch(server, query, body):
+    return 202, {'accepted': len(body or [])}
+
+
+def purchaser_detail(server, query, body, trkref, email):
+    # purchasers at example.com exist, anyone else gets a 404
+    if not email.endswith('@example.com'):
+        return 404, {'message': 'Purchaser not found'}
+    return 200, {'email': email, 'first_name': email.split('@')[0]}
+
+
+def purchaser_create(server, query, body, trkref):
+    return 201, body or {}
+
+
+def purchaser_update(server, query, body, trkref, email):
+    return 200, dict(body or {}, email=email)
+
+
+def purchaser_list(server, query, body, trkref, email):
+    if not email.endswith('@example.com'):
+        return 404, {'message': 'Purchaser not found'}
+    return 200, {'purchases': [{'order_ref': 'ORDER1', 'sku': server.dataset.sku(0)}]}
+
+
+def purchaser_match(server, query, body, trkref, email):
+    return 200, {'purchases': body or []}
+
+
+def questionnaire_detail(server, query, body, trkref):
+    return 200, {'state': 'pending', 'sku': query.get('sku', '')}
+
+
+ROUTES = [(method, re.compile('^%s$' % pattern), handler) for method, pattern, handler in [
+    ('GET', r'/v4/organisations', organisation_list),
+    ('GET', r'/v4/organisations/([^/]+)', organisation_detail),
+    ('GET', r'/v4/organisations/([^/]+)/reviewables', reviewable_list),
+    ('GET', r'/v4/organisations/([^/]+)/reviewable', reviewable_detail),
+    ('GET', r'/v4/organisations/([^/]+)/reviews', review_list),
+    ('GET', r'/v4/reviews/([^/]+)', review_detail),
+    ('POST', r'/v4/reviews/([^/]+)/increment_(?:un)?helpful', accepted),
+    ('GET', r'/v4/organisations/([^/]+)/customer_experience_reviews', customer_experience_review_list),
+    ('GET', r'/v4/customer_experience_reviews/([^/]+)', customer_experience_review_detail),
+    ('GET', r'/v4/organisations/([^/]+)/conversations', conversation_list),
+    ('POST', r'/v4/organisations/([^/]+)/conversations', accepted),
+    ('GET', r'/v4/conversations/([^/]+)', conversation_detail),
+    ('POST', r'/v4/conversations/([^/]+)/increment_(?:un)?helpful', accepted),
+    ('POST', r'/v4/conversation_answers/([^/]+)/increment_(?:un)?helpful', accepted),
+    ('POST', r'/v4/organisations/([^/]+)/customer_order', accepted),
+    ('POST', r'/v4/customer_orders', customer_order_batch),
+    ('GET', r'/v4/organisations/([^/]+)/purchasers/([^/]+)', purchaser_detail),
+    ('POST', r'/v4/organisations/([^/]+)/purchasers', purchaser_create),
+    ('POST', r'/v4/organisations/([^/]+)/purchasers/([^/]+)', purchaser_update),
+    ('GET', r'/v4/organisations/([^/]+)/purchasers/([^/]+)/purchases', purchaser_list),
+    ('POST', r'/v4/organisations/([^/]+)/purchasers/([^/]+)/purchases/match', purchaser_match),
+    ('GET', r'/v4/organisations/([^/]+)/questionnaire', questionnaire_detail),
+]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local stand-in for the Reevoo API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--review-count', type=int, default=1000)
+    parser.add_argument('--customer-experience-review-count', type=int, default=1000)
+    parser.add_argument('--sku-count', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--throttle-rate', type=float, default=0)
+    parser.add_argument('--compress', action='store_true', help='gzip responses to clients which accept gzip')
+    args = parser.parse_args()
+    server = StubReevooServer(host=args.host, port=args.port, latency=args.latency, error_rate=args.error_rate,
+                              throttle_rate=args.throttle_rate, compress_responses=args.compress,
+                              review_count=args.review_count,
+                              customer_experience_review_count=args.customer_experience_review_count,
+                              sku_count=args.sku_count)
+    print('Serving the stub Reevoo API at %s' % server.uri, flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,19 @@
+import asyncio
 import json
+import os
+import requests
+import tempfile
+import time
 import unittest
 
-from pyreevoo import ReevooAPI
+from concurrent.futures import ThreadPoolExecutor
+
+from pyreevoo import AsyncReevooAPI, AsyncTransport, CustomerExperienceReview, HTTP2Transport, MetricsCollector, \
+    OrganisationScheduler, PurchaserResolver, RETRY_BACKOFF_MAX, RateLimiter, RatingIndex, ReevooAPI, ResponseCache, \
+    ResumableCrawl, ReviewMirror, Transport, VoteDispatcher, decode_json, decode_response, get_items_in_date_range, \
+    httpx, is_connect_error, numpy, reviews_to_columns, set_json_backend
 from os import environ
+from stub_server import StubReevooServer
 
 """
 Test suite for py-reevoo.
@@ -77,6 +88,17 @@ class Test(unittest.TestCase):
                          'test_get_reviewable_list_short_format failed - Response code %d, %s'
                          % (response.status_code, response.reason))
 
+    @unittest.skipUnless(environ.get('SKU'), 'SKU is not set')
+    def test_get_reviewables_by_sku(self):
+        """
+        Test the function that gets reviewables for a list of SKUs longer than a single request allows. Should return a
+        dict containing the SKU.
+        """
+        reevoo = ReevooAPI(environ.get('API_KEY'), environ.get('API_SECRET'))
+        skus = [environ.get('SKU')] + ['MISSING-SKU-%d' % i for i in range(200)]
+        reviewables = reevoo.get_reviewables_by_sku(environ.get('TRKREF'), skus)
+        self.assertIn(environ.get('SKU'), reviewables)
+
     def test_get_reviewable_detail(self):
         """
         Test the function that gets the detailed information for a reviewable (product). Should return status code 200.
@@ -341,3 +363,747 @@ class Test(unittest.TestCase):
                                                                                       start_date='2016-01-01',
                                                                                       end_date='2017-03-31')
         self.assertIsInstance(list_in_date_range, list)
+
+    def test_async_verify_api_keys(self):
+        """
+        Test that the async client verifies the API keys. Should return True if valid API keys are provided.
+        """
+        async def verify():
+            async with AsyncReevooAPI(environ.get('API_KEY'), environ.get('API_SECRET')) as reevoo:
+                return await reevoo.verify_api_keys()
+        self.assertEqual(asyncio.run(verify()), True)
+
+    def test_async_get_review_list(self):
+        """
+        Test the async client gets the list of reviews for a TRKREF. Should return status code 200.
+        """
+        async def get_review_list():
+            async with AsyncReevooAPI(environ.get('API_KEY'), environ.get('API_SECRET')) as reevoo:
+                return await reevoo.get_review_list(environ.get('TRKREF'), environ.get('LOCALE'),
+                                                    sku=environ.get('SKU'))
+        response = asyncio.run(get_review_list())
+        self.assertEqual(response.status_code, 200, 'test_async_get_review_list failed - Response code %d, %s'
+                         % (response.status_code, response.reason))
+
+    def test_get_customer_experience_review_list_in_date_range_bisect(self):
+        """
+        Test the function that gets a list of customer experience reviews from within a date range by binary searching
+        the pages. Should return a list.
+        """
+        reevoo = ReevooAPI(environ.get('API_KEY'), environ.get('API_SECRET'))
+        list_in_date_range = reevoo.get_customer_experience_review_list_in_date_range(environ.get('TRKREF'),
+                                                                                      start_date='2017-03-01',
+                                                                                      end_date='2017-03-07',
+                                                                                      strategy='bisect')
+        self.assertIsInstance(list_in_date_range, list)
+
+    def test_coalesce_requests(self):
+        """
+        Test that identical GET requests made at the same time by several threads all get a response with status code
+        200.
+        """
+        reevoo = ReevooAPI(environ.get('API_KEY'), environ.get('API_SECRET'), coalesce_requests=True)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            responses = list(executor.map(lambda _: reevoo.get_reviewable_detail(environ.get('TRKREF'),
+                                                                                 environ.get('SKU')), range(8)))
+        for response in responses:
+            self.assertEqual(response.status_code, 200, 'test_coalesce_requests failed - Response code %d, %s'
+                             % (response.status_code, response.reason))
+
+    def test_get_items_in_date_range_presorted(self):
+        """
+        Test that filtering a date-ordered list by bisection returns the same items as checking every item, including
+        the reviews on the start and end dates.
+        """
+        reviews = [{'publish_date': '2017-03-%02d' % day} for day in range(31, 0, -1)]
+        checked = get_items_in_date_range(reviews, 'publish_date', '2017-03-10', '2017-03-20')
+        bisected = get_items_in_date_range(reviews, 'publish_date', '2017-03-10', '2017-03-20', presorted=True)
+        self.assertEqual(checked, bisected)
+        self.assertEqual(len(bisected), 11)
+
+    def test_get_items_in_date_range_presorted_missing_dates(self):
+        """
+        Test filtering a date-ordered list by bisection when some items have no date. Should leave those items out.
+        """
+        reviews = [{'publish_date': '2017-03-05'}, {'publish_date': None}, {'publish_date': '2017-03-01'}]
+        self.assertEqual(get_items_in_date_range(reviews, 'publish_date', '2017-03-01', '2017-03-31', presorted=True),
+                         [reviews[0], reviews[2]])
+        self.assertEqual(get_items_in_date_range([{'publish_date': None}], 'publish_date', '2017-03-01',
+                                                 presorted=True), [])
+
+    def test_get_items_in_date_range_open_ended(self):
+        """
+        Test filtering with only a start date. Should return the items on or after the start date.
+        """
+        reviews = [{'publish_date': '2017-03-01'}, {'publish_date': '2017-04-01'}, {'publish_date': None}]
+        self.assertEqual(get_items_in_date_range(reviews, 'publish_date', start_date='2017-03-15'), reviews[1:2])
+
+    def test_get_items_in_date_range_other_key(self):
+        """
+        Test filtering on a date key other than the review and order dates. Should filter on that key.
+        """
+        items = [{'created_at': '2017-03-%02d' % day} for day in range(1, 32)]
+        checked = get_items_in_date_range(items, 'created_at', '2017-03-10', '2017-03-20')
+        self.assertEqual(checked, items[9:20])
+        self.assertEqual(get_items_in_date_range(items, 'created_at', '2017-03-10', '2017-03-20', presorted=True),
+                         checked)
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_reviews_to_columns(self):
+        """
+        Test converting reviews to columns. Scores should be floats, dates datetime64 and SKUs categorical.
+        """
+        reviews = [{'id': '1', 'sku': 'A', 'overall_score': 8, 'publish_date': '2017-03-01'},
+                   {'id': '2', 'sku': 'B', 'overall_score': None, 'publish_date': '2017-03-02'},
+                   {'id': '3', 'sku': 'A', 'overall_score': 6, 'publish_date': None}]
+        columns = reviews_to_columns(reviews)
+        self.assertEqual(columns['overall_score'].dtype, numpy.float64)
+        self.assertEqual(numpy.nanmean(columns['overall_score']), 7)
+        self.assertEqual(str(columns['publish_date'][0]), '2017-03-01')
+        self.assertTrue(numpy.isnat(columns['publish_date'][2]))
+        self.assertEqual(list(columns['sku'].codes), [0, 1, 0])
+        self.assertEqual(list(columns['sku'].categories), ['A', 'B'])
+        self.assertNotIn('delivery_date', columns)
+
+
+class StubServerTest(unittest.TestCase):
+    """
+    Tests against a local StubReevooServer, so they run without API keys
+    """
+
+    def setUp(self):
+        self.server = StubReevooServer(api_key='key', api_secret='secret', review_count=500,
+                                       customer_experience_review_count=500).start()
+        self.reevoo = ReevooAPI('key', 'secret', base_uri=self.server.uri)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_verify_api_keys(self):
+        """
+        Test the stub server checks the credentials. Should accept the configured keys only.
+        """
+        self.assertTrue(self.reevoo.verify_api_keys())
+        self.assertFalse(ReevooAPI('key', 'wrong', base_uri=self.server.uri).verify_api_keys())
+
+    def test_iter_reviews(self):
+        """
+        Test iterating over every review. Should yield every review with one request per page.
+        """
+        reviews = list(self.reevoo.iter_reviews('ABC', 'en-GB', per_page=50))
+        self.assertEqual(len(reviews), 500)
+        self.assertEqual(len(set(review['id'] for review in reviews)), 500)
+        self.assertEqual(self.server.request_count, 10)
+
+    def test_iter_reviews_for_sku(self):
+        """
+        Test iterating over the reviews of one SKU. Should yield exactly the reviews of that SKU across pages.
+        """
+        dataset = self.server.dataset
+        expected = [dataset.review('ABC', index) for index in range(500)
+                    if dataset.review('ABC', index)['sku'] == 'SKU00001']
+        reviews = list(self.reevoo.iter_reviews('ABC', 'en-GB', sku='SKU00001', per_page=1))
+        self.assertGreater(len(expected), 1)
+        self.assertEqual(reviews, expected)
+        self.assertEqual(self.server.request_count, len(expected))
+
+    def test_iter_customer_experience_reviews_stop_early(self):
+        """
+        Test that stopping the customer experience review generator early yields only the reviews that were read.
+        Should fetch no more pages than it read, plus the prefetched one.
+        """
+        dataset = self.server.dataset
+        iterator = self.reevoo.iter_customer_experience_reviews('ABC', older_reviews=True, per_page=15, prefetch=0)
+        first_reviews = [review for _, review in zip(range(5), iterator)]
+        iterator.close()
+        self.assertEqual(first_reviews, [dataset.customer_experience_review('ABC', index) for index in range(5)])
+        self.assertEqual(self.server.request_count, 1)
+        iterator = self.reevoo.iter_customer_experience_reviews('ABC', older_reviews=True, per_page=15)
+        self.assertEqual([review for _, review in zip(range(20), iterator)],
+                         [dataset.customer_experience_review('ABC', index) for index in range(20)])
+        iterator.close()
+        self.assertLessEqual(self.server.request_count, 1 + 3)
+
+    def test_date_range_strategies(self):
+        """
+        Test the linear and bisect date range strategies. Should return the same reviews.
+        """
+        linear = self.reevoo.get_customer_experience_review_list_in_date_range('ABC', start_date='2016-09-01',
+                                                                               end_date='2017-03-31')
+        bisected = self.reevoo.get_customer_experience_review_list_in_date_range('ABC', start_date='2016-09-01',
+                                                                                 end_date='2017-03-31',
+                                                                                 strategy='bisect')
+        self.assertTrue(linear)
+        self.assertEqual(linear, bisected)
+        # pages aren't ordered by purchase date, so bisect falls back to walking them
+        request_count = self.server.request_count
+        linear = self.reevoo.get_customer_experience_review_list_in_date_range('ABC', date_type='purchase_date',
+                                                                               start_date='2016-09-01')
+        linear_requests = self.server.request_count - request_count
+        bisected = self.reevoo.get_customer_experience_review_list_in_date_range('ABC', date_type='purchase_date',
+                                                                                 start_date='2016-09-01',
+                                                                                 strategy='bisect')
+        self.assertEqual(linear, bisected)
+        self.assertEqual(self.server.request_count - request_count, linear_requests * 2)
+        with self.assertRaises(ValueError):
+            self.reevoo.get_customer_experience_review_list_in_date_range('ABC', start_date='2016-09-01',
+                                                                          strategy='binary')
+
+    def test_response_cache(self):
+        """
+        Test that a repeated GET is served from the cache. Should send one request, count one hit and return a response
+        with the same content.
+        """
+        cache = ResponseCache()
+        reevoo = ReevooAPI('key', 'secret', cache=cache, base_uri=self.server.uri)
+        first_response = reevoo.get_reviewable_detail('ABC', 'SKU00001')
+        second_response = reevoo.get_reviewable_detail('ABC', 'SKU00001')
+        self.assertEqual(self.server.request_count, 1)
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(second_response.status_code, 200)
+        self.assertEqual(second_response.json(), self.server.dataset.reviewable('ABC', 1))
+        self.assertEqual(second_response.json(), first_response.json())
+
+    def test_get_customer_experience_review_list_in_date_range_concurrent(self):
+        """
+        Test that fetching pages concurrently returns the same reviews as the sequential walk. Should return every
+        review published in the range.
+        """
+        dataset = self.server.dataset
+        expected = get_items_in_date_range([dataset.customer_experience_review('ABC', index) for index in range(500)],
+                                           'publish_date', '2016-01-01', '2017-03-31')
+        sequential = self.reevoo.get_customer_experience_review_list_in_date_range('ABC', start_date='2016-01-01',
+                                                                                   end_date='2017-03-31')
+        concurrent = self.reevoo.get_customer_experience_review_list_in_date_range('ABC', start_date='2016-01-01',
+                                                                                   end_date='2017-03-31',
+                                                                                   max_workers=4)
+        self.assertEqual(len(sequential), len(expected))
+        self.assertEqual(sorted(review['id'] for review in sequential), sorted(review['id'] for review in expected))
+        self.assertEqual(concurrent, sequential)
+
+    def test_cache_revalidation(self):
+        """
+        Test an expired cache entry is revalidated. Should get a 304 and reuse the cached response.
+        """
+        reevoo = ReevooAPI('key', 'secret', cache=ResponseCache(ttl=0.01), base_uri=self.server.uri)
+        first = reevoo.get_reviewable_list('ABC')
+        time.sleep(0.02)
+        second = reevoo.get_reviewable_list('ABC')
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(self.server.requests_by_status, {200: 1, 304: 1})
+
+    def test_cache_returns_copies(self):
+        """
+        Test changing the content of a cached response. Should not change the content of later cache hits.
+        """
+        reevoo = ReevooAPI('key', 'secret', cache=ResponseCache(), base_uri=self.server.uri)
+        reviewables = reevoo.get_reviewables_by_sku('ABC', ['SKU00001', 'SKU00002'])
+        reviewables['SKU00001']['name'] = 'Changed'
+        del reviewables['SKU00002']
+        response = reevoo.get_reviewable_list('ABC')
+        decode_response(response).reviewables().clear()
+        self.assertEqual(reevoo.get_reviewables_by_sku('ABC', ['SKU00001', 'SKU00002']),
+                         self.reevoo.get_reviewables_by_sku('ABC', ['SKU00001', 'SKU00002']))
+        self.assertTrue(decode_response(reevoo.get_reviewable_list('ABC')).reviewables())
+        self.assertEqual(reevoo.cache.stats()['hits'], 2)
+
+    def test_throttle_retries(self):
+        """
+        Test requests are retried after a 429. Should eventually succeed.
+        """
+        server = StubReevooServer(throttle_rate=0.5, retry_after=0).start()
+        try:
+            reevoo = ReevooAPI('key', 'secret', max_retries=10, base_uri=server.uri)
+            self.assertEqual([reevoo.get_organisation_list().status_code for _ in range(5)], [200] * 5)
+            self.assertIn(429, server.requests_by_status)
+        finally:
+            server.stop()
+
+    def test_set_customer_order_batch_submission_chunked(self):
+        """
+        Test the function that submits customer orders in concurrent batches, with a batch size that splits the orders
+        unevenly. Should submit one batch per chunk and every batch should succeed.
+        """
+        orders = [{'order_ref': 'ORDER-%d' % index, 'email': 'customer%d@example.com' % index} for index in range(7)]
+        results = self.reevoo.set_customer_order_batch_submission_chunked(orders, batch_size=3, max_workers=2)
+        self.assertEqual(len(results), 3)
+        self.assertEqual([result.index for result in results], [0, 1, 2])
+        self.assertEqual([result.size for result in results], [3, 3, 1])
+        for result in results:
+            self.assertTrue(result.succeeded, 'test_set_customer_order_batch_submission_chunked failed - batch %d'
+                            % result.index)
+            self.assertEqual(result.response.json(), {'accepted': result.size})
+            self.assertIsNone(result.customer_orders)
+        self.assertEqual(self.server.request_count, 3)
+        self.assertEqual(self.server.received_orders, 7)
+
+    def test_chunked_batch_submission(self):
+        """
+        Test submitting orders in chunks. Should submit every order.
+        """
+        orders = ({'order_ref': str(index)} for index in range(1234))
+        results = self.reevoo.set_customer_order_batch_submission_chunked(orders, batch_size=100)
+        self.assertEqual(len(results), 13)
+        self.assertTrue(all(result.succeeded for result in results))
+        self.assertEqual(self.server.received_orders, 1234)
+
+    def test_metrics_collector(self):
+        """
+        Test collecting metrics. Should count the requests and cache hits per route template.
+        """
+        metrics = MetricsCollector()
+        reevoo = ReevooAPI('key', 'secret', cache=ResponseCache(), hooks=[metrics], base_uri=self.server.uri)
+        for sku in ['SKU00001', 'SKU00002', 'SKU00001']:
+            reevoo.get_reviewable_detail('ABC', sku)
+        stats = metrics.stats()[('/v4/organisations/{trkref}/reviewable', 'GET')]
+        self.assertEqual(stats['count'], 3)
+        self.assertEqual(stats['statuses'], {'200': 3})
+        self.assertEqual(stats['cache_results'], {'miss': 2, 'hit': 1})
+        self.assertIn('reevoo_api_request_duration_seconds_count{route="/v4/organisations/{trkref}/reviewable",'
+                      'method="GET"} 3', metrics.to_prometheus())
+
+    def test_shared_transport(self):
+        """
+        Test sharing a transport between clients with different credentials. Should authenticate each client with its
+        own credentials over the same connection pool.
+        """
+        with Transport(pool_maxsize=4) as transport:
+            good = ReevooAPI('key', 'secret', base_uri=self.server.uri, transport=transport)
+            bad = ReevooAPI('key', 'wrong', base_uri=self.server.uri, transport=transport)
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                statuses = list(executor.map(lambda client: client.get_organisation_list().status_code,
+                                             [good, bad] * 20))
+            self.assertEqual(statuses, [200, 401] * 20)
+            good.close()
+            self.assertEqual(bad.get_organisation_list().status_code, 401)
+
+    def test_session_credentials(self):
+        """
+        Test sending a request with the client's session. Should be authenticated with a client's own transport, and
+        warn that the session has no credentials with a shared transport.
+        """
+        self.assertEqual(self.reevoo.session.get(self.server.uri + '/v4/organisations').status_code, 200)
+        with Transport() as transport:
+            reevoo = ReevooAPI('key', 'secret', base_uri=self.server.uri, transport=transport)
+            with self.assertWarns(DeprecationWarning):
+                self.assertIs(reevoo.session, transport.session)
+
+    @unittest.skipIf(httpx is None, 'httpx is not installed')
+    def test_http2_transport(self):
+        """
+        Test the HTTP/2 transport against a server which only speaks HTTP/1.1. Should fall back to HTTP/1.1.
+        """
+        with HTTP2Transport() as transport:
+            reevoo = ReevooAPI('key', 'secret', base_uri=self.server.uri, transport=transport)
+            self.assertEqual(sum(1 for _ in reevoo.iter_reviews('ABC', 'en-GB', per_page=100, prefetch=4)), 500)
+            self.assertEqual(ReevooAPI('key', 'wrong', base_uri=self.server.uri,
+                                       transport=transport).get_organisation_list().status_code, 401)
+
+    def test_compression(self):
+        """
+        Test compressed responses and uploads. Should decode gzipped responses and send gzipped batches.
+        """
+        server = StubReevooServer(compress_responses=True).start()
+        try:
+            reevoo = ReevooAPI('key', 'secret', compress_uploads=True, base_uri=server.uri)
+            self.assertEqual(sum(1 for _ in reevoo.iter_reviews('ABC', 'en-GB', per_page=100)), 1000)
+            orders = [{'trkref': 'ABC', 'order_ref': str(index)} for index in range(1000)]
+            self.assertEqual(reevoo.set_customer_order_batch_submission(orders).status_code, 202)
+            results = reevoo.set_customer_order_batch_submission_chunked(orders, batch_size=250)
+            self.assertTrue(all(result.succeeded for result in results))
+            self.assertEqual(server.received_orders, 2000)
+            self.assertLess(server.bytes_received, len(json.dumps(orders)))
+        finally:
+            server.stop()
+
+    def test_resumable_crawl(self):
+        """
+        Test resuming a crawl which failed part way through. Should fetch only the remaining pages and write every
+        review once.
+        """
+        reevoo = ReevooAPI('key', 'secret', base_uri=self.server.uri)
+        get_review_list = reevoo.get_review_list
+
+        def get_review_list_failing_at_page_5(trkref, locale, branch_code, sku, region, page, *args):
+            if page == 5:
+                raise requests.ConnectionError()
+            return get_review_list(trkref, locale, branch_code, sku, region, page, *args)
+
+        output_path = os.path.join(tempfile.mkdtemp(), 'reviews.jsonl')
+        crawl = ResumableCrawl(reevoo, output_path)
+        reevoo.get_review_list = get_review_list_failing_at_page_5
+        self.assertRaises(requests.ConnectionError, crawl.crawl_reviews, 'ABC', 'en-GB', per_page=50)
+        self.assertEqual(crawl.load_checkpoint()['page'], 4)
+        reevoo.get_review_list = get_review_list
+        request_count = self.server.request_count
+        checkpoint = crawl.crawl_reviews('ABC', 'en-GB', per_page=50)
+        self.assertTrue(checkpoint['complete'])
+        self.assertEqual(self.server.request_count - request_count, 6)
+        self.assertEqual([review['id'] for review in crawl.iter_output()], ['ABC-R%d' % index for index in range(500)])
+
+    def test_organisation_scheduler(self):
+        """
+        Test syncing several organisations at once. Should return every item of every kind for every organisation.
+        """
+        server = StubReevooServer(trkrefs=('ABC', 'DEF', 'GHI'), review_count=100,
+                                  customer_experience_review_count=200, sku_count=10).start()
+        try:
+            reevoo = ReevooAPI('key', 'secret', base_uri=server.uri)
+            results = OrganisationScheduler(reevoo, max_workers=4).run(locale='en-GB')
+            self.assertEqual(len(results), 9)
+            for result in results:
+                self.assertIsNone(result.error)
+                expected = {'reviews': 100, 'customer_experience_reviews': 200, 'reviewables': 10}[result.kind]
+                self.assertEqual(len(result.items), expected)
+            self.assertEqual(results[0].items[0]['id'], 'ABC-R0')
+        finally:
+            server.stop()
+
+    def test_vote_dispatcher(self):
+        """
+        Test voting in the background. Should drop duplicate votes and send the rest before close() returns.
+        """
+        dispatcher = VoteDispatcher(self.reevoo, max_workers=2)
+        self.assertTrue(dispatcher.vote('user1', VoteDispatcher.REVIEW, 'ABC-R1', VoteDispatcher.UP, 'ABC'))
+        self.assertFalse(dispatcher.vote('user1', VoteDispatcher.REVIEW, 'ABC-R1', VoteDispatcher.UP, 'ABC'))
+        self.assertTrue(dispatcher.vote('user1', VoteDispatcher.REVIEW, 'ABC-R1', VoteDispatcher.DOWN, 'ABC'))
+        self.assertTrue(dispatcher.vote('user2', VoteDispatcher.ANSWER, 'ABC-A1', VoteDispatcher.UP, 'ABC'))
+        self.assertTrue(dispatcher.close(timeout=10))
+        self.assertEqual(dispatcher.stats()['sent'], 3)
+        self.assertEqual(dispatcher.stats()['duplicates'], 1)
+        self.assertEqual(self.server.requests_by_status, {202: 3})
+
+    def test_vote_dispatcher_retries(self):
+        """
+        Test votes which fail. Should only retry 429/503 responses and connections which couldn't be made, and let a
+        vote which failed be made again.
+        """
+        server = StubReevooServer(error_rate=1).start()
+        try:
+            dispatcher = VoteDispatcher(ReevooAPI('key', 'secret', base_uri=server.uri), max_retries=2)
+            self.assertTrue(dispatcher.vote('user1', VoteDispatcher.REVIEW, 'ABC-R1', VoteDispatcher.UP, 'ABC'))
+            self.assertTrue(dispatcher.flush(timeout=10))
+            # a 500 may come after the vote was counted, so it isn't retried
+            self.assertEqual(server.requests_by_status, {500: 1})
+            server.error_rate, server.throttle_rate, server.retry_after = 0, 1, 0
+            self.assertTrue(dispatcher.vote('user1', VoteDispatcher.REVIEW, 'ABC-R1', VoteDispatcher.UP, 'ABC'))
+            self.assertTrue(dispatcher.close(timeout=10))
+            self.assertEqual(server.requests_by_status, {500: 1, 429: 3})
+            self.assertEqual(dispatcher.stats()['failed'], 2)
+        finally:
+            server.stop()
+        reevoo = ReevooAPI('key', 'secret', base_uri=server.uri, max_retries=0)
+        with self.assertRaises(requests.ConnectionError) as refused:
+            reevoo.get_organisation_list()
+        self.assertTrue(is_connect_error(refused.exception))
+        self.assertTrue(is_connect_error(requests.ConnectTimeout()))
+        self.assertFalse(is_connect_error(requests.ReadTimeout()))
+        self.assertFalse(is_connect_error(requests.ConnectionError('Connection aborted.')))
+
+    def test_purchaser_resolver(self):
+        """
+        Test resolving many purchasers at once. Should cache found and missing purchasers and fetch a purchaser again
+        after it has been updated.
+        """
+        resolver = PurchaserResolver(self.reevoo, negative_ttl=0.01)
+        emails = ['purchaser%d@example.com' % index for index in range(10)] + ['nobody@elsewhere.com']
+        purchasers = resolver.resolve('ABC', emails)
+        self.assertEqual(purchasers['purchaser1@example.com']['email'], 'purchaser1@example.com')
+        self.assertIsNone(purchasers['nobody@elsewhere.com'])
+        self.assertEqual(resolver.resolve('ABC', emails), purchasers)
+        self.assertEqual(self.server.request_count, 11)
+        self.reevoo.set_purchaser_update('ABC', 'purchaser1@example.com', {'first_name': 'Updated'})
+        time.sleep(0.02)
+        resolver.resolve('ABC', emails)
+        # the updated purchaser and the expired missing one are fetched again
+        self.assertEqual(self.server.request_count, 14)
+        self.assertEqual(resolver.stats()['negative_hits'], 1)
+
+    def test_rating_index(self):
+        """
+        Test building the rating index from a sync. Should match the figures computed from the reviews, only fetch new
+        pages when synced again and load the same figures from the saved file.
+        """
+        path = os.path.join(tempfile.mkdtemp(), 'ratings.json')
+        index = RatingIndex(path)
+        self.assertEqual(index.sync(self.reevoo, 'ABC', 'en-GB'), 500)
+        reviews = [review for review in self.reevoo.iter_reviews('ABC', 'en-GB', per_page=100)
+                   if review['sku'] == 'SKU00001']
+        summary = index.get('ABC', 'SKU00001', as_of='2017-03-31')
+        self.assertEqual(summary.count, len(reviews))
+        self.assertAlmostEqual(summary.mean, sum(review['overall_score'] for review in reviews) / len(reviews))
+        self.assertEqual(sum(summary.distribution.values()), len(reviews))
+        self.assertEqual(summary.recent_count, sum(1 for review in reviews if review['publish_date'] > '2017-03-01'))
+        request_count = self.server.request_count
+        self.assertEqual(index.sync(self.reevoo, 'ABC', 'en-GB'), 0)
+        self.assertEqual(self.server.request_count, request_count + 1)
+        index.save()
+        loaded = RatingIndex(path)
+        self.assertEqual(loaded.get('ABC', 'SKU00001', as_of='2017-03-31'), summary)
+        self.assertEqual(len(loaded), 500)
+        # only the IDs of the reviews published on the high-water mark date are kept
+        with open(path) as index_file:
+            review_ids = json.load(index_file)['review_ids']
+        high_water_mark = index.get_high_water_mark('ABC', locale='en-GB')
+        self.assertEqual(sorted(row[1] for row in review_ids),
+                         sorted(str(review['id']) for review in self.reevoo.iter_reviews('ABC', 'en-GB', per_page=100)
+                                if review['publish_date'][:10] == high_water_mark[:10]))
+        self.assertEqual(loaded.sync(self.reevoo, 'ABC', 'en-GB'), 0)
+        self.assertEqual(len(loaded), 500)
+
+    @unittest.skipIf(httpx is None, 'httpx is not installed')
+    def test_async_helpers(self):
+        """
+        Test the helpers built on the API methods with the async client. Should return the same results as ReevooAPI.
+        """
+        skus = ['SKU%05d' % (index % 90) for index in range(120)]
+        orders = [{'trkref': 'ABC', 'order_ref': 'ORDER%d' % index} for index in range(250)]
+
+        async def run_helpers():
+            async with AsyncReevooAPI('key', 'secret', base_uri=self.server.uri) as reevoo:
+                reviewables = await reevoo.get_reviewables_by_sku('ABC', skus)
+                results = await reevoo.set_customer_order_batch_submission_chunked(orders, batch_size=100)
+                bisected = await reevoo.get_customer_experience_review_list_in_date_range(
+                    'ABC', start_date='2016-09-01', end_date='2017-03-31', strategy='bisect')
+                return reviewables, results, bisected
+
+        reviewables, results, bisected = asyncio.run(run_helpers())
+        self.assertEqual(reviewables, self.reevoo.get_reviewables_by_sku('ABC', skus))
+        self.assertEqual([result.size for result in results], [100, 100, 50])
+        self.assertTrue(all(result.succeeded for result in results))
+        self.assertEqual(self.server.received_orders, 250)
+        self.assertEqual(bisected, self.reevoo.get_customer_experience_review_list_in_date_range(
+            'ABC', start_date='2016-09-01', end_date='2017-03-31'))
+        with self.assertRaises(TypeError):
+            with AsyncReevooAPI('key', 'secret', base_uri=self.server.uri):
+                pass
+
+    @unittest.skipIf(httpx is None, 'httpx is not installed')
+    def test_async_shared_transport(self):
+        """
+        Test sharing an AsyncTransport between async clients with different credentials. Should authenticate each
+        client with its own credentials, leave the shared transport open when a client is closed and walk a date range
+        linearly in the same way as ReevooAPI.
+        """
+        async def run_clients():
+            async with AsyncTransport(max_connections=4) as transport:
+                async with AsyncReevooAPI('key', 'secret', base_uri=self.server.uri, transport=transport) as good:
+                    bad = AsyncReevooAPI('key', 'wrong', base_uri=self.server.uri, transport=transport)
+                    statuses = [response.status_code for response in await asyncio.gather(
+                        *[client.get_organisation_list() for client in [good, bad] * 5])]
+                    linear = await good.get_customer_experience_review_list_in_date_range(
+                        'ABC', start_date='2016-09-01', end_date='2017-03-31', max_workers=3)
+                # closing the client doesn't close the shared transport
+                return statuses, linear, (await bad.get_organisation_list()).status_code
+
+        statuses, linear, status_after_close = asyncio.run(run_clients())
+        self.assertEqual(statuses, [200, 401] * 5)
+        self.assertEqual(status_after_close, 401)
+        self.assertTrue(linear)
+        self.assertEqual(linear, self.reevoo.get_customer_experience_review_list_in_date_range(
+            'ABC', start_date='2016-09-01', end_date='2017-03-31'))
+
+    @unittest.skipIf(httpx is None, 'httpx is not installed')
+    def test_async_cache_and_retries(self):
+        """
+        Test the async client goes through the cache, request coalescing and retries. Should make one request for
+        concurrent identical GETs and retry throttled requests.
+        """
+        async def get_reviewable_lists(server, **options):
+            async with AsyncReevooAPI('key', 'secret', base_uri=server.uri, **options) as reevoo:
+                responses = await asyncio.gather(*[reevoo.get_reviewable_list('ABC') for _ in range(10)])
+                return responses + [await reevoo.get_reviewable_list('ABC')]
+
+        responses = asyncio.run(get_reviewable_lists(self.server, cache=ResponseCache(), coalesce_requests=True))
+        self.assertEqual(self.server.request_count, 1)
+        self.assertEqual(len(set(map(id, responses))), len(responses))
+        self.assertTrue(all(response.json() == responses[0].json() for response in responses))
+        with StubReevooServer(api_key='key', api_secret='secret', throttle_rate=0.5, retry_after=0, seed=1) as server:
+            responses = asyncio.run(get_reviewable_lists(server, max_retries=10))
+            self.assertEqual([response.status_code for response in responses], [200] * 11)
+            self.assertGreater(server.requests_by_status.get(429, 0), 0)
+
+    def test_review_mirror_sync_reviews(self):
+        """
+        Test syncing reviews into the mirror after a sync of one SKU. Should store every review, then only fetch the
+        first page when synced again.
+        """
+        mirror = ReviewMirror()
+        sku_reviews = mirror.sync_reviews(self.reevoo, 'ABC', 'en-GB', sku='SKU00001', per_page=100)
+        self.assertGreater(sku_reviews, 0)
+        self.assertEqual(mirror.sync_reviews(self.reevoo, 'ABC', 'en-GB', per_page=100), 500)
+        self.assertEqual(mirror.connection.execute('SELECT COUNT(*) FROM reviews').fetchone()[0], 500)
+        self.assertNotEqual(mirror.get_high_water_mark(ReviewMirror.REVIEW, 'ABC', locale='en-GB'), None)
+        request_count = self.server.request_count
+        mirror.sync_reviews(self.reevoo, 'ABC', 'en-GB', per_page=100)
+        self.assertEqual(self.server.request_count, request_count + 1)
+        self.assertEqual(len(mirror.get_reviews_for_sku('ABC', 'SKU00001', 'en-GB')), sku_reviews)
+
+    def test_rate_limiter(self):
+        """
+        Test making requests through a shared rate limiter, some of which are throttled. Should retry each throttled
+        request once per 429, space the requests out at the limiter's rate and return status code 200 for every request.
+        """
+        rate_limiter = RateLimiter(rate=2)
+        with StubReevooServer(throttle_rate=0.3, retry_after=0, seed=3) as server:
+            reevoo = ReevooAPI('key', 'secret', rate_limiter=rate_limiter, max_retries=10, base_uri=server.uri)
+            started = time.monotonic()
+            self.assertEqual([reevoo.get_organisation_list().status_code for _ in range(4)], [200] * 4)
+            throttled = server.requests_by_status.get(429, 0)
+            self.assertGreater(throttled, 0)
+            self.assertEqual(server.requests_by_status, {200: 4, 429: throttled})
+            # the burst covers the first two requests, then the limiter paces the rest
+            self.assertGreaterEqual(time.monotonic() - started, (4 + throttled - 2) / 2.0 - 0.05)
+
+    def test_review_mirror_sync_customer_experience_reviews(self):
+        """
+        Test syncing customer experience reviews into a local mirror. Should store every review, then only fetch the
+        first page and store the reviews from the high-water mark onwards when synced again.
+        """
+        dataset = self.server.dataset
+        mirror = ReviewMirror()
+        self.assertEqual(mirror.sync_customer_experience_reviews(self.reevoo, 'ABC'), 500)
+        self.assertEqual(self.server.request_count, 17)
+        self.assertEqual(mirror.get_high_water_mark(ReviewMirror.CUSTOMER_EXPERIENCE_REVIEW, 'ABC'), '2017-03-31')
+        # only the newest review was published on the high-water mark date
+        self.assertEqual(mirror.sync_customer_experience_reviews(self.reevoo, 'ABC'), 1)
+        self.assertEqual(self.server.request_count, 18)
+        self.assertEqual(mirror.connection.execute('SELECT COUNT(*) FROM reviews').fetchone()[0], 500)
+        expected = get_items_in_date_range([dataset.customer_experience_review('ABC', index) for index in range(500)],
+                                           'publish_date', '2016-01-01', '2016-12-31')
+        reviews = mirror.get_customer_experience_reviews_in_date_range('ABC', start_date='2016-01-01',
+                                                                       end_date='2016-12-31')
+        self.assertEqual(sorted(reviews, key=lambda review: review['id']),
+                         sorted(expected, key=lambda review: review['id']))
+
+    def test_rate_limiter_throttling(self):
+        """
+        Test the rate limiter paces requests and halves its rate when throttled. Should space the requests out at the
+        limiter's rate and return a 429 straight away when the Retry-After is too long to wait for.
+        """
+        reevoo = ReevooAPI('key', 'secret', rate_limiter=RateLimiter(rate=20, burst=1), base_uri=self.server.uri)
+        started = time.monotonic()
+        for _ in range(6):
+            reevoo.get_organisation_list()
+        # the first request uses the burst, the other five wait 1/20 seconds each
+        self.assertGreaterEqual(time.monotonic() - started, 0.24)
+
+        server = StubReevooServer(throttle_rate=1, retry_after=0).start()
+        try:
+            rate_limiter = RateLimiter(rate=40, burst=1)
+            reevoo = ReevooAPI('key', 'secret', rate_limiter=rate_limiter, max_retries=2, base_uri=server.uri)
+            started = time.monotonic()
+            self.assertEqual(reevoo.get_organisation_list().status_code, 429)
+            # each of the three throttled attempts halved the rate, and the retries waited for the lower rates
+            self.assertEqual(rate_limiter.rate, 5)
+            self.assertEqual(server.request_count, 3)
+            self.assertGreaterEqual(time.monotonic() - started, 1 / 20.0 + 1 / 10.0 - 0.01)
+
+            server.retry_after = 3600
+            started = time.monotonic()
+            self.assertEqual(reevoo.get_organisation_list().status_code, 429)
+            self.assertLess(time.monotonic() - started, 2)
+            self.assertEqual(server.request_count, 4)
+            # the limiter only pauses for the longest wait it allows
+            self.assertLessEqual(rate_limiter.try_acquire(), RETRY_BACKOFF_MAX)
+        finally:
+            server.stop()
+
+    def test_get_reviewables_by_sku_chunks(self):
+        """
+        Test getting reviewables for more SKUs than one request allows, with duplicates and SKUs with no reviewable.
+        Should fetch each unique SKU once in chunks of MAX_SKUS_PER_REQUEST and merge them into one dict.
+        """
+        # 170 unique SKUs, only the first 100 of which exist on the stub server
+        skus = ['SKU%05d' % (index % 170) for index in range(250)] + ['MISSING-SKU']
+        reviewables = self.reevoo.get_reviewables_by_sku('ABC', skus, max_workers=2)
+        self.assertEqual(self.server.request_count, 3)
+        self.assertEqual(reviewables, dict(('SKU%05d' % index, self.server.dataset.reviewable('ABC', index))
+                                           for index in range(100)))
+
+    def test_coalesce_requests_stub(self):
+        """
+        Test identical GET requests made at the same time by several threads. Should send one request and give every
+        thread the same response.
+        """
+        server = StubReevooServer(latency=0.2).start()
+        try:
+            reevoo = ReevooAPI('key', 'secret', coalesce_requests=True, base_uri=server.uri)
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                responses = list(executor.map(lambda _: reevoo.get_reviewable_detail('ABC', 'SKU00001'), range(8)))
+            self.assertEqual(server.request_count, 1)
+            self.assertEqual(len(set(map(id, responses))), len(responses))
+            self.assertTrue(all(response.content == responses[0].content for response in responses))
+            self.assertEqual(responses[0].status_code, 200)
+        finally:
+            server.stop()
+
+    def test_decode_response(self):
+        """
+        Test decoding a list of reviews, whose text contains raw line breaks. Should return the reviews and the
+        pagination details, and decode the response only once.
+        """
+        response = self.reevoo.get_review_list('ABC', 'en-GB', per_page=20)
+        content = decode_response(response)
+        self.assertEqual(content.reviews(), [self.server.dataset.review('ABC', index) for index in range(20)])
+        self.assertEqual(content.reviews()[0]['text']['bad_points'], 'Bad points\r\nof review 0')
+        self.assertEqual(content.pagination(), {'page': 1, 'per_page': 20, 'total_pages': 25, 'total_entries': 500})
+        self.assertEqual(content.total_pages(), 25)
+        self.assertIs(decode_response(response), content)
+
+    def test_iter_customer_experience_reviews_as_records(self):
+        """
+        Test the generator that yields customer experience reviews as records. Records should have the review's fields
+        and convert back to the original dicts.
+        """
+        dataset = self.server.dataset
+        records = list(self.reevoo.iter_customer_experience_reviews('ABC', per_page=30, as_records=True))
+        self.assertEqual(len(records), 500)
+        for index, record in enumerate(records):
+            review = dataset.customer_experience_review('ABC', index)
+            self.assertIsInstance(record, CustomerExperienceReview)
+            self.assertEqual(record.to_dict(), review)
+        self.assertEqual(records[0].id, 'ABC-C0')
+        self.assertEqual(records[0].publish_date, '2017-03-31')
+        self.assertEqual(records[1].overall_score, dataset.customer_experience_review('ABC', 1)['overall_score'])
+        self.assertEqual(records[2]['branch_code'], 'B2')
+
+    def test_decode_json_line_breaks(self):
+        """
+        Test decoding JSON with raw line breaks inside strings. Should decode it once with the json module without
+        trying the backend first, and decode everything else with the backend.
+        """
+        calls = []
+
+        def loads(content):
+            calls.append(content)
+            return json.loads(content)
+
+        set_json_backend(loads)
+        try:
+            self.assertEqual(decode_json(b'{"text": "Good\r\npoints"}'), {'text': 'Good\r\npoints'})
+            self.assertEqual(decode_json('{"text": "Good\npoints"}'), {'text': 'Good\npoints'})
+            self.assertEqual(calls, [])
+            self.assertEqual(decode_json(b'{"text": "Good points"}'), {'text': 'Good points'})
+            self.assertEqual(len(calls), 1)
+        finally:
+            set_json_backend()
+
+    def test_record_missing_fields(self):
+        """
+        Test records made from dicts missing some fields or with nested values in fields. Should behave like the
+        original dict.
+        """
+        item = {'id': 'ABC-C1', 'overall_score': 8, 'branch_code': {'code': 'B1'}, 'text': 'Quick delivery'}
+        record = CustomerExperienceReview.from_dict(item)
+        self.assertEqual(record.to_dict(), item)
+        self.assertEqual(record, CustomerExperienceReview.from_dict(dict(item)))
+        self.assertNotIn('purchase_date', record)
+        self.assertIn('overall_score', record)
+        self.assertEqual(record.get('purchase_date', 'missing'), 'missing')
+        self.assertIsNone(record.purchase_date)
+        with self.assertRaises(KeyError):
+            record['purchase_date']
+        self.assertEqual(record['branch_code'], {'code': 'B1'})
+        self.assertEqual(record.branch_code, {'code': 'B1'})
+        self.assertEqual(record['text'], 'Quick delivery')